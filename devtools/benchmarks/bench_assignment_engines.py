@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the engines of the Assigner that find the nearest Protein Block.
+
+The angles of the chains of the input file are repeated with some noise to
+build a trajectory-sized set of frames. All the engines must give the same
+Protein Blocks.
+
+Usage:
+
+    python devtools/benchmarks/bench_assignment_engines.py [file.pdb] [frames]
+"""
+
+# Standard modules
+import os
+import sys
+import time
+
+# Third-party module
+import numpy
+
+# Local modules
+import pbxplore as pbx
+from pbxplore.assignment import ENGINES
+
+
+here = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_PDB = os.path.join(here, '..', '..', 'pbxplore', 'tests', 'test_data', '2LFU.pdb')
+
+
+def timeit(function, repeats=3):
+    """
+    Give the best run time of `function` and its result.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PDB
+    nb_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    chain = next(pbx.structure.PDB.PDB(source).get_chains())
+    resids, phi, psi = chain.get_phi_psi_arrays()
+
+    # frames fluctuating around the angles of the chain
+    random = numpy.random.RandomState(0)
+    phi = phi + random.normal(0, 20, (nb_frames, len(resids)))
+    psi = psi + random.normal(0, 20, (nb_frames, len(resids)))
+    print("{0}: {1} frames of {2} residues".format(source, nb_frames, len(resids)))
+
+    results = {}
+    for engine in ENGINES:
+        assigner = pbx.Assigner(engine=engine)
+        elapsed, codes = timeit(lambda: assigner.codes(resids, phi, psi))
+        results[engine] = elapsed, codes
+        print("{0:10} {1:8.3f} s  ({2:.1f}x)".format(
+            engine + ':', elapsed, results['exact'][0] / elapsed))
+    for engine, (_, codes) in results.items():
+        assert (codes == results['exact'][1]).all(), engine
+
+
+if __name__ == '__main__':
+    main()
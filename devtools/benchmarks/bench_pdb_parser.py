@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the bulk PDB parser with the line by line reader.
+
+The input file is repeated to build a large multi-model PDB file. Both readers
+must give the same chains.
+
+Usage:
+
+    python devtools/benchmarks/bench_pdb_parser.py [file.pdb] [repeats]
+"""
+
+# Standard modules
+import os
+import sys
+import time
+import tempfile
+
+# Local modules
+import pbxplore as pbx
+from pbxplore.structure.structure import Atom, Chain
+
+
+here = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_PDB = os.path.join(here, '..', '..', 'pbxplore', 'tests', 'test_data', '2LFU.pdb')
+
+
+def read_line_by_line(filename):
+    """
+    Line by line PDB reader, as implemented before the bulk parser.
+    """
+    chains = []
+    chain = Chain()
+    with open(filename, 'rt') as f_in:
+        for line in f_in:
+            flag = line[0:6].strip()
+            if flag == "MODEL":
+                chain.set_model(line.split()[1])
+            if flag == "ATOM":
+                atom = Atom.read_from_PDB(line)
+                if chain.size() != 0 and chain.name != atom.chain:
+                    chains.append(chain)
+                    chain = Chain()
+                chain.add_atom(atom)
+            if chain.size() != 0 and flag in ["TER", "ENDMDL"]:
+                chains.append(chain)
+                chain = Chain()
+    if chain.size() != 0:
+        chains.append(chain)
+    return chains
+
+
+def read_bulk(filename):
+    """
+    Read a PDB file with the bulk parser.
+    """
+    return list(pbx.structure.PDB.PDB(filename).get_chains())
+
+
+def timeit(function, filename, repeats=3):
+    """
+    Give the best run time of `function` and its result.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(filename)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PDB
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    with open(source) as f_in:
+        content = f_in.read()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.pdb', delete=False) as f_out:
+        for _ in range(repeats):
+            f_out.write(content)
+        filename = f_out.name
+    try:
+        size = os.path.getsize(filename) / 1e6
+        print("{0} repeated {1} times: {2:.1f} MB".format(source, repeats, size))
+        legacy_time, legacy = timeit(read_line_by_line, filename)
+        bulk_time, bulk = timeit(read_bulk, filename)
+    finally:
+        os.remove(filename)
+
+    assert [format(chain) for chain in legacy] == [format(chain) for chain in bulk]
+    for ref, chain in zip(legacy, bulk):
+        assert (ref.coords == chain.coords).all()
+    nb_atoms = sum(chain.size() for chain in bulk)
+    print("{0} chains, {1} atoms".format(len(bulk), nb_atoms))
+    print("line by line: {0:8.3f} s".format(legacy_time))
+    print("bulk:         {0:8.3f} s  ({1:.1f}x faster)"
+          .format(bulk_time, legacy_time / bulk_time))
+
+
+if __name__ == '__main__':
+    main()
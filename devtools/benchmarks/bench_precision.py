@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the assignment of frames in single and in double precision.
+
+The coordinates of the first chain of the input file are repeated with some
+noise, and rounded to single precision as in XTC files, to build a
+trajectory. The frames are assigned with float32 and with float64, and the
+Protein Blocks that change are counted.
+
+Usage:
+
+    python devtools/benchmarks/bench_precision.py [file.pdb] [frames] [memory in MB]
+"""
+
+# Standard modules
+import os
+import sys
+import time
+
+# Third-party module
+import numpy
+
+# Local modules
+import pbxplore as pbx
+
+
+here = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_PDB = os.path.join(here, '..', '..', 'pbxplore', 'tests', 'test_data', '2LFU.pdb')
+
+
+def timeit(function, repeats=3):
+    """
+    Give the best run time of `function` and its result.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PDB
+    nb_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    memory = int(float(sys.argv[3]) * 1e6) if len(sys.argv) > 3 else pbx.assignment.DEFAULT_MEMORY
+    chain = next(pbx.structure.PDB.PDB(source).get_chains())
+
+    random = numpy.random.RandomState(0)
+    xyz = numpy.empty((nb_frames, ) + chain.coords.shape, dtype=numpy.float32)
+    for frame in xyz:
+        frame[:] = chain.coords + random.normal(0, 0.5, chain.coords.shape)
+    print("{0}: {1} frames of {2} atoms, {3:.0f} MB of working memory"
+          .format(source, nb_frames, chain.size(), memory / 1e6))
+
+    results = {}
+    for dtype in (numpy.float64, numpy.float32):
+        assigner = pbx.Assigner(dtype=dtype, memory=memory)
+        elapsed, codes = timeit(lambda: assigner.assign_coordinates(xyz, chain))
+        frames = max(1, memory // max(1, codes.shape[1] * assigner._residue_bytes(xyz.dtype)))
+        results[dtype] = codes
+        print("{0:8} {1:8.3f} s  ({2} frames at once)".format(
+            numpy.dtype(dtype).name + ':', elapsed, min(frames, nb_frames)))
+
+    double, single = results[numpy.float64], results[numpy.float32]
+    assigned = double != pbx.assignment.Z_CODE
+    changed = single != double
+    print("{0} of {1} assigned residues ({2:.4%}) change of PB in single precision"
+          .format(changed.sum(), assigned.sum(), changed.sum() / max(1, assigned.sum())))
+    frames = numpy.flatnonzero(changed.any(axis=1))
+    print("{0} of {1} frames have a different PB sequence".format(len(frames), nb_frames))
+
+
+if __name__ == '__main__':
+    main()
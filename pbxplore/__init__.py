@@ -6,23 +6,41 @@
 
    See :func:`pbxplore.structure.chains_from_files`
 
+.. function:: pbxplore.ensembles_from_files(path_list)
+
+   See :func:`pbxplore.structure.ensembles_from_files`
+
 .. function:: pbxplore.chains_from_trajectory(trajectory, topology)
 
    See :func:`pbxplore.structure.chains_from_trajectory`
 
+.. class:: pbxplore.Assigner(pb_ref)
+
+   See :class:`pbxplore.assignment.Assigner`
+
 .. function:: pbxplore.assign(dihedrals)
 
    See :func:`pbxplore.assignment.assign`
+
+.. function:: pbxplore.assign_angles(resids, phi, psi)
+
+   See :func:`pbxplore.assignment.assign_angles`
+
+.. function:: pbxplore.assign_coordinates(xyz, topology)
+
+   See :func:`pbxplore.assignment.assign_coordinates`
 """
 
 __version__ = "1.4.0"
 
 from .structure.loader import *
-from .assignment import assign
+from .assignment import Assigner, assign, assign_angles, assign_coordinates
 from . import PB
 from . import io
 from . import structure
 from . import analysis
+from . import parallel
+from . import kernels
 
 
 def test():
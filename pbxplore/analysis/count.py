@@ -9,6 +9,16 @@ import numpy
 
 # Local module
 from .. import PB
+from .. import kernels
+
+
+# Ways to count the blocks
+COUNT_ENGINES = ('numpy', 'numba')
+# Code of each character of the sequences: the index of the block, the number
+# of blocks for the unassigned residues, and 255 for invalid blocks
+_CODES = numpy.full(256, 255, dtype=numpy.uint8)
+_CODES[[ord(name) for name in PB.NAMES]] = numpy.arange(len(PB.NAMES))
+_CODES[[ord('Z'), ord('z')]] = len(PB.NAMES)
 
 
 def _assert_same_size(sequences):
@@ -31,7 +41,29 @@ def _assert_same_size(sequences):
             raise PB.SizeError
 
 
-def count_matrix(pb_seq):
+def _sequence_codes(pb_seq):
+    """
+    Give the codes of the blocks of sequences of the same length, as an array
+    with a shape of (sequences, positions).
+
+    Raises
+    ------
+    pbxplore.PB.InvalidBlockError
+        encountered an unexpected PB
+    """
+    text = ''.join(pb_seq)
+    try:
+        data = numpy.frombuffer(text.encode('ascii'), dtype=numpy.uint8)
+    except UnicodeEncodeError as error:
+        raise PB.InvalidBlockError(block=text[error.start])
+    codes = _CODES[data]
+    invalid = numpy.flatnonzero(codes == 255)
+    if len(invalid):
+        raise PB.InvalidBlockError(block=text[invalid[0]])
+    return codes.reshape(len(pb_seq), len(pb_seq[0]))
+
+
+def count_matrix(pb_seq, engine=None):
     """
     Count the occurences of each block at each position.
 
@@ -42,6 +74,9 @@ def count_matrix(pb_seq):
     ----------
     pb_seq
         a list of PB sequences.
+    engine : str, optional
+        'numpy' or 'numba' (see :mod:`pbxplore.kernels`) to count the blocks
+        of all the sequences at once; by default, 'numba' if it is installed.
 
     Returns
     -------
@@ -53,15 +88,22 @@ def count_matrix(pb_seq):
     pbxplore.PB.InvalidBlockError
         encountered an unexpected PB
     """
+    if engine is None:
+        engine = 'numba' if kernels.IS_NUMBA else 'numpy'
+    if engine not in COUNT_ENGINES:
+        raise ValueError("Unknown engine: {0}".format(engine))
     _assert_same_size(pb_seq)
-    pb_count = numpy.zeros((len(pb_seq[0]),  len(PB.NAMES)))
-    for seq in pb_seq:
-        for idx, block in enumerate(seq):
-            if block in PB.NAMES:
-                pb_count[idx, PB.NAMES.index(block)] += 1.0
-            elif block not in ["Z", "z"]:
-                raise PB.InvalidBlockError(block=block)
-    return pb_count
+    codes = _sequence_codes(pb_seq)
+    nb_blocks = len(PB.NAMES)
+    if engine == 'numba':
+        pb_count = kernels.count_codes(codes, nb_blocks)
+    else:
+        # one bin per position and code, the Z included
+        positions = numpy.arange(codes.shape[1]) * (nb_blocks + 1)
+        pb_count = numpy.bincount((positions + codes).ravel(),
+                                  minlength=len(positions) * (nb_blocks + 1))
+        pb_count = pb_count.reshape(-1, nb_blocks + 1)[:, :nb_blocks]
+    return pb_count.astype(float)
 
 
 def read_occurence_file(name):
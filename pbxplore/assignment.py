@@ -5,19 +5,566 @@
 Protrein Block assignation --- :mod:`pbxplore.assignment`
 =========================================================
 
+.. autoclass:: Assigner
+   :members:
+
+.. autoclass:: Confidence
+
 .. autofunction:: assign
+
+.. autofunction:: assign_angles
+
+.. autofunction:: assign_codes
+
+.. autofunction:: assign_coordinates
 """
 
 
+# Standard modules
+import collections
 
 # Third-party module
 import numpy
+from numpy.lib.stride_tricks import sliding_window_view
 
-# Local module
+# Local modules
 from . import PB
+from . import kernels
+from .structure.structure import backbone_dihedrals, dihedral_quadruplets
+
+
+# Code of the residues that are not assigned, with the default blocks
+Z_CODE = len(PB.NAMES)
+# Default bound of the memory used to assign Protein Blocks, in bytes
+DEFAULT_MEMORY = 1 << 28
+# Number of arrays of RMSDA values alive at once while computing them
+_RMSDA_TEMPORARIES = 2
+# Number of angles that define a block
+_WINDOW = 8
+# Ways to find the nearest block of each residue
+ENGINES = ('exact', 'embedding', 'numba')
+# Engine used by default: the compiled kernels if numba is installed
+DEFAULT_ENGINE = 'numba' if kernels.IS_NUMBA else 'exact'
+
+
+Confidence = collections.namedtuple('Confidence', ['rmsda', 'second', 'margin'])
+Confidence.__doc__ = """
+How close the residues are to their block and to the next nearest block.
+
+The arrays have the shape of the codes of the residues. The values of the
+residues that are not assigned are NaN, and their second block is the code of
+the residues that are not assigned. With a single block, the second block of
+all the residues is this code, and their margin is infinite.
+
+Attributes
+----------
+rmsda : numpy array
+    The RMSDA of each residue to its block, in degrees.
+second : numpy array of uint8
+    The code of the next nearest block.
+margin : numpy array
+    The RMSDA to the next nearest block minus the RMSDA to the block.
+"""
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+class Assigner:
+    """
+    Assign Protein Blocks with a set of reference blocks prepared once.
+
+    The references are stored as a read-only array, so an assigner can be
+    shared between threads, and sent to worker processes.
+
+    Parameters
+    ----------
+    pb_ref : dict, optional
+        The definition of the blocks: each key is the name of a block, and
+        each value is the list of the 8 dihedral angles that define it. By
+        default, the Protein Blocks.
+    unassigned : str, optional
+        The name given to the residues that are not assigned.
+    dtype : numpy dtype, optional
+        The precision of the computation of the angles from coordinates, and
+        of the RMSDA. Single precision (``numpy.float32``) halves the memory
+        used; a few residues close to two blocks may be assigned the other one.
+    engine : str, optional
+        How the nearest block of each residue is found (see :data:`ENGINES`);
+        by default, :data:`DEFAULT_ENGINE`:
+
+        * 'exact' computes the RMSDA of each residue to all the blocks;
+        * 'embedding' first compares the cosine and sine of the angles to the
+          ones of the blocks with a matrix product, which gives a lower bound
+          of the RMSDA to each block. The exact RMSDA is computed for the
+          nearest block only, and for all the blocks for the residues where
+          the lower bound of another block is not larger. The blocks are the
+          same as with 'exact'.
+        * 'numba' computes the RMSDA as 'exact' with compiled loops over the
+          residues (see :mod:`pbxplore.kernels`); the angles and the blocks of
+          coordinates arrays are computed in the same loop over the frames.
+    memory : int, optional
+        Approximate bound of the memory used to assign arrays, in bytes; the
+        residues and the frames are assigned by groups that fit in it.
+
+    Attributes
+    ----------
+    labels : tuple of str
+        The block names, sorted; the code of a block is its index.
+    z_code : int
+        The code of the residues that are not assigned, after the codes of
+        the blocks.
+    memory : int
+        The bound of the memory used to assign arrays, in bytes.
+
+    Raises
+    ------
+    ValueError
+        If a block is not defined by 8 angles, if there is no block or more
+        than 254 blocks, or if the engine is unknown.
+    ImportError
+        If the engine is 'numba' and numba is not installed.
+    """
+    def __init__(self, pb_ref=PB.REFERENCES, unassigned='Z', dtype=float,
+                 engine=None, memory=DEFAULT_MEMORY):
+        if engine is None:
+            engine = DEFAULT_ENGINE
+        if engine not in ENGINES:
+            raise ValueError("Unknown engine: {0}".format(engine))
+        if engine == 'numba' and not kernels.IS_NUMBA:
+            raise ImportError("numba is required for the numba engine")
+        self.engine = engine
+        self.memory = memory
+        self.labels = tuple(sorted(pb_ref))
+        if not 0 < len(self.labels) < numpy.iinfo(numpy.uint8).max:
+            raise ValueError("Between 1 and 254 blocks must be defined.")
+        self.references = numpy.array([pb_ref[key] for key in self.labels],
+                                      dtype=dtype).reshape(len(self.labels), -1)
+        if self.references.shape[1] != _WINDOW:
+            raise ValueError("A block must be defined by 8 angles.")
+        self.references.setflags(write=False)
+        # cosine and sine of the reference angles
+        radians = numpy.radians(self.references.astype(float))
+        self._embedding = numpy.concatenate([numpy.cos(radians),
+                                             numpy.sin(radians)], axis=1)
+        self._embedding.setflags(write=False)
+        self.unassigned = unassigned
+        self.dtype = self.references.dtype
+        self.z_code = len(self.labels)
+        names = self.labels + (unassigned, )
+        if all(len(name) == 1 for name in names):
+            self._names = numpy.array(names, dtype='S1')
+        else:
+            self._names = None
+        self._all_names = numpy.array(names, dtype=object)
+
+    def __reduce__(self):
+        # An assigner is rebuilt from its blocks, so its references stay
+        # read-only.
+        pb_ref = dict(zip(self.labels, self.references.tolist()))
+        return (self.__class__, (pb_ref, self.unassigned, self.dtype,
+                                 self.engine, self.memory))
+
+    def __repr__(self):
+        return "Assigner of {0} blocks ({1}, {2})".format(
+            len(self.labels), self.dtype.name, self.engine)
+
+    def _residue_bytes(self, dtype=None):
+        """
+        Approximate memory used to assign one residue of one frame, in bytes:
+        the coordinates of its atoms, the temporary arrays of its dihedrals,
+        its window of angles, and its RMSDA to the blocks with their
+        temporaries, all in the precision of the assigner. When the `dtype`
+        of the input coordinates is another one, the coordinates read from
+        the frames are also counted before their conversion.
+        """
+        size = self.dtype.itemsize * (12 + 40 + 12 + _RMSDA_TEMPORARIES
+                                      * self.references.size)
+        if dtype is not None and numpy.dtype(dtype) != self.dtype:
+            size += 12 * numpy.dtype(dtype).itemsize
+        return size
+
+    def codes(self, resids, phi, psi, masked=None, block_values=None,
+              confidence=False):
+        """
+        Assign the blocks to arrays of angles, as compact codes.
+
+        The 8 angles around all the residues are taken at once from the
+        angles arrays, without copying them, and the RMSDA to the blocks are
+        computed for all the residues that can be assigned.
+
+        Parameters
+        ----------
+        resids : numpy array of int
+            The residue numbers, sorted.
+        phi : numpy array
+            Phi angles with a shape of (residues,) or (models, residues);
+            missing angles are NaN.
+        psi : numpy array
+            Psi angles, as for `phi`.
+        masked : numpy array of bool, optional
+            The residues that are not assigned, for all the models as an array
+            with a shape of (residues,), or for each model as an array with
+            the shape of `phi`.
+        block_values : int, optional
+            The number of RMSDA values computed at once, to bound the memory;
+            by default, as many as fit in :attr:`memory`.
+        confidence : bool, optional
+            Also give the RMSDA of the residues to their block and to the next
+            nearest one, found while looking for the block.
+
+        Returns
+        -------
+        codes : numpy array of uint8
+            For each residue, with the shape of `phi`, the index of its block
+            in :attr:`labels`, or :attr:`z_code` if it is not assigned.
+        confidence : Confidence
+            Only with `confidence`: the RMSDA to the block and to the next
+            nearest one, with the shape of `phi`.
+        """
+        resids = numpy.asarray(resids)
+        phi = numpy.asarray(phi, dtype=self.dtype)
+        psi = numpy.asarray(psi, dtype=self.dtype)
+        shape = phi.shape
+        phi = phi.reshape(int(numpy.prod(shape[:-1])), shape[-1])
+        psi = psi.reshape(phi.shape)
+        nb_models, nb_res = phi.shape
+        ref = self.references
+        codes = numpy.full((nb_models, nb_res), self.z_code, dtype=numpy.uint8)
+        details = None
+        if confidence:
+            rmsda = numpy.full((nb_models, nb_res), numpy.nan, dtype=self.dtype)
+            details = Confidence(rmsda, codes.copy(), rmsda.copy())
+        if not nb_res:
+            return _reshape_codes(shape, codes, details)
+
+        # The 8 angles around each residue:
+        # psi(n-2) phi(n-1) psi(n-1) phi(n) psi(n) phi(n+1) psi(n+1) phi(n+2)
+        # are consecutive once the phi and psi angles are interleaved; the
+        # windows start on every other angle. Residues without the 2 residues
+        # before and after them cannot be assigned: the angles are padded with
+        # NaN.
+        angles = numpy.full((nb_models, nb_res + 4, 2), numpy.nan,
+                            dtype=self.dtype)
+        angles[:, 2:-2, 0] = phi
+        angles[:, 2:-2, 1] = psi
+        angles = angles.reshape(nb_models, -1)[:, 1:]
+        window = sliding_window_view(angles, _WINDOW, axis=-1)[:, 0:2 * nb_res:2]
+        assignable = _complete_windows(resids) & ~numpy.any(numpy.isnan(window), axis=-1)
+        if masked is not None:
+            assignable &= ~numpy.asarray(masked, dtype=bool)
+
+        # Only the residues that can be assigned are compared to the blocks,
+        # by groups to bound the size of the RMSDA array.
+        models, residues = numpy.nonzero(assignable)
+        angles = window[models, residues]
+        if block_values is None:
+            block_values = self.memory // (_RMSDA_TEMPORARIES
+                                           * self.dtype.itemsize)
+        step = max(1, block_values // ref.size)
+        nearest = {'exact': self._nearest_exact,
+                   'embedding': self._nearest_embedding,
+                   'numba': self._nearest_numba}[self.engine]
+        # the nearest block, or the 2 nearest ones with their RMSDA
+        count = 2 if confidence else 1
+        for start in range(0, len(angles), step):
+            found = nearest(angles[start:start + step], count)
+            chunk = (models[start:start + step], residues[start:start + step])
+            if not confidence:
+                codes[chunk] = found
+                continue
+            codes[chunk], details.second[chunk] = found[:2]
+            # the RMSDA are sums of squares until there
+            best_rmsda, second_rmsda = [numpy.sqrt(values / _WINDOW)
+                                        for values in found[2:]]
+            details.rmsda[chunk] = best_rmsda
+            details.margin[chunk] = second_rmsda - best_rmsda
+        return _reshape_codes(shape, codes, details)
+
+    def _rmsda(self, angles, references):
+        """
+        Compute the RMSDA between windows of angles and references, with the
+        same shape.
+        """
+        return numpy.sum(((references - angles + 180) % 360 - 180)**2, axis=-1)
+
+    def _nearest(self, rmsda, count):
+        """
+        Give the index of the nearest block of each row of RMSDA, or with a
+        count of 2, the indices of the 2 nearest blocks and their RMSDA.
+        Among equal RMSDA, the block with the lowest index is nearer.
+        """
+        best = numpy.argmin(rmsda, axis=-1)
+        if count == 1:
+            return best
+        rows = numpy.arange(len(rmsda))
+        best_rmsda = rmsda[rows, best]
+        if len(self.labels) == 1:
+            second = numpy.full(len(rmsda), self.z_code)
+            second_rmsda = numpy.full(len(rmsda), numpy.inf)
+        else:
+            rmsda[rows, best] = numpy.inf
+            second = numpy.argmin(rmsda, axis=-1)
+            second_rmsda = rmsda[rows, second]
+        return best, second, best_rmsda, second_rmsda
+
+    def _nearest_exact(self, angles, count=1):
+        """
+        Give the index of the nearest block of each window of angles, or the
+        2 nearest blocks and their RMSDA with a count of 2 (see
+        :meth:`_nearest`).
+        """
+        rmsda = self._rmsda(angles[:, numpy.newaxis, :], self.references)
+        return self._nearest(rmsda, count)
+
+    def _nearest_numba(self, angles, count=1):
+        """
+        Give the nearest blocks of each window of angles, as
+        :meth:`_nearest_exact`, with a compiled loop over the windows.
+        """
+        best, second, best_rmsda, second_rmsda = kernels.nearest_blocks(
+            angles, self.references)
+        if count == 1:
+            return best
+        second[second < 0] = self.z_code
+        return best, second, best_rmsda, second_rmsda
+
+    def _nearest_embedding(self, angles, count=1):
+        """
+        Give the nearest blocks of each window of angles, as
+        :meth:`_nearest_exact`, with the RMSDA to all the blocks computed only
+        for the residues whose nearest blocks are not clear.
+        """
+        # For a difference d in radians, the squared chord between the points
+        # of the angles on the unit circle is 2 - 2 cos(d), and d is
+        # 2 arcsin(chord / 2). The sum of the squared chords to a block is
+        # given by a matrix product. As d**2 is a convex function of the
+        # squared chord, the RMSDA is at least the one of 8 equal chords
+        # with the same sum.
+        radians = numpy.radians(angles.astype(float))
+        embedding = numpy.concatenate([numpy.cos(radians), numpy.sin(radians)],
+                                      axis=1)
+        chords = (2 - 2 * embedding.dot(self._embedding.T) / _WINDOW)
+        lower = _WINDOW * numpy.degrees(
+            2 * numpy.arcsin(numpy.sqrt(numpy.clip(chords, 0, 4)) / 2))**2
+        count = min(count, len(self.labels))
+        if count == 1:
+            candidates = numpy.argmin(lower, axis=-1)[:, numpy.newaxis]
+        else:
+            candidates = numpy.argpartition(lower, 1, axis=-1)[:, :2]
+        rmsda = self._rmsda(angles[:, numpy.newaxis, :],
+                            self.references[candidates])
+        # Any block whose lower bound is not above the RMSDA of the candidates
+        # may be nearer, or as near with a lower index; the margin covers the
+        # rounding errors. The exact RMSDA to these blocks are computed for
+        # the residues that have more of them than the candidates.
+        epsilon = max(numpy.finfo(self.dtype).eps, numpy.finfo(float).eps)
+        bound = numpy.max(rmsda, axis=-1) * (1 + 1e4 * epsilon) + 1e4 * epsilon
+        possible = lower <= bound[:, numpy.newaxis]
+        ambiguous = numpy.flatnonzero(numpy.sum(possible, axis=-1) > count)
+        exact = numpy.full((len(angles), len(self.labels)), numpy.inf,
+                           dtype=self.dtype)
+        exact[numpy.arange(len(angles))[:, numpy.newaxis], candidates] = rmsda
+        rows, blocks = numpy.nonzero(possible[ambiguous])
+        exact[ambiguous[rows], blocks] = self._rmsda(angles[ambiguous[rows]],
+                                                     self.references[blocks])
+        return self._nearest(exact, count)
+
+    def decode(self, codes):
+        """
+        Give the sequences of blocks of an array of codes.
+
+        Parameters
+        ----------
+        codes : numpy array of uint8
+            Codes as given by :meth:`codes`, with a shape of (residues,) or
+            (models, residues).
+
+        Returns
+        -------
+        sequences : str or list of str
+            The sequence of block names of the residues, or of each model.
+        """
+        codes = numpy.asarray(codes)
+        if codes.ndim == 1:
+            return self.decode(codes[numpy.newaxis])[0]
+        if self._names is not None:
+            return [row.tobytes().decode() for row in self._names[codes]]
+        return [''.join(row) for row in self._all_names[codes]]
+
+    def letters(self, codes):
+        """
+        Give the block names of an array of codes as an array of single
+        characters (dtype 'S1').
+
+        Raises
+        ------
+        ValueError
+            If a block name is not a single character.
+        """
+        if self._names is None:
+            raise ValueError("The block names are not single characters.")
+        return self._names[codes]
+
+    def assign(self, dihedrals, masked=None):
+        """
+        Assign the blocks of a chain from its angles, as for :func:`assign`.
+
+        Parameters
+        ----------
+        dihedrals : dict
+            Phi and psi dihedral angles for each residue, as given by
+            :meth:`Chain.get_phi_psi_angles`.
+        masked : set of int, optional
+            Residues that are not assigned.
+
+        Returns
+        -------
+        sequence : str
+            The sequence of blocks.
+        """
+        resids = numpy.array(sorted(dihedrals), dtype=numpy.int64)
+        phi, psi = [numpy.array([numpy.nan if dihedrals[res][key] is None
+                                 else dihedrals[res][key] for res in resids],
+                                dtype=float)
+                    for key in ('phi', 'psi')]
+        if masked:
+            masked = numpy.isin(resids, list(masked))
+        else:
+            masked = None
+        return self.decode(self.codes(resids, phi, psi, masked))
+
+    def assign_angles(self, resids, phi, psi, masked=None):
+        """
+        Assign the blocks of arrays of angles, for many models at once.
+
+        The parameters are the ones of :meth:`codes`.
 
+        Returns
+        -------
+        sequences : list of str
+            The sequence of blocks of each model.
+        """
+        return self.decode(self.codes(resids, numpy.atleast_2d(phi),
+                                      numpy.atleast_2d(psi), masked))
 
-def assign(dihedrals, pb_ref=PB.REFERENCES):
+    def assign_chains(self, chains, masked=None):
+        """
+        Assign the blocks of chains.
+
+        Parameters
+        ----------
+        chains : iterable of Chain
+            The chains.
+        masked : set of int, optional
+            Residues that are not assigned, in all the chains.
+
+        Returns
+        -------
+        sequences : list of str
+            The sequence of blocks of each chain.
+
+        Raises
+        ------
+        FloatingPointError
+            If the angles of a chain cannot be computed.
+        """
+        sequences = []
+        for chain in chains:
+            resids, phi, psi = chain.get_phi_psi_arrays(masked, self.dtype)
+            chain_masked = None
+            if masked:
+                chain_masked = numpy.isin(resids, list(masked))
+            sequences.append(self.decode(self.codes(resids, phi, psi,
+                                                    chain_masked)))
+        return sequences
+
+    def assign_coordinates(self, xyz, topology, memory=None):
+        """
+        Assign the blocks of the frames of a trajectory held in an array,
+        as for :func:`assign_coordinates`. The angles are computed in the
+        precision of the assigner, and by default the frames are assigned by
+        groups that fit in :attr:`memory`.
+
+        Returns
+        -------
+        codes : numpy array of uint8
+            The codes of the blocks, with a shape of (frames, residues).
+        """
+        xyz = numpy.asarray(xyz)
+        if xyz.ndim != 3 or xyz.shape[1:] != (topology.size(), 3):
+            raise ValueError("Coordinates array doesn't have the good shape.")
+        resids, indices = topology._backbone_indices()
+        # Only the coordinates of the backbone atoms are read from the frames.
+        atoms, backbone = numpy.unique(indices, return_inverse=True)
+        backbone = backbone.reshape(indices.shape)
+        if len(atoms) and atoms[0] < 0:
+            atoms = atoms[1:]
+            backbone -= 1
+        backbone[indices < 0] = -1
+
+        if memory is None:
+            memory = self.memory
+        nb_frames = len(xyz)
+        codes = numpy.empty((nb_frames, len(resids)), dtype=numpy.uint8)
+        step = max(1, memory // max(1, len(resids)
+                                    * self._residue_bytes(xyz.dtype)))
+        if self.engine == 'numba':
+            quadruplets = dihedral_quadruplets(resids, backbone)
+            complete = _complete_windows(resids)
+        for start in range(0, nb_frames, step):
+            coords = xyz[start:start + step, atoms]
+            if self.engine == 'numba':
+                codes[start:start + step] = kernels.assign_frames(
+                    coords, quadruplets, complete, self.references, self.z_code)
+                continue
+            with numpy.errstate(invalid='ignore'):
+                (phi, psi), _ = backbone_dihedrals(coords, resids, backbone,
+                                                   self.dtype)
+            codes[start:start + step] = self.codes(
+                resids, phi, psi, block_values=phi.size * self.references.size)
+        return codes
+
+
+# The assigner of the Protein Blocks
+_DEFAULT_ASSIGNER = Assigner()
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def _assigner(pb_ref, dtype=float):
+    """
+    Give the assigner of a set of blocks, in a precision.
+    """
+    if pb_ref is PB.REFERENCES and numpy.dtype(dtype) == _DEFAULT_ASSIGNER.dtype:
+        return _DEFAULT_ASSIGNER
+    return Assigner(pb_ref, dtype=dtype)
+
+
+def _complete_windows(resids):
+    """
+    Tell for each residue if the 2 residues before and after it are in the
+    chain, so its 8 angles can be defined.
+    """
+    complete = numpy.zeros(len(resids), dtype=bool)
+    if len(resids) > 4:
+        # residues are sorted and unique: 4 apart means consecutive
+        complete[2:-2] = resids[4:] - resids[:-4] == 4
+    return complete
+
+
+def _reshape_codes(shape, codes, confidence=None):
+    """
+    Give arrays of codes, and their confidence if any, with a shape.
+    """
+    codes = codes.reshape(shape)
+    if confidence is None:
+        return codes
+    return codes, Confidence(*[values.reshape(shape) for values in confidence])
+
+
+def assign(dihedrals, pb_ref=PB.REFERENCES, masked=None):
     """
     Assign Protein Blocks.
 
@@ -34,44 +581,113 @@ def assign(dihedrals, pb_ref=PB.REFERENCES):
         Phi and psi dihedral angles for each residue.
     pb_ref : dict
         The definition of the protein blocks.
+    masked : set of int, optional
+        Residues that are not assigned; their protein block is Z.
     """
-    pb_seq = ""
-
-    # Transform the dict into a numpy array with the right order
-    ref = numpy.array([pb_ref[key] for key in sorted(pb_ref)])
-
-    # iterate over all residues
-    for res in sorted(dihedrals):
-        angles = []
-        # try to get all eight angles required for PB assignement
-        try:
-            angles.append(dihedrals[res-2]["psi"])
-            angles.append(dihedrals[res-1]["phi"])
-            angles.append(dihedrals[res-1]["psi"])
-            angles.append(dihedrals[res  ]["phi"])
-            angles.append(dihedrals[res  ]["psi"])
-            angles.append(dihedrals[res+1]["phi"])
-            angles.append(dihedrals[res+1]["psi"])
-            angles.append(dihedrals[res+2]["phi"])
-            # check for bad angles
-            # (error while calculating torsion: missing atoms)
-            if None in angles:
-                pb_seq += "Z"
-                continue
+    return _assigner(pb_ref).assign(dihedrals, masked)
 
-        # cannot get required angles (Nter, Cter or missign residues)
-        # -> cannot assign PB
-        # jump to next residue
-        except KeyError:
-            pb_seq += "Z"
-            continue
 
-        # Compute the RMSD between all reference angles and angles of the current residue
-        # (16*8)*(1,8) vectorization
-        # Note (ref - ang + 180) % 360 - 180) ensure the real difference between 2 angles
-        rmsda = numpy.sum(((ref - angles + 180) % 360 - 180)**2, axis=1)
+def assign_angles(resids, phi, psi, pb_ref=PB.REFERENCES, masked=None):
+    """
+    Assign Protein Blocks to arrays of angles, for many models at once.
 
-        # Find the PB with the lowest RMSD
-        pb_seq += PB.NAMES[numpy.argmin(rmsda)]
+    The Protein Blocks are the same as the ones given by :func:`assign` for
+    each model.
 
-    return pb_seq
+    Parameters
+    ----------
+    resids : numpy array of int
+        The residue numbers, sorted.
+    phi : numpy array
+        Phi angles with a shape of (models, residues); missing angles are NaN.
+    psi : numpy array
+        Psi angles, as for `phi`.
+    pb_ref : dict
+        The definition of the protein blocks.
+    masked : numpy array of bool, optional
+        The residues that are not assigned, for all the models as an array
+        with a shape of (residues,), or for each model as an array with the
+        shape of `phi`. Their protein block is Z.
+
+    Returns
+    -------
+    pb_seqs : list of str
+        The sequence of Protein Blocks of each model.
+    """
+    return _assigner(pb_ref).assign_angles(resids, phi, psi, masked)
+
+
+def assign_codes(resids, phi, psi, pb_ref=PB.REFERENCES, masked=None,
+                 block_values=None, confidence=False):
+    """
+    Assign Protein Blocks to arrays of angles, as compact codes.
+
+    See :meth:`Assigner.codes`.
+
+    Returns
+    -------
+    codes : numpy array of uint8
+        For each residue, with the shape of `phi`, the index of its Protein
+        Block in the blocks sorted by name, or the number of blocks
+        (:data:`Z_CODE` for the default blocks) if it is not assigned.
+    confidence : Confidence
+        Only with `confidence`: the RMSDA of each residue to its Protein Block
+        and to the next nearest one.
+    """
+    return _assigner(pb_ref).codes(resids, phi, psi, masked, block_values,
+                                   confidence)
+
+
+def assign_coordinates(xyz, topology, pb_ref=PB.REFERENCES,
+                       memory=DEFAULT_MEMORY, dtype=float):
+    """
+    Assign Protein Blocks to the frames of a trajectory held in an array.
+
+    The angles and the Protein Blocks are computed with arrays for groups of
+    frames, without building any chain. The Protein Blocks are the same as
+    the ones of :func:`assign` for each frame.
+
+    Parameters
+    ----------
+    xyz : numpy array
+        The coordinates of the atoms of the topology, with a shape of
+        (frames, atoms, 3), for instance given by the ``timeseries`` method
+        of an MDAnalysis ``MemoryReader``.
+    topology : Chain
+        The atoms of each frame, for instance read from a PDB file. Only their
+        names and residue numbers are used.
+    pb_ref : dict
+        The definition of the protein blocks. Their names must be single
+        characters.
+    memory : int, optional
+        Approximate bound of the memory used to compute the Protein Blocks,
+        in bytes; the frames are assigned by groups that fit in it.
+    dtype : numpy dtype, optional
+        The precision of the computation of the angles and of the RMSDA.
+        With ``numpy.float32``, twice as many frames fit in the memory, and
+        the coordinates of XTC files, already in single precision, are not
+        converted.
+
+    Returns
+    -------
+    pb_seqs : numpy array
+        The Protein Blocks as single letters (dtype 'S1'), with a shape of
+        (frames, residues). The residues are the ones with a backbone atom
+        in the topology, sorted as in :meth:`Chain.get_phi_psi_arrays`. A
+        residue whose angles cannot be computed is Z.
+
+    Raises
+    ------
+    ValueError
+        If the coordinates do not match the atoms of the topology.
+
+    Examples
+    --------
+    >>> comment, topology = next(pbx.chains_from_files(['model.pdb']))
+    >>> xyz = universe.trajectory.timeseries(order='fac')
+    >>> pb_seqs = pbx.assign_coordinates(xyz, topology)
+    >>> pb_seqs[0].tobytes().decode()
+    'ZZdddfklmmmmmmmmnopacd...'
+    """
+    assigner = _assigner(pb_ref, dtype)
+    return assigner.letters(assigner.assign_coordinates(xyz, topology, memory))
@@ -24,7 +24,9 @@ Results af analyses
 .. autofunction:: write_count_matrix
 
 .. autofunction:: write_neq
+
+.. autofunction:: write_confidence
 """
 
 from .fasta import read_fasta, read_several_fasta, write_fasta, write_fasta_entry
-from .write import write_count_matrix, write_neq
+from .write import write_count_matrix, write_neq, write_confidence
@@ -54,3 +54,40 @@ def write_neq(outfile, neq_array, idx_first_residue=1, residue_min=1, residue_ma
     print("%-6s %8s " % ("resid", "Neq"), file=outfile)
     for (res, neq) in enumerate(neq):
         print("%-6d %8.2f " % (res + residue_min, neq), file=outfile)
+
+
+def write_confidence(outfile, comment, resids, pb_seq, rmsda, second_seq,
+                     margin, header=False):
+    """
+    Write the confidence of the PBs of a sequence in an open file.
+
+    There is one tab separated line per residue, with the comment of the
+    sequence, the residue number, its PB, its RMSDA to the PB, the next
+    nearest PB, and the margin between their RMSDA.
+
+    Parameters
+    ----------
+    outfile : file descriptor
+        The file descriptor to write in. It must allow writing.
+    comment : str
+        The comment of the sequence, as in its fasta entry.
+    resids : numpy array of int
+        The residue numbers.
+    pb_seq : str
+        The PB of each residue.
+    rmsda : numpy array
+        The RMSDA of each residue to its PB, in degrees.
+    second_seq : str
+        The next nearest PB of each residue.
+    margin : numpy array
+        The RMSDA to the next nearest PB minus the RMSDA to the PB.
+    header : bool
+        Write the names of the columns before the lines of the residues.
+    """
+    if header:
+        print("\t".join(("comment", "resid", "PB", "rmsda", "second", "margin")),
+              file=outfile)
+    for res, pb, value, second, gap in zip(resids, pb_seq, rmsda, second_seq,
+                                           margin):
+        print("%s\t%d\t%s\t%.2f\t%s\t%.2f" % (comment, res, pb, value, second, gap),
+              file=outfile)
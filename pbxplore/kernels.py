@@ -0,0 +1,301 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compiled kernels --- :mod:`pbxplore.kernels`
+============================================
+
+Loops of the assignment of Protein Blocks compiled with `numba
+<https://numba.pydata.org/>`_, when it is installed. Each kernel goes once
+over the residues or the frames, in parallel, without the temporary arrays
+of the numpy computation; it gives the same results, with the same
+operations in the same order.
+
+The kernels are used by the 'numba' engine of
+:class:`~pbxplore.assignment.Assigner`, and by
+:func:`~pbxplore.analysis.count_matrix`.
+
+.. autofunction:: nearest_blocks
+
+.. autofunction:: assign_frames
+
+.. autofunction:: count_codes
+"""
+
+# Third-party module
+import numpy
+
+try:
+    import numba
+    IS_NUMBA = True
+except ImportError:
+    IS_NUMBA = False
+
+
+# =============================================================================
+# Data
+# =============================================================================
+if IS_NUMBA:
+    _prange = numba.prange
+else:
+    _prange = range
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def _compile(parallel):
+    """
+    Give a decorator that compiles a function with numba, if it is installed.
+    The compiled code is cached on disk.
+    """
+    def decorator(function):
+        if not IS_NUMBA:
+            return function
+        return numba.njit(parallel=parallel, cache=True)(function)
+    return decorator
+
+
+def _check_numba():
+    """
+    Raise an ImportError if numba is not installed.
+    """
+    if not IS_NUMBA:
+        raise ImportError("numba is required for the compiled kernels")
+
+
+@_compile(parallel=False)
+def _square(reference, angle, half, turn):
+    """
+    Give the squared difference between two angles.
+    """
+    diff = (reference - angle + half) % turn - half
+    return diff * diff
+
+
+@_compile(parallel=False)
+def _rmsda(angles, references, block, half, turn):
+    """
+    Give the sum of the squared differences between 8 angles and a block,
+    summed in the order of numpy.sum.
+    """
+    ref = references[block]
+    return (((_square(ref[0], angles[0], half, turn)
+              + _square(ref[1], angles[1], half, turn))
+             + (_square(ref[2], angles[2], half, turn)
+                + _square(ref[3], angles[3], half, turn)))
+            + ((_square(ref[4], angles[4], half, turn)
+                + _square(ref[5], angles[5], half, turn))
+               + (_square(ref[6], angles[6], half, turn)
+                  + _square(ref[7], angles[7], half, turn))))
+
+
+@_compile(parallel=False)
+def _nearest(angles, references, half, turn):
+    """
+    Give the 2 nearest blocks of 8 angles and their RMSDA; the second block
+    is -1 when there is a single block. Among equal RMSDA, the block with the
+    lowest index is nearer.
+    """
+    best, second = -1, -1
+    best_rmsda, second_rmsda = numpy.inf, numpy.inf
+    for block in range(len(references)):
+        rmsda = _rmsda(angles, references, block, half, turn)
+        if rmsda < best_rmsda:
+            second, second_rmsda = best, best_rmsda
+            best, best_rmsda = block, rmsda
+        elif rmsda < second_rmsda:
+            second, second_rmsda = block, rmsda
+    return best, second, best_rmsda, second_rmsda
+
+
+@_compile(parallel=True)
+def _nearest_blocks(angles, references, half, turn, best, second, best_rmsda,
+                    second_rmsda):
+    for row in _prange(len(angles)):
+        (best[row], second[row],
+         best_rmsda[row], second_rmsda[row]) = _nearest(angles[row], references,
+                                                        half, turn)
+
+
+def nearest_blocks(angles, references):
+    """
+    Find the 2 nearest blocks of windows of 8 angles.
+
+    The RMSDA are the sums of the squared differences of the angles, as in
+    :meth:`Assigner._nearest_exact <pbxplore.assignment.Assigner>`.
+
+    Parameters
+    ----------
+    angles : numpy array
+        The windows of angles, with a shape of (windows, 8).
+    references : numpy array
+        The angles of the blocks, with a shape of (blocks, 8) and the dtype
+        of `angles`.
+
+    Returns
+    -------
+    best : numpy array of int
+        The index of the nearest block of each window.
+    second : numpy array of int
+        The index of the next nearest block, -1 with a single block.
+    best_rmsda : numpy array
+        The RMSDA to the nearest block.
+    second_rmsda : numpy array
+        The RMSDA to the next nearest block, infinite with a single block.
+
+    Raises
+    ------
+    ImportError
+        If numba is not installed.
+    """
+    _check_numba()
+    dtype = references.dtype
+    angles = numpy.ascontiguousarray(angles, dtype=dtype)
+    best = numpy.empty(len(angles), dtype=numpy.intp)
+    second = numpy.empty(len(angles), dtype=numpy.intp)
+    best_rmsda = numpy.empty(len(angles), dtype=dtype)
+    second_rmsda = numpy.empty(len(angles), dtype=dtype)
+    _nearest_blocks(angles, references, dtype.type(180), dtype.type(360),
+                    best, second, best_rmsda, second_rmsda)
+    return best, second, best_rmsda, second_rmsda
+
+
+@_compile(parallel=False)
+def _cross(a0, a1, a2, b0, b1, b2):
+    """
+    Give the cross product of 2 vectors, as numpy.cross.
+    """
+    return a1 * b2 - a2 * b1, a2 * b0 - a0 * b2, a0 * b1 - a1 * b0
+
+
+@_compile(parallel=False)
+def _dihedral(coords, atoms):
+    """
+    Compute a dihedral angle in degrees as :func:`get_dihedrals`, from the
+    coordinates of a frame and the index of its 4 atoms.
+    """
+    A, B, C, D = coords[atoms[0]], coords[atoms[1]], coords[atoms[2]], coords[atoms[3]]
+    AB0, AB1, AB2 = B[0] - A[0], B[1] - A[1], B[2] - A[2]
+    BC0, BC1, BC2 = C[0] - B[0], C[1] - B[1], C[2] - B[2]
+    CD0, CD1, CD2 = D[0] - C[0], D[1] - C[1], D[2] - C[2]
+    n10, n11, n12 = _cross(AB0, AB1, AB2, BC0, BC1, BC2)
+    n20, n21, n22 = _cross(BC0, BC1, BC2, CD0, CD1, CD2)
+    # the angle is undefined when A, B and C or B, C and D are on a line
+    if (n10 * n10 + n11 * n11 + n12 * n12 == 0
+            or n20 * n20 + n21 * n21 + n22 * n22 == 0):
+        return numpy.nan
+    norm_BC = numpy.sqrt(BC0 * BC0 + BC1 * BC1 + BC2 * BC2)
+    x = (n10 * n20 + n11 * n21 + n12 * n22) * norm_BC
+    m0, m1, m2 = _cross(n10, n11, n12, BC0, BC1, BC2)
+    y = m0 * n20 + m1 * n21 + m2 * n22
+    return -numpy.degrees(numpy.arctan2(y, x))
+
+
+@_compile(parallel=True)
+def _assign_frames(coords, quadruplets, complete, references, half, turn,
+                   z_code, codes):
+    nb_res = quadruplets.shape[2]
+    for frame in _prange(len(coords)):
+        # phi and psi angles of the frame
+        angles = numpy.full((2, nb_res), numpy.nan, dtype=coords.dtype)
+        for kind in range(2):
+            for res in range(nb_res):
+                atoms = quadruplets[kind, :, res]
+                if numpy.all(atoms >= 0):
+                    angles[kind, res] = _dihedral(coords[frame], atoms)
+        # blocks of the residues with 8 angles
+        window = numpy.empty(8, dtype=coords.dtype)
+        for res in range(nb_res):
+            codes[frame, res] = z_code
+            if not complete[res]:
+                continue
+            for k in range(4):
+                window[2 * k] = angles[1, res - 2 + k]
+                window[2 * k + 1] = angles[0, res - 1 + k]
+            if numpy.any(numpy.isnan(window)):
+                continue
+            codes[frame, res] = _nearest(window, references, half, turn)[0]
+
+
+def assign_frames(coords, quadruplets, complete, references, z_code):
+    """
+    Assign the blocks of frames from their coordinates, in one pass.
+
+    The phi and psi angles of each frame are computed as with
+    :func:`~pbxplore.structure.structure.backbone_dihedrals`, and the residues
+    are assigned as with :meth:`Assigner.codes
+    <pbxplore.assignment.Assigner.codes>`, frame by frame in parallel.
+
+    Parameters
+    ----------
+    coords : numpy array
+        The coordinates of the atoms, with a shape of (frames, atoms, 3) and
+        the dtype of `references`.
+    quadruplets : numpy array of int
+        The index of the atoms of the phi and psi angles of each residue, as
+        given by :func:`~pbxplore.structure.structure.dihedral_quadruplets`.
+    complete : numpy array of bool
+        For each residue, True if the 2 residues before and after it are in
+        the chain.
+    references : numpy array
+        The angles of the blocks, with a shape of (blocks, 8).
+    z_code : int
+        The code of the residues that are not assigned.
+
+    Returns
+    -------
+    codes : numpy array of uint8
+        The codes of the blocks, with a shape of (frames, residues).
+
+    Raises
+    ------
+    ImportError
+        If numba is not installed.
+    """
+    _check_numba()
+    dtype = references.dtype
+    coords = numpy.ascontiguousarray(coords, dtype=dtype)
+    codes = numpy.empty((len(coords), quadruplets.shape[2]), dtype=numpy.uint8)
+    _assign_frames(coords, quadruplets, complete, references, dtype.type(180),
+                   dtype.type(360), z_code, codes)
+    return codes
+
+
+@_compile(parallel=True)
+def _count_codes(codes, counts):
+    nb_blocks = counts.shape[1]
+    for position in _prange(codes.shape[1]):
+        for row in range(codes.shape[0]):
+            code = codes[row, position]
+            if code < nb_blocks:
+                counts[position, code] += 1
+
+
+def count_codes(codes, nb_blocks):
+    """
+    Count the occurences of each block at each position of arrays of codes.
+
+    Parameters
+    ----------
+    codes : numpy array of uint8
+        The codes of the blocks of sequences, with a shape of
+        (sequences, positions). The codes from `nb_blocks` are not counted.
+    nb_blocks : int
+        The number of blocks.
+
+    Returns
+    -------
+    counts : numpy array of int
+        The occurence matrix, with a shape of (positions, blocks).
+
+    Raises
+    ------
+    ImportError
+        If numba is not installed.
+    """
+    _check_numba()
+    codes = numpy.ascontiguousarray(codes, dtype=numpy.uint8)
+    counts = numpy.zeros((codes.shape[1], nb_blocks), dtype=numpy.int64)
+    _count_codes(codes, counts)
+    return counts
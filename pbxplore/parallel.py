@@ -0,0 +1,165 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Parallel assignment of large files --- :mod:`pbxplore.parallel`
+================================================================
+
+A large multi-model file is first indexed (see
+:class:`~pbxplore.structure.index.StructureIndex`). The index is then split
+in groups of whole models of about the same size, and a pool of processes
+reads and assigns each group. The sequences are given in the order of the
+file.
+
+.. autofunction:: assign_files
+"""
+
+# Standard modules
+import sys
+import multiprocessing
+
+# Local modules
+from .assignment import Assigner
+from .structure.PDB import PDB, PDB_EXTENSIONS, PDBx_EXTENSIONS
+from .structure.index import StructureIndex
+from .structure.archive import is_archive
+from .structure.loader import chains_from_files, STDIN, _comment
+
+
+# =============================================================================
+# Data
+# =============================================================================
+# Number of groups of models given to each process
+PARTS_PER_PROCESS = 4
+
+# The worker processes are started from a new interpreter: a process forked
+# after the threads of the numba kernels have run hangs at exit
+_CONTEXT = multiprocessing.get_context('spawn')
+
+# Confidence threshold and assigner of the current worker process
+_worker_min_confidence = None
+_worker_assigner = None
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def can_split(filename):
+    """
+    Tell if a file can be split in groups of models.
+
+    PDB and PDBx/mmCIF files can be split; BinaryCIF files, archives and the
+    standard input cannot.
+    """
+    return (filename != STDIN and not is_archive(filename)
+            and filename.endswith(PDB_EXTENSIONS + PDBx_EXTENSIONS))
+
+
+def _assign_chain(chain, assigner, min_confidence=None):
+    """
+    Assign the PBs of a chain; None if its angles cannot be computed.
+    """
+    masked = None
+    if min_confidence is not None:
+        masked = chain.low_confidence_residues(min_confidence)
+    try:
+        return assigner.assign(chain.get_phi_psi_angles(masked), masked=masked)
+    except FloatingPointError:
+        return None
+
+
+def _init_worker(min_confidence, assigner):
+    """
+    Keep the confidence threshold and the assigner in the worker process.
+    """
+    global _worker_min_confidence, _worker_assigner
+    _worker_min_confidence = min_confidence
+    _worker_assigner = assigner
+
+
+def _assign_part(part):
+    """
+    Read and assign a group of entries of the index of a file, in a worker
+    process.
+    """
+    pdb, entries = part
+    return [(_comment(pdb.filename, chain),
+             _assign_chain(chain, _worker_assigner, _worker_min_confidence))
+            for chain in pdb.read_entries(entries)]
+
+
+def assign_files(path_list, selection=None, processes=None, index=False,
+                 stdin_format=None, min_confidence=None, engine=None):
+    """
+    Assign the PBs of the chains of files, with several processes per file.
+
+    Parameters
+    ----------
+    path_list : list of str
+        Paths to the files to read, as for :func:`chains_from_files`. The
+        files that cannot be split in groups of models (BinaryCIF files,
+        archives and the standard input) are read and assigned in the
+        current process.
+    selection : Selection, optional
+        The atoms to read. By default, all the atoms are read.
+    processes : int, optional
+        The number of processes. By default, the number of CPUs.
+    index : bool, optional
+        If True, the index saved next to each file is used, and saved if
+        needed. Otherwise, each file is indexed again and the index is not
+        saved.
+    stdin_format : str, optional
+        The extension of the format of the standard input, as for
+        :func:`chains_from_files`.
+    min_confidence : float, optional
+        The residues whose confidence is below this threshold are assigned
+        Z (see :meth:`Chain.low_confidence_residues`).
+    engine : str, optional
+        The engine of the :class:`~pbxplore.assignment.Assigner` of the
+        processes.
+
+    Yields
+    ------
+    comment : str
+        The description of the chain, as given by :func:`chains_from_files`.
+    sequence : str or None
+        The PB sequence of the chain, or None if its angles could not be
+        computed. This typically means there are issues with some residues
+        coordinates.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    assigner = Assigner(engine=engine)
+    # The pool is started for the first file that can be split, and used for
+    # all the files.
+    pool = None
+    try:
+        for pdb_name in path_list:
+            if not can_split(pdb_name):
+                for comment, chain in chains_from_files(
+                        [pdb_name], selection, index=index,
+                        stdin_format=stdin_format):
+                    yield comment, _assign_chain(chain, assigner, min_confidence)
+                continue
+            pdb = PDB(pdb_name, selection, index=index)
+            if index:
+                structure_index = pdb.get_index()
+            else:
+                structure_index = StructureIndex.build(pdb_name)
+                pdb = PDB(pdb_name, selection, index=structure_index)
+            parts = structure_index.partition(structure_index.select(selection),
+                                              processes * PARTS_PER_PROCESS)
+            if pool is None:
+                pool = _CONTEXT.Pool(processes, _init_worker,
+                                     (min_confidence, assigner))
+            nb_chains = 0
+            for results in pool.imap(_assign_part,
+                                     [(pdb, part) for part in parts]):
+                for comment, sequence in results:
+                    nb_chains += 1
+                    yield comment, sequence
+            print("Read {0} chain(s) in {1}".format(nb_chains, pdb_name),
+                  file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.terminate()
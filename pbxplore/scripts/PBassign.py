@@ -15,11 +15,27 @@ import os
 import sys
 import glob
 import argparse
+import tempfile
+import itertools
+import contextlib
+
+# Third-party module
+import numpy
 
 # Local modules
 import pbxplore as pbx
 
 
+# Output name that stands for the standard output
+STDOUT = '-'
+
+# Formats of the standard input, and their extension
+STDIN_FORMATS = {'pdb': '.pdb', 'cif': '.cif', 'bcif': '.bcif'}
+
+# Assigner of the Protein Blocks, with the default engine
+ASSIGNER = pbx.Assigner()
+
+
 # Python2/Python3 compatibility
 # The range function in python 3 behaves as the range function in python 2
 # and returns a generator rather than a list. To produce a list in python 3,
@@ -42,10 +58,64 @@ def user_inputs():
 
     # arguments
     parser.add_argument("-p", action="append",
-                        help=("name of a pdb file "
-                              "or name of a directory containing pdb files"))
+                        help=("name of a pdb file, "
+                              "name of a tar or zip archive of pdb files, "
+                              "name of a directory containing pdb files, "
+                              "or - to read a pdb file from the standard input"))
     parser.add_argument("-o", action="store", required=True,
-                        help="name for results")
+                        help=("name for results, "
+                              "or - to write them on the standard output"))
+    parser.add_argument("--format", action="store",
+                        choices=sorted(STDIN_FORMATS),
+                        help=("format of the file read from the standard "
+                              "input (-p -); guessed by default"))
+    # arguments to select atoms while reading PDB files
+    group = parser.add_argument_group(
+        title='options to select atoms in PDB files (with option -p)')
+    group.add_argument("--chains", action="store",
+                       help="comma separated names of the chains to read")
+    group.add_argument("--models", action="store",
+                       help=("models to read, as comma separated numbers "
+                             "or ranges (for instance 1-10,15)"))
+    group.add_argument("--backbone", action="store_true",
+                       help=("only read the backbone atoms; "
+                             "this does not change the PBs"))
+    group.add_argument("--index", action="store_true",
+                       help=("read the selected chains and models from an "
+                             "index of each file, saved next to the file"))
+    parser.add_argument("--cache", action="store", metavar='DIRECTORY',
+                        help=("directory where to keep the backbone and the "
+                              "angles of the chains read from pdb files, or "
+                              "the backbone atoms of the topology of "
+                              "trajectories, so they are not read again on "
+                              "the next runs"))
+    parser.add_argument("--ensemble", action="store_true",
+                        help=("assign the models of each chain of a pdb file "
+                              "all at once, as an ensemble of stacked "
+                              "coordinates; sequences are written chain by "
+                              "chain (not compatible with --cache)"))
+    parser.add_argument("--min-confidence", action="store", type=float,
+                        metavar='VALUE',
+                        help=("assign Z to the residues whose B-factor, or "
+                              "pLDDT for predicted models, is below VALUE "
+                              "for their CA atom (with option -p)"))
+    parser.add_argument("--confidence", action="store_true",
+                        help=("also write, for each residue, the RMSDA to its "
+                              "PB, the next nearest PB and the margin between "
+                              "their RMSDA in a .PB.confidence file (not "
+                              "compatible with -o - nor --processes)"))
+    parser.add_argument("--engine", action="store",
+                        choices=pbx.assignment.ENGINES,
+                        help=("how the PBs are found: exact computes the RMSDA "
+                              "to all the PBs, embedding only to the PBs that "
+                              "may be the nearest, numba with compiled loops "
+                              "(requires numba); all give the same PBs; numba "
+                              "by default if it is installed, exact otherwise"))
+    parser.add_argument("--processes", action="store", type=int, metavar='N',
+                        help=("read and assign large pdb files with N "
+                              "processes, each one reading a part of the "
+                              "models of the file (not compatible with "
+                              "--cache nor --ensemble)"))
     # arguments for MDanalysis
     group = parser.add_argument_group(
         title='other options to handle molecular dynamics trajectories')
@@ -53,6 +123,13 @@ def user_inputs():
                        help="name of the trajectory file")
     group.add_argument("-g", action="store", metavar='TOPOLOGY',
                        help="name of the topology file")
+    group.add_argument("--split", action="store", choices=('segid', 'chainID'),
+                       help=("assign one PB sequence per segment or per chain "
+                             "of the topology (with option -x)"))
+    group.add_argument("--chain-selection", action="append", metavar='SELECTION',
+                       help=("assign one PB sequence for the backbone atoms of "
+                             "a MDAnalysis selection; can be repeated "
+                             "(with option -x, not compatible with --split)"))
 
     parser.add_argument('-v', '--version', action='version',
                         version='%(prog)s {}'.format(pbx.__version__))
@@ -67,17 +144,67 @@ def user_inputs():
         elif not options.g:
             parser.print_help()
             parser.error("option -g is mandatory, with use of option -x")
+        elif (options.chains or options.models or options.backbone
+              or options.index):
+            parser.error("options --chains, --models, --backbone and --index "
+                         "cannot be used with option -x")
+        elif options.min_confidence is not None:
+            parser.error("option --min-confidence cannot be used with option "
+                         "-x")
+
+    if options.ensemble and options.cache:
+        parser.error("options --ensemble and --cache cannot be used together")
+    if options.processes is not None:
+        if options.processes < 1:
+            parser.error("option --processes needs at least one process")
+        if options.ensemble or options.cache:
+            parser.error("option --processes cannot be used with "
+                         "--ensemble nor --cache")
+    if options.engine == 'numba' and not pbx.kernels.IS_NUMBA:
+        parser.error("numba is required for --engine numba")
+    if options.confidence:
+        if options.o == STDOUT:
+            parser.error("option --confidence needs an output name")
+        if options.processes is not None:
+            parser.error("options --confidence and --processes cannot be "
+                         "used together")
+
+    if options.split and options.chain_selection:
+        parser.error("options --split and --chain-selection cannot be used "
+                     "together")
+    if options.format:
+        options.format = STDIN_FORMATS[options.format]
+
+    # check selection
+    options.selection = None
+    if options.chains or options.models or options.backbone:
+        try:
+            options.selection = pbx.structure.Selection(
+                atom_names=pbx.structure.BACKBONE_ATOMS if options.backbone else None,
+                chains=options.chains.split(',') if options.chains else None,
+                models=options.models)
+        except ValueError:
+            parser.error("{0}: not a valid list of models".format(options.models))
 
     # check files
     pdb_name_lst = []
     if options.p:
+        if options.p.count(pbx.STDIN) > 1:
+            parser.error("the standard input can only be read once")
         for name in options.p:
+            # input is the standard input
+            if name == pbx.STDIN:
+                pdb_name_lst.append(name)
             # input is a file: store file name
-            if os.path.isfile(name):
+            elif os.path.isfile(name):
                 pdb_name_lst.append(name)
-            # input is a directory: list and store all PDB and PDBx/mmCIF files
+            # input is a directory: list and store all PDB, PDBx/mmCIF and
+            # BinaryCIF files, and the archives of such files
             elif os.path.isdir(name):
-                for extension in (pbx.structure.PDB_EXTENSIONS + pbx.structure.PDB.PDBx_EXTENSIONS):
+                for extension in (pbx.structure.PDB_EXTENSIONS
+                                  + pbx.structure.PDBx_EXTENSIONS
+                                  + pbx.structure.BinaryCIF_EXTENSIONS
+                                  + pbx.structure.ARCHIVE_EXTENSIONS):
                     pdb_name_lst += glob.glob(os.path.join(name, "*" + extension))
             # input is not a file neither a directory: say it
             elif (not os.path.isfile(name) or not os.path.isdir(name)):
@@ -96,40 +223,242 @@ def pbassign_cli():
     PBassign command line.
     """
     options, pdb_name_lst = user_inputs()
+    # With the results on the standard output, messages go to the standard
+    # error.
+    log = sys.stderr if options.o == STDOUT else sys.stdout
+
+    if options.confidence:
+        confidence_name = options.o + ".PB.confidence"
+        with _output_file(confidence_name) as confidence:
+            assign_inputs(options, pdb_name_lst, log, confidence)
+        print("wrote {0}".format(confidence_name), file=log)
+    else:
+        assign_inputs(options, pdb_name_lst, log)
 
+
+def assign_inputs(options, pdb_name_lst, log, confidence=None):
+    """
+    Assign the PBs of the input files, and write them.
+
+    With an open `confidence` file, the confidence of the PBs is written in
+    it as they are assigned.
+    """
+    assigner = ASSIGNER
+    if options.engine:
+        assigner = pbx.Assigner(engine=options.engine)
     if options.p:
         if pdb_name_lst:
-            print("{} PDB file(s) to process".format(len(pdb_name_lst)))
+            print("{} PDB file(s) to process".format(len(pdb_name_lst)), file=log)
         else:
-            print('Nothing to do. Good bye.')
+            print('Nothing to do. Good bye.', file=log)
+            return
+        if options.ensemble:
+            # PB assignement of all the models of a chain at once
+            ensembles = pbx.ensembles_from_files(pdb_name_lst, options.selection,
+                                                 index=options.index,
+                                                 stdin_format=options.format)
+            write_sequences(options.o,
+                            assign_ensembles(ensembles, options.min_confidence,
+                                             confidence, assigner),
+                            log)
+            return
+        if options.processes:
+            # PB assignement of parts of each file in several processes
+            results = pbx.parallel.assign_files(pdb_name_lst, options.selection,
+                                                options.processes,
+                                                index=options.index,
+                                                stdin_format=options.format,
+                                                min_confidence=options.min_confidence,
+                                                engine=options.engine)
+            write_sequences(options.o, skip_failures(results), log)
             return
         # PB assignement of PDB structures
-        chains = pbx.chains_from_files(pdb_name_lst)
+        cache = None
+        if options.cache:
+            cache = pbx.structure.StructureCache(options.cache)
+        chains = pbx.chains_from_files(pdb_name_lst, options.selection,
+                                       index=options.index, cache=cache,
+                                       stdin_format=options.format)
+        write_sequences(options.o,
+                        assign_chains(chains, options.min_confidence, confidence,
+                                      assigner),
+                        log)
     else:
         # PB assignement of a Gromacs trajectory
-        chains = pbx.chains_from_trajectory(options.x, options.g)
+        split = options.split or options.chain_selection
+        cache = None
+        if options.cache:
+            cache = pbx.structure.StructureCache(options.cache)
+        try:
+            chains = pbx.chains_from_trajectory(options.x, options.g, split,
+                                                cache=cache)
+            write_sequences(options.o,
+                            assign_chains(chains, confidence=confidence,
+                                          assigner=assigner), log)
+        except ValueError as error:
+            # the atoms cannot be split as requested
+            sys.exit(str(error))
 
-    all_comments = []
-    all_sequences = []
+
+def _nan_warning(comment):
+    print("The computation of angles produced NaN. This typically means there are issues"
+          " with some residues coordinates. Check your input file ({0})".format(comment),
+          file=sys.stderr)
+
+
+def assign_confidence(resids, phi, psi, masked=None, assigner=ASSIGNER):
+    """
+    Assign the PBs of arrays of angles of one or several models, with their
+    confidence.
+
+    Returns
+    -------
+    sequences : list of str
+        The PB sequence of each model.
+    confidences : list of tuple
+        For each model, the RMSDA of the residues to their PB, their next
+        nearest PBs as a sequence, and the margin between both RMSDA.
+    """
+    codes, confidence = assigner.codes(resids, numpy.atleast_2d(phi),
+                                       numpy.atleast_2d(psi), masked,
+                                       confidence=True)
+    seconds = assigner.decode(confidence.second)
+    return assigner.decode(codes), list(zip(confidence.rmsda, seconds,
+                                            confidence.margin))
+
+
+def assign_chains(chains, min_confidence=None, confidence=None,
+                  assigner=ASSIGNER):
+    """
+    Assign the PBs of chains, one at a time.
+
+    The residues below the confidence threshold, if any, are assigned Z
+    without computing their angles. With an open `confidence` file, the
+    confidence of the PBs is written in it.
+    """
+    header = True
     for comment, chain in chains:
+        masked = None
+        if min_confidence is not None:
+            masked = chain.low_confidence_residues(min_confidence)
         try:
-            dihedrals = chain.get_phi_psi_angles()
-            sequence = pbx.assign(dihedrals)
-            all_comments.append(comment)
-            all_sequences.append(sequence)
+            if confidence is None:
+                dihedrals = chain.get_phi_psi_angles(masked)
+            else:
+                resids, phi, psi = chain.get_phi_psi_arrays(masked)
         except FloatingPointError:
-            print("The computation of angles produced NaN. This typically means there are issues"
-                  " with some residues coordinates. Check your input file ({0})".format(comment),
-                  file=sys.stderr)
+            _nan_warning(comment)
+            continue
+        if confidence is None:
+            yield comment, assigner.assign(dihedrals, masked=masked)
+            continue
+        if masked:
+            masked = numpy.isin(resids, list(masked))
+        else:
+            masked = None
+        (sequence, ), (values, ) = assign_confidence(resids, phi, psi, masked,
+                                                     assigner)
+        pbx.io.write_confidence(confidence, comment, resids, sequence, *values,
+                                header=header)
+        header = False
+        yield comment, sequence
 
-    if all_comments:
-        fasta_name = options.o + ".PB.fasta"
-        with open(fasta_name, 'w') as outfile:
-            pbx.io.write_fasta(outfile, all_sequences, all_comments)
 
-        print("wrote {0}".format(fasta_name))
-    else:
-        print("No output file was written")
+def skip_failures(results):
+    """
+    Skip the chains whose PBs could not be assigned.
+    """
+    for comment, sequence in results:
+        if sequence is None:
+            _nan_warning(comment)
+        else:
+            yield comment, sequence
+
+
+def assign_ensembles(ensembles, min_confidence=None, confidence=None,
+                     assigner=ASSIGNER):
+    """
+    Assign the PBs of all the models of ensembles.
+
+    With an open `confidence` file, the confidence of the PBs is written in
+    it.
+    """
+    header = True
+    for comments, ensemble in ensembles:
+        resids, phi, psi, valid = ensemble.get_phi_psi_arrays()
+        masked = None
+        if min_confidence is not None:
+            masked = ensemble.low_confidence_mask(min_confidence)
+        if confidence is None:
+            sequences = assigner.assign_angles(resids, phi, psi, masked)
+            values = [None] * len(sequences)
+        else:
+            sequences, values = assign_confidence(resids, phi, psi, masked,
+                                                  assigner)
+        for comment, sequence, model_values, model_valid in zip(
+                comments, sequences, values, valid):
+            if not model_valid:
+                _nan_warning(comment)
+                continue
+            if confidence is not None:
+                pbx.io.write_confidence(confidence, comment, resids, sequence,
+                                        *model_values, header=header)
+                header = False
+            yield comment, sequence
+
+
+@contextlib.contextmanager
+def _output_file(name):
+    """
+    Open a temporary file next to an output file. It replaces the output
+    file once all is written, and is removed if the assignment fails, so no
+    partial output is left.
+    """
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(name) or os.curdir, suffix='.tmp')
+    # the permissions of a file created with open()
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(temporary, 0o666 & ~umask)
+    try:
+        with os.fdopen(descriptor, 'w') as outfile:
+            yield outfile
+    except BaseException:
+        os.remove(temporary)
+        raise
+    os.replace(temporary, name)
+
+
+def write_sequences(prefix, entries, log=sys.stdout):
+    """
+    Write the PB sequences in a fasta file, as they are assigned.
+
+    The file is only written if a sequence is assigned, and only replaces an
+    existing file once all the sequences are assigned. With a prefix of '-',
+    the sequences are written on the standard output, and flushed one by one.
+    """
+    entries = iter(entries)
+    first = next(entries, None)
+    if first is None:
+        print("No output file was written", file=log)
+        return
+    fasta_name = prefix + ".PB.fasta"
+    if prefix != STDOUT:
+        with _output_file(fasta_name) as outfile:
+            for comment, sequence in itertools.chain([first], entries):
+                pbx.io.write_fasta_entry(outfile, sequence, comment)
+        print("wrote {0}".format(fasta_name), file=log)
+        return
+    try:
+        for comment, sequence in itertools.chain([first], entries):
+            pbx.io.write_fasta_entry(sys.stdout, sequence, comment)
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader of the standard output is gone: the output is silenced
+        # so Python does not complain when it exits.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
 
 if __name__ == '__main__':
     pbassign_cli()
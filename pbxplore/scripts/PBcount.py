@@ -52,6 +52,11 @@ def user_input():
     parser.add_argument("--first-residue", action="store", type=int, default=1,
                         dest="first_residue",
                         help="define first residue number (1 by default)")
+    parser.add_argument("--engine", action="store",
+                        choices=pbx.analysis.count.COUNT_ENGINES,
+                        help=("count the PBs with numpy, or with compiled "
+                              "loops (requires numba); numba by default "
+                              "if it is installed"))
 
     parser.add_argument('-v', '--version', action='version',
                         version='%(prog)s {}'.format(pbx.__version__))
@@ -60,6 +65,8 @@ def user_input():
     options = parser.parse_args()
 
     # check options
+    if options.engine == 'numba' and not pbx.kernels.IS_NUMBA:
+        parser.error("numba is required for --engine numba")
     if options.first_residue and options.first_residue < 0:
         print("Warning: first residue is < 1.")
 
@@ -82,7 +89,7 @@ def pbcount_cli():
 
     # count PBs at each position of the sequence
     try:
-        pb_count = pbx.analysis.count_matrix(pb_seq)
+        pb_count = pbx.analysis.count_matrix(pb_seq, options.engine)
     except pbx.PB.SizeError:
         sys.exit("cannot compute PB frequencies / different sequence lengths")
     except pbx.PB.InvalidBlockError as e:
@@ -4,11 +4,19 @@
 
 
 # Standard modules
+import io
 import os
 import gzip
+import mmap
+import zlib
+import itertools
+import contextlib
 
 # Local module
-from .structure import Atom, Chain
+from .parsers import PDBParser, PDBxParser
+from .binarycif import read_binary_cif
+from .selection import Selection
+from .index import StructureIndex, index_path
 
 # =============================================================================
 # Data
@@ -16,130 +24,419 @@ from .structure import Atom, Chain
 # file extensions for PDB and PDBx/mmCIF files
 PDB_EXTENSIONS = ('.pdb', '.PDB', '.pdb.gz', '.pdb.GZ', '.PDB.gz', '.PDB.GZ', '.ent', '.ENT4')
 PDBx_EXTENSIONS = ('.cif', '.CIF', '.cif.gz', '.CIF.GZ')
+BinaryCIF_EXTENSIONS = ('.bcif', '.BCIF', '.bcif.gz', '.BCIF.GZ')
+
+
+# Size of the blocks read at once from PDB files, in bytes
+BLOCK_SIZE = 1 << 22
+# Number of lines read at once from PDBx/mmCIF files
+BLOCK_LINES = 1 << 16
+# Number of bytes read from a stream to guess its format
+SNIFF_SIZE = 1 << 12
+
+
+def _blocks_of_lines(f_in, size=None, limit=None):
+    """
+    Read a binary file by blocks that end at the end of a line.
+
+    At most `limit` bytes are read when it is given.
+    """
+    size = BLOCK_SIZE if size is None else size
+    remainder = b''
+    while True:
+        if limit is not None:
+            if limit <= 0:
+                break
+            data = f_in.read(min(size, limit))
+            limit -= len(data)
+        else:
+            data = f_in.read(size)
+        if not data:
+            break
+        data = remainder + data
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            remainder = data
+            continue
+        remainder = data[end:]
+        yield data[:end]
+    if remainder:
+        yield remainder
+
+
+def sniff_extension(head):
+    """
+    Guess the extension of a structure file from its first bytes.
+
+    Gzip-compressed files are recognized from their magic number. BinaryCIF
+    files start with a MessagePack map, and PDBx/mmCIF files with a
+    ``data_`` line after their comments; other files are read as PDB files.
+
+    Parameters
+    ----------
+    head : bytes
+        The first bytes of the file.
+
+    Returns
+    -------
+    extension : str
+        One of '.pdb', '.cif' or '.bcif', followed by '.gz' for compressed
+        files.
+    """
+    compression = ''
+    if head[:2] == b'\x1f\x8b':
+        compression = '.gz'
+        head = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head)
+    if head[:1] and (0x80 <= head[0] <= 0x8f or head[0] in (0xde, 0xdf)):
+        return '.bcif' + compression
+    for line in head.splitlines():
+        line = line.strip()
+        if not line or line.startswith(b'#'):
+            continue
+        if line.startswith(b'data_'):
+            return '.cif' + compression
+        break
+    return '.pdb' + compression
+
+
+class _ReplayStream(io.RawIOBase):
+    """
+    Binary stream that gives bytes already read from a stream, then the
+    rest of the stream.
+    """
+    def __init__(self, head, f_in):
+        self._head = head
+        self._read = getattr(f_in, 'read1', f_in.read)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+        data = self._read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_stream(f_in, extension=None):
+    """
+    Prepare a binary stream, such as the standard input, to be read as a
+    structure file.
+
+    Parameters
+    ----------
+    f_in : file
+        A file opened in binary mode, that can be read only once.
+    extension : str, optional
+        The extension of the format of the file ('.pdb', '.cif' or '.bcif').
+        By default, the format is guessed from the first bytes (see
+        :func:`sniff_extension`). The compression is always guessed.
+
+    Returns
+    -------
+    extension : str
+        The extension of the format of the file, with '.gz' for compressed
+        files.
+    stream : file
+        The content of the file, from its start, to give as `fileobj` to
+        :class:`PDB`.
+    """
+    head = f_in.read(SNIFF_SIZE)
+    sniffed = sniff_extension(head)
+    if extension is None:
+        extension = sniffed
+    elif sniffed.endswith('.gz') and not extension.endswith(('.gz', '.GZ')):
+        extension += '.gz'
+    return extension, io.BufferedReader(_ReplayStream(head, f_in))
 
 
 class PDB:
     """
     Class to read PDB files.
 
+    The file is read when the chains are requested with :meth:`get_chains`.
+    It is read by blocks, and each chain is given as soon as it is complete,
+    so the memory used does not depend on the number of models in the file.
+
+    When the selection restricts the chains or the models to read, an index
+    of the file (see :class:`StructureIndex`) allows to read only the
+    selected chains. Uncompressed files are then memory-mapped; compressed
+    files are decompressed from the checkpoint closest to each chain.
+
+    BinaryCIF files are decoded at once, column by column; they cannot be
+    indexed.
+
+    Parameters
+    ----------
+    name : str
+        Path to a PDB, PDBx/mmCIF or BinaryCIF file.
+    selection : Selection, optional
+        The atoms to read. By default, all the atoms are read.
+    index : bool or StructureIndex, optional
+        The index of the file. If True, the index saved next to the file is
+        used; it is built and saved if it does not exist or is outdated. By
+        default, no index is used.
+    fileobj : file, optional
+        The content of the file, as a file opened in binary mode; for
+        instance a member of an archive. `name` is then only used to know
+        the format of the file. Such a file cannot be indexed.
     """
-    def __init__(self, name):
+    def __init__(self, name, selection=None, index=None, fileobj=None):
         """
         Default constructor for PDB file.
         """
         self.filename = name
-        self.chains = []
+        self.selection = selection
+        self._index = index
+        self._fileobj = fileobj
+        self._nb_chains = None
+        self._chains = None
         # check that file exists
-        if not os.path.isfile(self.filename):
+        if fileobj is None and not os.path.isfile(self.filename):
             raise IOError("Cannot read {}: does not exist or is not a file."
                           .format(self.filename))
+        extensions = PDB_EXTENSIONS + PDBx_EXTENSIONS + BinaryCIF_EXTENSIONS
+        if not self.filename.endswith(extensions):
+            raise IOError("File extension is not a valid one. "
+                          "Corrects one are {}".format(", ".join(extensions)))
         if self.filename.endswith(PDB_EXTENSIONS):
-            self.__read_PDB()
+            self.kind = 'PDB'
         elif self.filename.endswith(PDBx_EXTENSIONS):
-            self.__read_PDBx()
+            self.kind = 'PDBx'
         else:
-            raise IOError("File extension is not a valid one. "
-                          "Corrects one are {}".format(", ".join(PDB_EXTENSIONS + PDBx_EXTENSIONS)))
+            self.kind = 'BinaryCIF'
+
+    def _open(self, mode):
+        """
+        Open the file, decompressing it if needed.
+        """
+        if self._fileobj is not None:
+            f_in = self._fileobj
+            if self.filename.endswith(('.gz', '.GZ')):
+                f_in = gzip.GzipFile(fileobj=f_in, mode='rb')
+            if 't' in mode:
+                f_in = io.TextIOWrapper(f_in)
+            return f_in
+        if self.filename.endswith(('.gz', '.GZ')):
+            # for compressed file
+            return gzip.open(self.filename, mode)
+        return open(self.filename, mode)
 
     def __read_PDB(self):
         """
         Read PDB file.
+
+        The ATOM records are decoded in bulk by :class:`PDBParser`.
         """
-        # create new chain
-        chain = Chain()
         # get chains from file
         # A PDB file can have several models
         # that can have several chains themselves.
-        if self.filename.endswith(('.gz', '.GZ')):
-            # for compressed file
-            f_in = gzip.open(self.filename, 'rt')
-        else:
-            f_in = open(self.filename, 'rt')
-        for line in f_in:
-            flag = line[0:6].strip()
-            if flag == "MODEL":
-                chain.set_model(line.split()[1])
-            if flag == "ATOM":
-                atom = Atom.read_from_PDB(line)
-                # store current chain and clean object
-                if chain.size() != 0 and chain.name != atom.chain:
-                    self.chains.append(chain)
-                    chain = Chain()
-                # append structure with atom
-                chain.add_atom(atom)
-            # store chain after end of model or chain
-            if chain.size() != 0 and flag in ["TER", "ENDMDL"]:
-                self.chains.append(chain)
-                chain = Chain()
-        # store last chain
-        if chain.size() != 0:
-            self.chains.append(chain)
-        f_in.close()
+        with self._open('rb') as f_in:
+            parser = PDBParser(self.selection)
+            for block in _blocks_of_lines(f_in):
+                for chain in parser.feed(block):
+                    yield chain
+            for chain in parser.close():
+                yield chain
 
     def __read_PDBx(self):
         """
         Read PDBx/mmCIF file
+
+        The _atom_site loop is read by :class:`PDBxParser`.
         """
-        # create new chain
-        chain = Chain()
         # get chains from file
         # A PDBx file can have several models
         # that can have several chains themselves.
-        atom_fields = []
-        atom_coordinates = []
+        with self._open('rt') as f_in:
+            parser = PDBxParser(self.selection)
+            while True:
+                lines = list(itertools.islice(f_in, BLOCK_LINES))
+                if not lines:
+                    break
+                for chain in parser.feed(lines):
+                    yield chain
+            for chain in parser.close():
+                yield chain
+
+    def __read_BinaryCIF(self):
+        """
+        Read BinaryCIF file.
+
+        The columns of the _atom_site category are decoded at once by
+        :func:`read_binary_cif`.
+        """
+        with self._open('rb') as f_in:
+            data = f_in.read()
+        for chain in read_binary_cif(data, self.selection):
+            yield chain
+
+    def get_index(self):
+        """
+        Give the index of the file.
+
+        The index saved next to the file is read if it is up to date.
+        Otherwise, the file is indexed and the index is saved, if the
+        directory is writable.
+
+        Returns
+        -------
+        index : StructureIndex
+
+        Raises
+        ------
+        ValueError
+            If the file is a BinaryCIF file, or is given as a file object.
+        """
+        if self.kind == 'BinaryCIF':
+            raise ValueError("BinaryCIF files cannot be indexed")
+        if self._fileobj is not None:
+            raise ValueError("Files given as file objects cannot be indexed")
+        if isinstance(self._index, StructureIndex):
+            return self._index
+        path = index_path(self.filename)
+        index = None
+        if os.path.isfile(path):
+            try:
+                index = StructureIndex.load(path)
+            except (ValueError, OSError):
+                index = None
+        if index is None or not index.is_valid_for(self.filename):
+            index = StructureIndex.build(self.filename)
+            try:
+                index.save(path)
+            except OSError:
+                pass
+        self._index = index
+        return index
+
+    @contextlib.contextmanager
+    def _random_access(self, index):
+        """
+        Open the file for reading at any position.
+
+        Uncompressed files are memory-mapped. Compressed files are
+        decompressed from the closest checkpoint of the index, if any.
+        """
         if self.filename.endswith(('.gz', '.GZ')):
-            # for compressed file
-            f_in = gzip.open(self.filename, 'rt')
+            with index.open(self.filename) as f_in:
+                yield f_in
         else:
-            f_in = open(self.filename, 'rt')
-        for line in f_in:
-            item = line.strip()
-            # then store atom field definitions
-            if item.startswith("_atom_site."):
-                atom_fields.append(item.replace("_atom_site.", ""))
-            # then store atom coordinates
-            if atom_fields and item.startswith('ATOM'):
-                atom_coordinates.append(item)
-        f_in.close()
-        # separate all chains and store atoms
-        chain = Chain()
-        for atom_line in atom_coordinates:
-            atom = Atom.read_from_PDBx(atom_line, atom_fields)
-            # define model at first atom
-            if chain.size() == 1:
-                chain.set_model(atom.model)
-            # store current chain when chain name changed
-            if chain.size() != 0 and chain.name != atom.chain:
-                # store model number only if there is more than one model
-                if chain.model == atom.model:
-                    chain.set_model("")
-                self.chains.append(chain)
-                chain = Chain()
-            # store current chain when model number changed
-            if chain.size() != 0 and chain.model != atom.model:
-                self.chains.append(chain)
-                chain = Chain()
-            # append structure with atom
-            chain.add_atom(atom)
-        # store last chain
-        if chain.size() != 0:
-            self.chains.append(chain)
+            with open(self.filename, 'rb') as f_in, \
+                    mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def __read_indexed(self):
+        """
+        Read the selected chains from their position in the index.
+        """
+        entries = self.get_index().select(self.selection)
+        for chain in self.read_entries(entries):
+            yield chain
+
+    def read_entries(self, entries):
+        """
+        Give the chains of some entries of the index, one at a time.
+
+        Parameters
+        ----------
+        entries : numpy array of int
+            Indices of entries of the index (see :meth:`get_index`), in file
+            order. The chains and models of the selection are not checked
+            again; only its atom names are used.
+
+        Returns
+        -------
+        generator
+            Chains of the entries.
+        """
+        if not len(entries):
+            return
+        index = self.get_index()
+        atoms = None
+        if self.selection is not None and self.selection.atom_names is not None:
+            atoms = Selection(atom_names=self.selection.atom_names)
+        with self._random_access(index) as f_in:
+            if self.kind == 'PDB':
+                for start, stop in index.ranges(entries):
+                    f_in.seek(start)
+                    parser = PDBParser(atoms)
+                    for block in _blocks_of_lines(f_in, limit=stop - start):
+                        for chain in parser.feed(block):
+                            yield chain
+                    for chain in parser.close():
+                        yield chain
+                return
+            for entry in entries:
+                f_in.seek(index.starts[entry])
+                data = f_in.read(index.stops[entry] - index.starts[entry])
+                parser = PDBxParser(atoms)
+                parser.start_rows(index.fields)
+                chains = parser.feed(data.decode().splitlines(True))
+                for chain in chains + parser.close():
+                    # The model of a chain depends on the next chain.
+                    chain.set_model(str(index.models[entry]))
+                    yield chain
 
     def get_chains(self):
         """
         Give chains, one at a time.
 
+        The file is read while the chains are given, unless :attr:`chains`
+        already read all of them.
+
         Returns
         -------
         generator
             Chains in PDB structure.
         """
-        for chain in self.chains:
+        if self._chains is not None:
+            for chain in self._chains:
+                yield chain
+            return
+        selection = self.selection
+        if self.kind == 'BinaryCIF':
+            chains = self.__read_BinaryCIF()
+        elif (self._index not in (None, False) and self._fileobj is None
+                and selection is not None
+                and (selection.chains is not None
+                     or selection.models is not None)):
+            chains = self.__read_indexed()
+        elif self.kind == 'PDB':
+            chains = self.__read_PDB()
+        else:
+            chains = self.__read_PDBx()
+        nb_chains = 0
+        for chain in chains:
+            nb_chains += 1
             yield chain
+        self._nb_chains = nb_chains
+
+    @property
+    def chains(self):
+        """
+        Give all the chains at once, as a list.
+
+        The file is read the first time; the list is then kept, so a file
+        object or the standard input can be read once and its chains given
+        again.
+        """
+        if self._chains is None:
+            self._chains = list(self.get_chains())
+        return self._chains
 
     @property
     def nb_chains(self):
         """
         Give the number of chains
+
+        The file is read if it was not read entirely yet.
         """
-        return len(self.chains)
+        if self._nb_chains is None:
+            for _ in self.get_chains():
+                pass
+        return self._nb_chains
@@ -14,11 +14,28 @@ Constants
 * :data:`PDBx_EXTENSIONS`
    list of file extensions corresponding to PDBx/mmCIF files
 
+* :data:`BinaryCIF_EXTENSIONS`
+   list of file extensions corresponding to BinaryCIF files
+
+* :data:`ARCHIVE_EXTENSIONS`
+   list of file extensions corresponding to tar and zip archives
+
+* :data:`BACKBONE_ATOMS`
+   names of the atoms needed to assign protein blocks
+
+* :data:`STDIN`
+   path that stands for the standard input
+
+* :data:`INDEX_SUFFIX`
+   suffix of the index files saved next to structure files
+
 Functions
 ---------
 
 .. autofunction:: chains_from_files
 
+.. autofunction:: ensembles_from_files
+
 .. autofunction:: chains_from_trajectory
 
 Objects
@@ -28,10 +45,25 @@ Objects
 
    .. automethod:: pbxplore.structure.structure.Chain.get_phi_psi_angles
 
+   .. automethod:: pbxplore.structure.structure.Chain.get_phi_psi_arrays
+
+   .. automethod:: pbxplore.structure.structure.Chain.low_confidence_residues
+
 .. autoclass:: pbxplore.structure.structure.Atom
 
 .. autoclass:: pbxplore.structure.PDB.PDB
 
+.. autoclass:: pbxplore.structure.ensemble.Ensemble
+   :members: get_phi_psi_arrays, get_phi_psi_angles, low_confidence_mask
+
+.. autoclass:: Selection
+
+.. autoclass:: pbxplore.structure.index.StructureIndex
+   :members: build, save, load
+
+.. autoclass:: pbxplore.structure.cache.StructureCache
+   :members: read, record, read_topology, record_topology, evict, clear
+
 Exceptions
 ----------
 
@@ -40,5 +72,10 @@ Exceptions
 .. autoexception:: pbxplore.structure.structure.AtomError
 """
 
-from .PDB import PDB_EXTENSIONS, PDBx_EXTENSIONS
+from .PDB import PDB_EXTENSIONS, PDBx_EXTENSIONS, BinaryCIF_EXTENSIONS
+from .selection import Selection, BACKBONE_ATOMS
+from .index import StructureIndex, INDEX_SUFFIX
+from .cache import StructureCache
+from .archive import ARCHIVE_EXTENSIONS
+from .ensemble import Ensemble
 from .loader import *
@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Read structure files from tar and zip archives.
+
+The members of an archive are read one after the other, without extracting
+them on disk. Tar archives are read as a stream, so compressed tar archives
+are decompressed only once.
+"""
+
+# Standard modules
+import tarfile
+import zipfile
+
+# Local module
+from .PDB import PDB_EXTENSIONS, PDBx_EXTENSIONS, BinaryCIF_EXTENSIONS
+
+
+# =============================================================================
+# Data
+# =============================================================================
+# file extensions for archives of structure files
+ARCHIVE_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip')
+
+# file extensions of the members read from archives
+_STRUCTURE_EXTENSIONS = PDB_EXTENSIONS + PDBx_EXTENSIONS + BinaryCIF_EXTENSIONS
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def is_archive(path):
+    """
+    Tell if a path is an archive of structure files, from its extension.
+    """
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def archive_members(path):
+    """
+    Give the structure files of an archive, one at a time.
+
+    Only the members with the extension of a PDB, PDBx/mmCIF or BinaryCIF
+    file are given, in the order of the archive. A member can only be read
+    until the next one is requested.
+
+    Parameters
+    ----------
+    path : str
+        Path to a tar archive, compressed or not, or to a zip archive.
+
+    Yields
+    ------
+    name : str
+        The name of the member in the archive.
+    f_in : file
+        The content of the member, as a file opened in binary mode.
+    """
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.endswith(_STRUCTURE_EXTENSIONS):
+                    continue
+                with archive.open(info) as f_in:
+                    yield info.filename, f_in
+        return
+    # 'r|*' reads the archive as a stream, with any compression
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.endswith(_STRUCTURE_EXTENSIONS):
+                continue
+            yield member.name, archive.extractfile(member)
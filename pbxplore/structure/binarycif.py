@@ -0,0 +1,307 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Reader for BinaryCIF files.
+
+BinaryCIF stores the categories of a PDBx/mmCIF file column by column, in a
+MessagePack document. Each column is an encoded byte array; the encodings
+(see https://github.com/molstar/BinaryCIF) are undone with numpy, so the
+columns of the _atom_site category are decoded straight into arrays. String
+columns are decoded as integer codes in a table of strings, which are used as
+is for the atom and residue names of the chains.
+
+Reading BinaryCIF files requires the `msgpack` package.
+"""
+
+# Third-party module
+import numpy
+
+# Optional module
+try:
+    import msgpack
+    IS_MSGPACK = True
+except ImportError:
+    IS_MSGPACK = False
+
+# Local modules
+from .structure import AtomError, Chain
+from .parsers import pdbx_segments, _PDBX_FIELDS, _PDBX_BFACTOR
+
+
+# =============================================================================
+# Data
+# =============================================================================
+# Data types of the ByteArray encoding
+_BYTE_ARRAY_TYPES = {
+    1: numpy.dtype('<i1'),
+    2: numpy.dtype('<i2'),
+    3: numpy.dtype('<i4'),
+    4: numpy.dtype('<u1'),
+    5: numpy.dtype('<u2'),
+    6: numpy.dtype('<u4'),
+    32: numpy.dtype('<f4'),
+    33: numpy.dtype('<f8'),
+}
+
+# Mask values of the BinaryCIF columns
+_MASK_PRESENT = 0
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def _decode_byte_array(data, encoding):
+    return numpy.frombuffer(data, dtype=_BYTE_ARRAY_TYPES[encoding['type']])
+
+
+def _decode_fixed_point(data, encoding):
+    dtype = _BYTE_ARRAY_TYPES[encoding['srcType']]
+    return (data / encoding['factor']).astype(dtype, copy=False)
+
+
+def _decode_interval_quantization(data, encoding):
+    dtype = _BYTE_ARRAY_TYPES[encoding['srcType']]
+    minimum = encoding['min']
+    step = (encoding['max'] - minimum) / (encoding['numSteps'] - 1)
+    return (minimum + step * data).astype(dtype, copy=False)
+
+
+def _decode_run_length(data, encoding):
+    dtype = _BYTE_ARRAY_TYPES[encoding['srcType']]
+    return numpy.repeat(data[0::2].astype(dtype), data[1::2])
+
+
+def _decode_delta(data, encoding):
+    dtype = _BYTE_ARRAY_TYPES[encoding['srcType']]
+    decoded = numpy.cumsum(data, dtype=numpy.int64) + encoding['origin']
+    return decoded.astype(dtype)
+
+
+def _decode_integer_packing(data, encoding):
+    # A value that does not fit in the packed type is written as a run of
+    # the limit values, ended by a value below the limit; they add up.
+    if encoding['isUnsigned']:
+        limits = [(1 << (8 * encoding['byteCount'])) - 1]
+    else:
+        upper = (1 << (8 * encoding['byteCount'] - 1)) - 1
+        limits = [upper, -upper - 1]
+    ends = numpy.flatnonzero(~numpy.isin(data, limits))
+    sums = numpy.cumsum(data, dtype=numpy.int64)[ends]
+    sums[1:] -= sums[:-1].copy()
+    return sums.astype(numpy.int32)
+
+
+_DECODERS = {
+    'ByteArray': _decode_byte_array,
+    'FixedPoint': _decode_fixed_point,
+    'IntervalQuantization': _decode_interval_quantization,
+    'RunLength': _decode_run_length,
+    'Delta': _decode_delta,
+    'IntegerPacking': _decode_integer_packing,
+}
+
+
+def decode(data, encodings):
+    """
+    Decode a BinaryCIF array.
+
+    Parameters
+    ----------
+    data : bytes
+        The encoded data.
+    encodings : list of dict
+        The encodings applied to the data, in the order they were applied.
+
+    Returns
+    -------
+    values : numpy array or tuple
+        The decoded values. A string column is returned as a tuple of
+        integer codes and labels; a code of -1 is a missing value.
+
+    Raises
+    ------
+    AtomError
+        If an encoding is unknown.
+    """
+    for encoding in reversed(encodings):
+        kind = encoding['kind']
+        if kind == 'StringArray':
+            codes = decode(data, encoding['dataEncoding'])
+            offsets = decode(encoding['offsets'], encoding['offsetEncoding'])
+            strings = encoding['stringData']
+            labels = [strings[start:stop]
+                      for start, stop in zip(offsets[:-1], offsets[1:])]
+            return codes, labels
+        try:
+            decoder = _DECODERS[kind]
+        except KeyError:
+            raise AtomError("Unknown BinaryCIF encoding: {0}".format(kind))
+        data = decoder(data, encoding)
+    return data
+
+
+def _decode_column(column):
+    """
+    Decode a column of a category, and the mask of its missing values.
+    """
+    values = decode(column['data']['data'], column['data']['encoding'])
+    present = None
+    if column.get('mask'):
+        mask = decode(column['mask']['data'], column['mask']['encoding'])
+        present = mask == _MASK_PRESENT
+    return values, present
+
+
+def _as_strings(values):
+    """
+    Give the decoded values of a column as an array of strings.
+    """
+    if isinstance(values, tuple):
+        codes, labels = values
+        return numpy.array(labels + [''], dtype=str)[codes]
+    return values.astype(str)
+
+
+def _as_numbers(values, kind):
+    """
+    Give the decoded values of a column as an array of int or float.
+    """
+    if isinstance(values, tuple):
+        return _as_strings(values).astype(kind)
+    return values.astype(kind)
+
+
+def _as_categories(values):
+    """
+    Give the decoded values of a column as integer codes and labels.
+    """
+    if isinstance(values, tuple):
+        codes, labels = values
+        codes = numpy.asarray(codes, dtype=numpy.int32)
+        if (codes < 0).any():
+            labels = labels + ['']
+            codes = numpy.where(codes < 0, len(labels) - 1, codes)
+        return codes, list(labels)
+    values, codes = numpy.unique(values.astype(str), return_inverse=True)
+    return codes.reshape(-1).astype(numpy.int32), values.tolist()
+
+
+def _select_codes(values, allowed):
+    """
+    Tell which values of a column are in a set of strings.
+    """
+    if isinstance(values, tuple):
+        codes, labels = values
+        keep = numpy.array([label in allowed for label in labels] + [False],
+                           dtype=bool)
+        return keep[codes]
+    return numpy.isin(values.astype(str), list(allowed))
+
+
+def read_binary_cif(data, selection=None):
+    """
+    Read the chains of a BinaryCIF file.
+
+    The atoms are split in chains as for PDBx/mmCIF files (see
+    :class:`PDBxParser`).
+
+    Parameters
+    ----------
+    data : bytes
+        Content of the file.
+    selection : Selection, optional
+        The atoms to read. The atoms that do not match are discarded before
+        their coordinates are gathered.
+
+    Returns
+    -------
+    chains : list of Chain
+        The chains of the first data block.
+
+    Raises
+    ------
+    AtomError
+        If the file has no _atom_site category, if a required field is
+        missing, or if a value is missing or invalid.
+    ImportError
+        If `msgpack` is not installed.
+    """
+    if not IS_MSGPACK:
+        raise ImportError("msgpack is required to read BinaryCIF files")
+    document = msgpack.unpackb(data, raw=False)
+    categories = {}
+    for block in document['dataBlocks'][:1]:
+        for category in block['categories']:
+            categories[category['name'].lstrip('_')] = category
+    if 'atom_site' not in categories:
+        raise AtomError("No _atom_site category in the BinaryCIF file")
+    columns = {column['name']: column
+               for column in categories['atom_site']['columns']}
+    missing = [field for field in _PDBX_FIELDS if field not in columns]
+    if missing:
+        raise AtomError("Missing field(s) in _atom_site: {0}"
+                        .format(", ".join(missing)))
+
+    # The rows are selected before the other columns are decoded.
+    groups, _ = _decode_column(columns['group_PDB'])
+    keep = _select_codes(groups, {'ATOM'})
+    models, _ = _decode_column(columns['pdbx_PDB_model_num'])
+    models = _as_strings(models)
+    chains, _ = _decode_column(columns['label_asym_id'])
+    names, _ = _decode_column(columns['label_atom_id'])
+    if selection is not None:
+        if selection.models is not None:
+            keep &= selection.mask_models(models.astype(int))
+        if selection.chains is not None:
+            keep &= _select_codes(chains, selection.chains)
+        if selection.atom_names is not None:
+            keep &= _select_codes(names, selection.atom_names)
+    rows = numpy.flatnonzero(keep)
+
+    def take(values):
+        if isinstance(values, tuple):
+            return values[0][rows], values[1]
+        return values[rows]
+
+    chains = _as_strings(take(chains))
+    models = models[rows]
+    names = _as_categories(take(names))
+    fields = {}
+    for field in ('id', 'label_comp_id', 'label_seq_id',
+                  'Cartn_x', 'Cartn_y', 'Cartn_z'):
+        values, present = _decode_column(columns[field])
+        if present is not None and not present[rows].all():
+            raise AtomError("Something went wrong in data convertion\n"
+                            "missing value in {0}".format(field))
+        fields[field] = take(values)
+    try:
+        ids = _as_numbers(fields['id'], int)
+        resids = _as_numbers(fields['label_seq_id'], int)
+        coords = numpy.stack([_as_numbers(fields[field], float)
+                              for field in ('Cartn_x', 'Cartn_y', 'Cartn_z')],
+                             axis=1)
+        bfactors = None
+        if _PDBX_BFACTOR in columns:
+            # The B-factor, or pLDDT, is optional; missing values are 0.
+            values, present = _decode_column(columns[_PDBX_BFACTOR])
+            if present is None:
+                bfactors = _as_numbers(take(values), float)
+            else:
+                bfactors = numpy.zeros(len(rows))
+                present = present[rows]
+                bfactors[present] = _as_numbers(take(values), float)[present]
+    except ValueError as error:
+        raise AtomError("Something went wrong in data convertion\n{0}"
+                        .format(error))
+    resnames = _as_categories(fields['label_comp_id'])
+
+    completed = []
+    for start, stop, model in pdbx_segments(chains, models, final=True):
+        completed.append(Chain.from_arrays(
+            str(chains[start]), ids[start:stop],
+            (names[0][start:stop], names[1]),
+            (resnames[0][start:stop], resnames[1]),
+            resids[start:stop], coords[start:stop], model=model,
+            bfactors=None if bfactors is None else bfactors[start:stop]))
+    return completed
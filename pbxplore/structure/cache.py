@@ -0,0 +1,395 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+On-disk cache of the backbone of structure files.
+
+Reading a structure file and computing the phi and psi angles of its chains
+is done again each time the file is processed. The cache stores, for each
+file, the backbone atoms of its chains and their phi and psi angles as arrays
+in a compressed ``.npz`` entry. The next time the file is read with the same
+selection, the chains are built from the entry.
+
+An entry is valid as long as the file keeps the same size and modification
+time, or the same content. The least recently used entries are removed when
+the cache grows larger than its size limit.
+
+The cache also keeps the backbone atoms selected in the topologies of
+molecular dynamics trajectories. These entries are found from the content of
+the topology, so all the trajectories of a system share the same entry.
+"""
+
+# Standard modules
+import os
+import hashlib
+import tempfile
+import zipfile
+
+# Third-party module
+import numpy
+
+# Local modules
+from .structure import Chain
+from .selection import BACKBONE_ATOMS
+
+
+# =============================================================================
+# Data
+# =============================================================================
+# Version of the entry format, increased when the format changes
+CACHE_VERSION = 2
+# Default size limit of a cache, in bytes
+DEFAULT_MAX_SIZE = 1 << 30
+# Extension of the cache entries
+_ENTRY_EXTENSION = '.npz'
+# Size of the blocks read to hash a file
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def content_hash(filename):
+    """
+    Give the SHA-256 digest of the content of a file, as an hexadecimal string.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f_in:
+        for block in iter(lambda: f_in.read(_HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _angles_to_arrays(angles):
+    """
+    Convert the phi and psi angles of a chain to arrays.
+
+    Missing angles are stored as NaN.
+    """
+    resids = numpy.array(sorted(angles), dtype=numpy.int64)
+    phi = numpy.array([numpy.nan if angles[res]['phi'] is None
+                       else angles[res]['phi'] for res in resids], dtype=float)
+    psi = numpy.array([numpy.nan if angles[res]['psi'] is None
+                       else angles[res]['psi'] for res in resids], dtype=float)
+    return resids, phi, psi
+
+
+def _arrays_to_angles(resids, phi, psi):
+    """
+    Convert arrays of phi and psi angles to the dict of
+    :meth:`Chain.get_phi_psi_angles`.
+    """
+    return {int(res): {'phi': None if numpy.isnan(phi_value) else float(phi_value),
+                       'psi': None if numpy.isnan(psi_value) else float(psi_value)}
+            for res, phi_value, psi_value in zip(resids, phi, psi)}
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+class StructureCache:
+    """
+    On-disk cache of the backbone and the phi and psi angles of the chains
+    of structure files.
+
+    The cached chains only have their backbone atoms (see
+    :data:`BACKBONE_ATOMS`), and the phi and psi angles of their residues are
+    already known: :meth:`Chain.get_phi_psi_angles` does not compute them
+    again as long as the chain is not modified.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the cache entries. It is created if needed.
+    max_size : int, optional
+        Size limit of the cache, in bytes.
+
+    Examples
+    --------
+    >>> cache = StructureCache('~/.cache/pbxplore')
+    >>> for comment, chain in chains_from_files(['1BTA.pdb'], cache=cache):
+    ...     dihedrals = chain.get_phi_psi_angles()
+    """
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def entry_path(self, filename, selection=None):
+        """
+        Give the path of the entry of a file read with a selection.
+        """
+        key = "{0}\n{1}\n{2}".format(CACHE_VERSION, os.path.abspath(filename),
+                                     selection)
+        name = hashlib.sha1(key.encode()).hexdigest() + _ENTRY_EXTENSION
+        return os.path.join(self.directory, name)
+
+    def topology_entry_path(self, topology, key):
+        """
+        Give the path of the entry of the atoms selected in a topology.
+
+        The entry is found from the content of the topology file and the key,
+        that describes how the atoms are selected.
+        """
+        key = "{0}\ntopology\n{1}\n{2}".format(CACHE_VERSION,
+                                              content_hash(topology), key)
+        name = hashlib.sha1(key.encode()).hexdigest() + _ENTRY_EXTENSION
+        return os.path.join(self.directory, name)
+
+    def read_topology(self, topology, key):
+        """
+        Give the cached atoms selected in a topology.
+
+        Parameters
+        ----------
+        topology : str
+            Path to the topology file.
+        key : str
+            Description of how the atoms are selected.
+
+        Returns
+        -------
+        data : dict of numpy array or None
+            The arrays stored with :meth:`record_topology`, or None if the
+            topology is not in the cache.
+        """
+        path = self.topology_entry_path(topology, key)
+        try:
+            with numpy.load(path, allow_pickle=False) as entry:
+                data = dict(entry)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return None
+        # Most recently used
+        os.utime(path)
+        return data
+
+    def record_topology(self, topology, key, data):
+        """
+        Store the atoms selected in a topology.
+
+        Parameters
+        ----------
+        topology : str
+            Path to the topology file.
+        key : str
+            Description of how the atoms are selected.
+        data : dict of numpy array
+            The arrays that describe the atoms.
+        """
+        self._save(self.topology_entry_path(topology, key), data)
+        self.evict()
+
+    def read(self, filename, selection=None):
+        """
+        Give the cached chains of a file.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the structure file.
+        selection : Selection, optional
+            The selection the file was read with.
+
+        Returns
+        -------
+        chains : list of Chain or None
+            The chains of the file, or None if the file is not in the cache or
+            if its entry is outdated. Outdated entries are removed.
+        """
+        path = self.entry_path(filename, selection)
+        try:
+            with numpy.load(path, allow_pickle=False) as entry:
+                data = dict(entry)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return None
+        stat = os.stat(filename)
+        valid = (int(data['version']) == CACHE_VERSION
+                 and int(data['size']) == stat.st_size)
+        if valid and int(data['mtime']) != stat.st_mtime_ns:
+            # The file was touched: the entry is valid if the content is the
+            # same.
+            valid = str(data['hash']) == content_hash(filename)
+            if valid:
+                data['mtime'] = stat.st_mtime_ns
+                self._save(path, data)
+        if not valid:
+            os.remove(path)
+            return None
+        # Most recently used
+        os.utime(path)
+        return self._chains(data)
+
+    @staticmethod
+    def _chains(data):
+        """
+        Build the chains of a cache entry.
+        """
+        chains = []
+        atom_bounds = numpy.cumsum(numpy.insert(data['sizes'], 0, 0))
+        angle_bounds = numpy.cumsum(numpy.insert(data['nb_angles'], 0, 0))
+        for idx, (name, model) in enumerate(zip(data['names'], data['models'])):
+            atoms = slice(atom_bounds[idx], atom_bounds[idx + 1])
+            chain = Chain.from_arrays(
+                str(name), data['ids'][atoms],
+                (data['atom_name_codes'][atoms], data['atom_name_labels'].tolist()),
+                (data['resname_codes'][atoms], data['resname_labels'].tolist()),
+                data['resids'][atoms], data['coords'][atoms], model=str(model),
+                bfactors=data['bfactors'][atoms])
+            if data['has_angles'][idx]:
+                angles = slice(angle_bounds[idx], angle_bounds[idx + 1])
+                chain._phi_psi_angles = _arrays_to_angles(
+                    data['angle_resids'][angles], data['phi'][angles],
+                    data['psi'][angles])
+            chains.append(chain)
+        return chains
+
+    def record(self, filename, chains, selection=None):
+        """
+        Store the chains of a file in the cache while they are read.
+
+        The phi and psi angles of each chain are computed and kept on the
+        chain. The entry is written once all the chains are read.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the structure file.
+        chains : iterable of Chain
+            The chains read from the file.
+        selection : Selection, optional
+            The selection the file was read with.
+
+        Yields
+        ------
+        chain : Chain
+            The chains, as they are read.
+        """
+        stat = os.stat(filename)
+        pieces = []
+        for chain in chains:
+            try:
+                angles = chain.get_phi_psi_angles()
+            except FloatingPointError:
+                angles = None
+            else:
+                chain._phi_psi_angles = angles
+            pieces.append(self._backbone(chain, angles))
+            yield chain
+        data = self._merge(pieces)
+        data.update(version=CACHE_VERSION, size=stat.st_size,
+                    mtime=stat.st_mtime_ns, hash=content_hash(filename))
+        self._save(self.entry_path(filename, selection), data)
+        self.evict()
+
+    @staticmethod
+    def _backbone(chain, angles):
+        """
+        Extract the arrays of the backbone atoms of a chain.
+        """
+        mask = chain.atom_name_mask(BACKBONE_ATOMS)
+        piece = {
+            'name': chain.name,
+            'model': chain.model,
+            'ids': chain.ids[mask],
+            'atom_names': chain.atom_names[mask].astype(str),
+            'resnames': chain.resnames[mask].astype(str),
+            'resids': chain.resids[mask],
+            'coords': numpy.asarray(chain.coords[mask], dtype=float),
+            'bfactors': chain.bfactors[mask],
+            'has_angles': angles is not None,
+        }
+        if angles is None:
+            angles = {}
+        piece['angles'] = _angles_to_arrays(angles)
+        return piece
+
+    @staticmethod
+    def _merge(pieces):
+        """
+        Concatenate the arrays of several chains in the arrays of an entry.
+        """
+        def concatenate(key, dtype, shape=(0,)):
+            if not pieces:
+                return numpy.zeros(shape, dtype=dtype)
+            return numpy.concatenate([numpy.asarray(piece[key], dtype=dtype)
+                                      for piece in pieces])
+
+        data = {
+            'names': numpy.array([piece['name'] for piece in pieces], dtype=str),
+            'models': numpy.array([piece['model'] for piece in pieces], dtype=str),
+            'sizes': numpy.array([len(piece['ids']) for piece in pieces],
+                                 dtype=numpy.int64),
+            'has_angles': numpy.array([piece['has_angles'] for piece in pieces],
+                                      dtype=bool),
+            'ids': concatenate('ids', numpy.int64),
+            'resids': concatenate('resids', numpy.int64),
+            'coords': concatenate('coords', float, (0, 3)),
+            'bfactors': concatenate('bfactors', float),
+        }
+        for key in ('atom_names', 'resnames'):
+            labels, codes = numpy.unique(concatenate(key, str),
+                                         return_inverse=True)
+            prefix = 'atom_name' if key == 'atom_names' else 'resname'
+            data[prefix + '_codes'] = codes.reshape(-1).astype(numpy.int32)
+            data[prefix + '_labels'] = labels
+        data['nb_angles'] = numpy.array([len(piece['angles'][0])
+                                         for piece in pieces], dtype=numpy.int64)
+        for position, key in enumerate(('angle_resids', 'phi', 'psi')):
+            arrays = [piece['angles'][position] for piece in pieces]
+            data[key] = (numpy.concatenate(arrays) if arrays
+                         else numpy.zeros(0, dtype=float))
+        return data
+
+    @staticmethod
+    def _save(path, data):
+        """
+        Write an entry; a partial entry is never left in the cache.
+
+        Each writer has its own temporary file, so processes sharing the
+        cache do not write in the same file.
+        """
+        descriptor, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f_out:
+                numpy.savez_compressed(f_out, **data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def entries(self):
+        """
+        Give the paths of the entries, from the least to the most recently
+        used.
+        """
+        paths = [os.path.join(self.directory, name)
+                 for name in os.listdir(self.directory)
+                 if name.endswith(_ENTRY_EXTENSION)]
+        return sorted(paths, key=lambda path: os.stat(path).st_mtime_ns)
+
+    def size(self):
+        """
+        Give the size of the cache, in bytes.
+        """
+        return sum(os.path.getsize(path) for path in self.entries())
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is smaller than
+        its size limit.
+        """
+        paths = self.entries()
+        total = sum(os.path.getsize(path) for path in paths)
+        for path in paths:
+            if total <= self.max_size:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+    def clear(self):
+        """
+        Remove all the entries.
+        """
+        for path in self.entries():
+            os.remove(path)
@@ -0,0 +1,214 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Ensembles of models that share the same topology.
+
+The models of an NMR structure, or of any multi-model file, usually have the
+same atoms with different coordinates. An :class:`Ensemble` keeps the
+topology of the first model and stacks the coordinates of all the models in
+a ``(models, atoms, 3)`` array, so the dihedral angles of all the models are
+computed at once.
+"""
+
+# Third-party module
+import numpy
+
+# Local module
+from .structure import Chain, backbone_dihedrals
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def _same_topology(chain, other):
+    """
+    Tell if two chains have the same atoms, in the same order.
+    """
+    if (chain.size() != other.size()
+            or not numpy.array_equal(chain.resids, other.resids)):
+        return False
+    if chain._name_labels == other._name_labels:
+        names_equal = numpy.array_equal(chain._name_codes[:chain.size()],
+                                        other._name_codes[:other.size()])
+    else:
+        names_equal = numpy.array_equal(chain.atom_names, other.atom_names)
+    return names_equal
+
+
+def ensembles_from_chains(chains):
+    """
+    Gather the models of the same chains in ensembles.
+
+    Consecutive models of a chain go in the same ensemble as long as they
+    have the same topology; a model with different atoms starts a new
+    ensemble.
+
+    Parameters
+    ----------
+    chains : iterable of Chain
+        Chains, for instance as given by :meth:`PDB.get_chains`.
+
+    Yields
+    ------
+    ensemble : Ensemble
+        The ensembles, chain by chain. The ensemble of a chain is given when a
+        model with a different topology is met, or at the end of the chains.
+    """
+    builders = {}
+    for chain in chains:
+        builder = builders.get(chain.name)
+        if builder is not None and not _same_topology(builder[0], chain):
+            yield Ensemble(*builder)
+            builder = None
+        if builder is None:
+            builder = builders[chain.name] = (chain, [], [], [])
+        # Only the coordinates and B-factors of the next models are kept.
+        builder[1].append(chain.coords)
+        builder[2].append(chain.model)
+        builder[3].append(chain.bfactors)
+    for builder in builders.values():
+        yield Ensemble(*builder)
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+class Ensemble:
+    """
+    Models of a chain with the same topology and stacked coordinates.
+
+    Parameters
+    ----------
+    topology : Chain
+        The atoms of the models. Their coordinates are not used.
+    coords : list of numpy array or numpy array
+        The coordinates of each model, stacked as an array with a shape of
+        (models, atoms, 3).
+    models : list of str
+        The identifier of each model.
+    bfactors : list of numpy array or numpy array, optional
+        The B-factors, or pLDDT, of each model, stacked as an array with a
+        shape of (models, atoms). By default, the ones of the topology.
+
+    Raises
+    ------
+    ValueError
+        If the coordinates do not match the atoms of the topology, or if there
+        is not one identifier per model.
+    """
+    def __init__(self, topology, coords, models, bfactors=None):
+        self.topology = topology
+        self.coords = numpy.asarray(numpy.stack(coords) if isinstance(coords, list)
+                                    else coords)
+        self.models = list(models)
+        if bfactors is None:
+            bfactors = numpy.broadcast_to(topology.bfactors,
+                                          self.coords.shape[:2])
+        self.bfactors = numpy.asarray(numpy.stack(bfactors)
+                                      if isinstance(bfactors, list) else bfactors)
+        if (self.coords.shape[1:] != (topology.size(), 3)
+                or self.bfactors.shape != self.coords.shape[:2]):
+            raise ValueError("Coordinates array doesn't have the good shape.")
+        if len(self.models) != len(self.coords):
+            raise ValueError("There must be one identifier per model.")
+
+    @property
+    def name(self):
+        """
+        Name of the chain.
+        """
+        return self.topology.name
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __repr__(self):
+        return "Ensemble {0}: {1} models of {2} atoms".format(
+            self.name, len(self), self.topology.size())
+
+    def __iter__(self):
+        """
+        Give each model as a chain; the chains share the arrays of the
+        ensemble.
+        """
+        top = self.topology
+        for model, coords, bfactors in zip(self.models, self.coords,
+                                           self.bfactors):
+            yield Chain.from_arrays(
+                top.name, top.ids,
+                (top._name_codes[:top.size()], top._name_labels),
+                (top._resname_codes[:top.size()], top._resname_labels),
+                top.resids, coords, model=model, bfactors=bfactors)
+
+    def low_confidence_mask(self, threshold):
+        """
+        Tell which residues of each model have a confidence below a threshold.
+
+        As for :meth:`Chain.low_confidence_residues`, the confidence of a
+        residue is the B-factor of its CA atom.
+
+        Returns
+        -------
+        mask : numpy array of bool
+            An array with a shape of (models, residues), for the residues
+            given by :meth:`get_phi_psi_arrays`.
+        """
+        resids, (_, CA, _) = self.topology._backbone_indices()
+        mask = numpy.zeros((len(self), len(resids)), dtype=bool)
+        with_CA = CA >= 0
+        mask[:, with_CA] = self.bfactors[:, CA[with_CA]] < threshold
+        return mask
+
+    def get_phi_psi_arrays(self, dtype=float):
+        """
+        Compute the phi and psi angles of all the models at once.
+
+        Parameters
+        ----------
+        dtype : numpy dtype, optional
+            The precision of the computation of the angles.
+
+        Returns
+        -------
+        resids : numpy array of int
+            The residue numbers, sorted.
+        phi : numpy array
+            Phi angles with a shape of (models, residues). The angles that
+            cannot be computed because of missing atoms or residues are NaN.
+        psi : numpy array
+            Psi angles, as for `phi`.
+        valid : numpy array of bool
+            For each model, False if an angle could not be computed while all
+            its atoms are there. This typically means there are issues with
+            the coordinates of some residues.
+        """
+        resids, indices = self.topology._backbone_indices()
+        (phi, psi), (phi_defined, psi_defined) = backbone_dihedrals(
+            self.coords, resids, indices, dtype)
+        valid = ~(numpy.any(numpy.isnan(phi[:, phi_defined]), axis=1)
+                  | numpy.any(numpy.isnan(psi[:, psi_defined]), axis=1))
+        return resids, phi, psi, valid
+
+    def get_phi_psi_angles(self):
+        """
+        Compute the phi and psi angles of each model.
+
+        Returns
+        -------
+        phi_psi_angles : list of dict
+            For each model, the angles as given by
+            :meth:`Chain.get_phi_psi_angles`. The models whose angles cannot
+            be computed are None.
+        """
+        resids, phi, psi, valid = self.get_phi_psi_arrays()
+        all_angles = []
+        for model_phi, model_psi, model_valid in zip(phi, psi, valid):
+            if not model_valid:
+                all_angles.append(None)
+                continue
+            all_angles.append({
+                int(res): {'phi': None if numpy.isnan(phi_value) else float(phi_value),
+                           'psi': None if numpy.isnan(psi_value) else float(psi_value)}
+                for res, phi_value, psi_value in zip(resids, model_phi, model_psi)})
+        return all_angles
@@ -0,0 +1,472 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Index of the chains of structure files.
+
+The index gives, for each chain of a PDB or PDBx/mmCIF file, the position of
+its records in the file, its name and its model. It is built in one scan of
+the file that does not decode the coordinates, and it can be saved next to
+the file. The selected models and chains are then read directly from their
+position instead of parsing the file from its beginning.
+
+For gzip-compressed files, the index also stores decompression checkpoints if
+the optional `indexed_gzip` package is installed: the file can then be
+decompressed from the checkpoint before a chain instead of from its
+beginning.
+"""
+
+# Standard modules
+import io
+import os
+import gzip
+
+# Third-party module
+import numpy
+
+# Optional module
+try:
+    import indexed_gzip
+    IS_INDEXED_GZIP = True
+except ImportError:
+    IS_INDEXED_GZIP = False
+
+# Local modules
+from .structure import AtomError
+from .parsers import (PDBParser, PDBxParser, gather_columns, as_strings,
+                      pdbx_segments)
+
+
+# =============================================================================
+# Data
+# =============================================================================
+# Suffix added to the name of a structure file to save its index
+INDEX_SUFFIX = '.pbxindex'
+# Version of the index format, increased when the format changes
+INDEX_VERSION = 2
+# Distance between two decompression checkpoints of gzip files, in bytes of
+# decompressed content. Each checkpoint stores 32 kB.
+GZIP_SPACING = 1 << 23
+
+# Number of lines scanned at once in PDBx/mmCIF files
+_SCAN_LINES = 1 << 16
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def index_path(filename):
+    """
+    Give the path of the index saved for a structure file.
+    """
+    return filename + INDEX_SUFFIX
+
+
+def _is_compressed(filename):
+    """
+    Tell if a file is gzip-compressed from its extension.
+    """
+    return filename.endswith(('.gz', '.GZ'))
+
+
+def _file_signature(filename):
+    """
+    Give the size and the modification time of a file.
+
+    An index is only valid for the file with the same signature.
+    """
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+class _PDBIndexer(PDBParser):
+    """
+    Scan a PDB file for the position of its chains.
+
+    The chains are split exactly as :class:`PDBParser` does, but only the
+    chain names and the model numbers are decoded.
+    """
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+        self._start = 0
+        self._atom_models = None
+
+    def _select(self, buf, starts, stops, atom_lines, model_lines, models):
+        self._atom_models = self._model_numbers(atom_lines, model_lines, models)
+        return atom_lines
+
+    def _read_atoms(self, buf, starts, stops):
+        columns = gather_columns(buf, starts, stops, 21, 22)
+        return {'chains': as_strings(columns, 0, 1),
+                'models': self._atom_models}
+
+    @staticmethod
+    def _slice(atoms, start, stop, copy=False):
+        if stop == start:
+            return {'chain': None, 'size': 0, 'model_number': None}
+        return {'chain': atoms['chains'][start].decode().strip(),
+                'size': stop - start,
+                'model_number': int(atoms['models'][start])}
+
+    def _flush(self, end):
+        pieces = [piece for piece in self._pending if piece['size']]
+        self._pending = []
+        if not pieces:
+            return None
+        self.entries.append((self._start, end, pieces[0]['chain'],
+                             self._model, pieces[0]['model_number']))
+        self._start = end
+        self._model = ""
+        return None
+
+
+class _PDBxIndexer(PDBxParser):
+    """
+    Scan a PDBx/mmCIF file for the position of its chains.
+
+    The rows are tokenized as :class:`PDBxParser` does, but their values are
+    not converted. The position of a row goes from the beginning of the line
+    where it starts to the end of the line where it ends.
+    """
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+        self._bounds = []
+        self._line_start = 0
+        self._line_end = 0
+        self._row_start = 0
+        # Fields of the _atom_site loop; the fields of the parser are those of
+        # the last loop of the file.
+        self.fields = []
+
+    def _end_header(self):
+        super()._end_header()
+        self.fields = list(self._fields)
+
+    def scan(self, f_in):
+        """
+        Read a PDBx/mmCIF file opened in binary mode.
+        """
+        offset = 0
+        for nb_lines, line in enumerate(f_in, start=1):
+            self._line_start = offset
+            offset += len(line)
+            self._line_end = offset
+            self._read_line(line.decode())
+            if nb_lines % _SCAN_LINES == 0:
+                self._split(final=False)
+        if self._state == 'header' and self._fields:
+            self._end_header()
+        self._split(final=True)
+
+    def _read_line(self, line):
+        if not self._tokens and self._text is None:
+            # A row can start at the beginning of this line.
+            self._row_start = self._line_start
+        super()._read_line(line)
+        # The parser calls this method again for the first row of the loop,
+        # so the rows without a position are counted.
+        for _ in range(len(self._rows) - len(self._bounds)):
+            self._bounds.append((self._row_start, self._line_end))
+            # Another row read from the same line does not start at the
+            # beginning of a line.
+            self._row_start = -1
+
+    def _split(self, final):
+        if not self._rows:
+            return []
+        rows = list(zip(*self._rows))
+        chains = numpy.array(rows[4])
+        models = numpy.array(rows[9])
+        segments = pdbx_segments(chains, models, final)
+        for start, stop, model in segments:
+            begin = self._bounds[start][0]
+            if begin < 0:
+                raise AtomError("Cannot index a chain whose first row does "
+                                "not start a line")
+            self.entries.append((begin, self._bounds[stop - 1][1],
+                                 str(chains[start]), model,
+                                 int(models[start])))
+        if segments:
+            last = segments[-1][1]
+            del self._rows[:last]
+            del self._bounds[:last]
+        return []
+
+
+class StructureIndex:
+    """
+    Position of the chains in a structure file.
+
+    Each entry of the index is a chain, as it is read by :class:`PDB`: it
+    covers the bytes of the file between `starts` and `stops`, and gives the
+    name of the chain, its model as set on the chain, and the number of the
+    model it belongs to. For compressed files, the positions are in the
+    decompressed content.
+
+    Parameters
+    ----------
+    kind : str
+        Either 'PDB' or 'PDBx'.
+    starts, stops : array of int
+        Position of the first byte of each chain, and of the byte after it.
+    chains : array of str
+        Name of each chain.
+    models : array of str
+        Model of each chain.
+    model_numbers : array of int
+        Number of the model of each chain. Chains that come before any MODEL
+        record belong to model 1.
+    fields : list of str, optional
+        Fields of the _atom_site loop, for PDBx/mmCIF files.
+    signature : tuple of int, optional
+        Size and modification time of the indexed file.
+    checkpoints : bytes, optional
+        Decompression checkpoints of a gzip file, as exported by
+        `indexed_gzip`.
+
+    Examples
+    --------
+    >>> index = StructureIndex.build('ensemble.pdb')
+    >>> index.save(index_path('ensemble.pdb'))
+    >>> pdb = PDB('ensemble.pdb', selection=Selection(models='500-600'),
+    ...           index=index)
+    """
+    def __init__(self, kind, starts, stops, chains, models, model_numbers,
+                 fields=(), signature=(-1, -1), checkpoints=b''):
+        self.kind = kind
+        self.starts = numpy.asarray(starts, dtype=numpy.int64)
+        self.stops = numpy.asarray(stops, dtype=numpy.int64)
+        self.chains = numpy.asarray(chains, dtype=str)
+        self.models = numpy.asarray(models, dtype=str)
+        self.model_numbers = numpy.asarray(model_numbers, dtype=numpy.int64)
+        self.fields = [str(field) for field in fields]
+        self.signature = tuple(int(value) for value in signature)
+        self.checkpoints = bytes(checkpoints)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        return "<StructureIndex of a {0} file: {1} chain(s)>".format(
+            self.kind, len(self))
+
+    @classmethod
+    def scan(cls, f_in, kind):
+        """
+        Index a structure file.
+
+        Parameters
+        ----------
+        f_in : file
+            The file, opened in binary mode.
+        kind : str
+            Either 'PDB' or 'PDBx'.
+
+        Returns
+        -------
+        index : StructureIndex
+        """
+        # Imported here as the PDB module uses the index.
+        from .PDB import _blocks_of_lines
+        if kind == 'PDB':
+            indexer = _PDBIndexer()
+            for block in _blocks_of_lines(f_in):
+                indexer.feed(block)
+            indexer.close()
+        else:
+            indexer = _PDBxIndexer()
+            indexer.scan(f_in)
+        if indexer.entries:
+            starts, stops, chains, models, numbers = zip(*indexer.entries)
+        else:
+            starts = stops = chains = models = numbers = ()
+        return cls(kind, starts, stops, chains, models, numbers,
+                   fields=indexer.fields if kind == 'PDBx' else ())
+
+    @classmethod
+    def build(cls, filename):
+        """
+        Index a PDB or PDBx/mmCIF file, compressed or not.
+
+        The decompression checkpoints of gzip files are created during the
+        same scan, if `indexed_gzip` is installed.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the file.
+
+        Returns
+        -------
+        index : StructureIndex
+        """
+        from .PDB import PDB
+        pdb = PDB(filename)
+        if _is_compressed(filename) and IS_INDEXED_GZIP:
+            with indexed_gzip.IndexedGzipFile(filename,
+                                              spacing=GZIP_SPACING) as f_in:
+                index = cls.scan(f_in, pdb.kind)
+                checkpoints = io.BytesIO()
+                f_in.export_index(fileobj=checkpoints)
+            index.checkpoints = checkpoints.getvalue()
+        else:
+            with pdb._open('rb') as f_in:
+                index = cls.scan(f_in, pdb.kind)
+        index.signature = _file_signature(filename)
+        return index
+
+    def open(self, filename):
+        """
+        Open the indexed file for reading at the positions of the index.
+
+        Uncompressed files are opened as is. Compressed files are restarted
+        from the closest decompression checkpoint when the index has some;
+        otherwise, they are decompressed from their beginning at each seek
+        backward.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the indexed file.
+
+        Returns
+        -------
+        file
+            The file opened in binary mode.
+        """
+        if not _is_compressed(filename):
+            return open(filename, 'rb')
+        if self.checkpoints and IS_INDEXED_GZIP:
+            f_in = indexed_gzip.IndexedGzipFile(filename, spacing=GZIP_SPACING)
+            f_in.import_index(fileobj=io.BytesIO(self.checkpoints))
+            return f_in
+        return gzip.open(filename, 'rb')
+
+    def save(self, path):
+        """
+        Write the index to a file.
+
+        Parameters
+        ----------
+        path : str
+            Where to write the index, see :func:`index_path`.
+        """
+        with open(path, 'wb') as f_out:
+            numpy.savez(f_out, version=INDEX_VERSION, kind=self.kind,
+                        starts=self.starts, stops=self.stops,
+                        chains=self.chains, models=self.models,
+                        model_numbers=self.model_numbers,
+                        fields=numpy.array(self.fields, dtype=str),
+                        signature=numpy.array(self.signature,
+                                              dtype=numpy.int64),
+                        checkpoints=numpy.frombuffer(self.checkpoints,
+                                                     dtype=numpy.uint8))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an index written by :meth:`save`.
+
+        Raises
+        ------
+        ValueError
+            If the file is not an index in the current format.
+        """
+        with numpy.load(path, allow_pickle=False) as data:
+            if 'version' not in data or int(data['version']) != INDEX_VERSION:
+                raise ValueError("{0} is not a valid index".format(path))
+            return cls(str(data['kind']), data['starts'], data['stops'],
+                       data['chains'], data['models'], data['model_numbers'],
+                       fields=data['fields'].tolist(),
+                       signature=data['signature'].tolist(),
+                       checkpoints=data['checkpoints'].tobytes())
+
+    def is_valid_for(self, filename):
+        """
+        Tell if the index describes the current content of a file.
+
+        The size and modification time of the file are compared to the ones
+        of the indexed file.
+        """
+        return self.signature == _file_signature(filename)
+
+    def select(self, selection):
+        """
+        Give the entries of the chains matching a selection.
+
+        Parameters
+        ----------
+        selection : Selection or None
+            Only the chains and models of the selection are used.
+
+        Returns
+        -------
+        entries : numpy array of int
+            Indices of the matching chains, in file order.
+        """
+        keep = numpy.ones(len(self), dtype=bool)
+        if selection is not None:
+            keep &= selection.mask_models(self.model_numbers)
+            if selection.chains is not None:
+                keep &= numpy.isin(self.chains, list(selection.chains))
+        return numpy.flatnonzero(keep)
+
+    def ranges(self, entries):
+        """
+        Merge the positions of contiguous entries.
+
+        Parameters
+        ----------
+        entries : array of int
+            Indices of entries, in file order.
+
+        Returns
+        -------
+        ranges : list of tuple
+            The (start, stop) positions of the groups of contiguous entries.
+        """
+        ranges = []
+        for start, stop in zip(self.starts[entries], self.stops[entries]):
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], int(stop))
+            else:
+                ranges.append((int(start), int(stop)))
+        return ranges
+
+    def partition(self, entries, nb_parts):
+        """
+        Split entries in groups of whole models of about the same size.
+
+        Parameters
+        ----------
+        entries : array of int
+            Indices of entries, in file order.
+        nb_parts : int
+            The number of groups wanted. There are fewer groups when there
+            are not enough models.
+
+        Returns
+        -------
+        parts : list of numpy array of int
+            The entries of each group, in file order. A model is never split
+            between two groups.
+        """
+        entries = numpy.asarray(entries, dtype=numpy.int64)
+        if not len(entries):
+            return []
+        # a group can only start with the first chain of a model
+        first = numpy.ones(len(entries), dtype=bool)
+        numbers = self.model_numbers[entries]
+        first[1:] = numbers[1:] != numbers[:-1]
+        boundaries = numpy.flatnonzero(first)
+        offsets = numpy.concatenate(
+            [[0], numpy.cumsum(self.stops[entries] - self.starts[entries])])
+        targets = offsets[-1] * numpy.arange(1, nb_parts) / nb_parts
+        cuts = numpy.searchsorted(offsets[boundaries], targets)
+        cuts = numpy.unique(boundaries[cuts[cuts < len(boundaries)]])
+        return [part for part in numpy.split(entries, cuts) if len(part)]
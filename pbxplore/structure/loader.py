@@ -4,9 +4,14 @@
 
 import sys
 
+# Third-party module
+import numpy
+
 # Local module
 from .structure import Chain, Atom
-from .PDB import PDB
+from .PDB import PDB, open_stream
+from .ensemble import ensembles_from_chains
+from .archive import is_archive, archive_members
 
 
 # load MDAnalysis with limited support for Python 3
@@ -14,55 +19,346 @@ import warnings
 with warnings.catch_warnings():
     warnings.simplefilter("ignore")
     import MDAnalysis
+    from MDAnalysis.coordinates.core import get_reader_for
 
 
 # Create the __all__ keyword according to the conditional import
-__all__ = ['chains_from_files', 'chains_from_trajectory']
+__all__ = ['chains_from_files', 'ensembles_from_files', 'chains_from_trajectory',
+           'STDIN']
+
+# Path that stands for the standard input
+STDIN = '-'
+# Name of the standard input in the description of its chains
+_STDIN_NAME = 'stdin'
+# Atoms read from the trajectories
+TRAJECTORY_SELECTION = 'backbone'
+
+
+def _comment(pdb_name, chain):
+    """
+    Describe a chain with the name of its file, its model and its name.
+    """
+    comment = pdb_name
+    if chain.model:
+        comment += " | model %s" % (chain.model)
+    if chain.name:
+        comment += " | chain %s" % (chain.name)
+    return comment
+
 
+def _stdin_pdb(selection, stdin_format):
+    """
+    Give the standard input as a PDB, whose format is given or guessed.
+    """
+    extension, stream = open_stream(sys.stdin.buffer, stdin_format)
+    return PDB(_STDIN_NAME + extension, selection, fileobj=stream)
 
-def chains_from_files(path_list):
+
+def chains_from_files(path_list, selection=None, index=False, cache=None,
+                      stdin_format=None):
+    """
+    Read the chains of PDB, PDBx/mmCIF and BinaryCIF files.
+
+    Parameters
+    ----------
+    path_list : list of str
+        Paths to the files to read. A path can also be a tar or zip archive
+        (see :data:`ARCHIVE_EXTENSIONS`) whose structure files are read one
+        after the other, without extracting them, or :data:`STDIN` to read
+        the standard input. The index and the cache are not used for the
+        files of an archive nor for the standard input.
+    selection : Selection, optional
+        The atoms to read. By default, all the atoms are read.
+    index : bool, optional
+        If True, the chains and models of the selection are read from their
+        position in the index of each file. The index is saved next to the
+        file the first time it is built.
+    cache : StructureCache, optional
+        Cache of the backbone and phi and psi angles of the chains. The files
+        in the cache are not read again; the other ones are added to it. The
+        chains then only have their backbone atoms.
+    stdin_format : str, optional
+        The extension of the format of the standard input ('.pdb', '.cif'
+        or '.bcif'). By default, the format is guessed from its first bytes.
+
+    Yields
+    ------
+    comment : str
+        A description of the chain made of the file name, the model and the
+        chain name. For the files of an archive, the file name is the name of
+        the member in the archive, and the standard input is named 'stdin'.
+    chain : Chain
+        The chain.
+    """
     for pdb_name in path_list:
-        pdb = PDB(pdb_name)
-        for chain in pdb.get_chains():
-            # build comment
-            comment = pdb_name
-            if chain.model:
-                comment += " | model %s" % (chain.model)
-            if chain.name:
-                comment += " | chain %s" % (chain.name)
-            yield comment, chain
-
-        print("Read {0} chain(s) in {1}".format(pdb.nb_chains, pdb_name), file=sys.stderr)
-
-
-def chains_from_trajectory(trajectory, topology):
-    universe = MDAnalysis.Universe(topology, trajectory)
-    selection = universe.select_atoms("backbone")
-
-    #Initialize structure with the selection
-    structure = Chain()
-    for atm in selection:
-        atom = Atom.read_from_xtc(atm)
-        # append structure with atom
-        structure.add_atom(atom)
-
-    nb_frames = len(universe.trajectory)
-
-    # Print the first frame
-    print("Frame {}/{}.".format(1, nb_frames), file=sys.stderr)
-
-    for ts in universe.trajectory:
-        #Update only with new coordinates
-        structure.set_coordinates(selection.positions)
-
-        # define structure comment
-        comment = "%s | frame %s" % (trajectory, ts.frame)
-        yield comment, structure
-
-        # Progress bar
-        # Print one frame every 100.
-        if ((ts.frame + 1) % 100 == 0):
-            print("Frame {}/{}.".format(ts.frame + 1, nb_frames), file=sys.stderr)
-
-    # Print the last frame
-    print("Frame {}/{}.".format(nb_frames, nb_frames), file=sys.stderr)
+        if pdb_name == STDIN:
+            nb_chains = 0
+            for chain in _stdin_pdb(selection, stdin_format).get_chains():
+                nb_chains += 1
+                yield _comment(_STDIN_NAME, chain), chain
+            print("Read {0} chain(s) in {1}".format(nb_chains, _STDIN_NAME),
+                  file=sys.stderr)
+            continue
+        if is_archive(pdb_name):
+            nb_chains = 0
+            nb_files = 0
+            for member_name, f_in in archive_members(pdb_name):
+                nb_files += 1
+                pdb = PDB(member_name, selection, fileobj=f_in)
+                for chain in pdb.get_chains():
+                    nb_chains += 1
+                    yield _comment(member_name, chain), chain
+            print("Read {0} chain(s) in {1} file(s) from {2}"
+                  .format(nb_chains, nb_files, pdb_name), file=sys.stderr)
+            continue
+        chains = None
+        if cache is not None:
+            chains = cache.read(pdb_name, selection)
+        if chains is None:
+            pdb = PDB(pdb_name, selection, index=index)
+            chains = pdb.get_chains()
+            if cache is not None:
+                chains = cache.record(pdb_name, chains, selection)
+        nb_chains = 0
+        for chain in chains:
+            nb_chains += 1
+            yield _comment(pdb_name, chain), chain
+
+        print("Read {0} chain(s) in {1}".format(nb_chains, pdb_name), file=sys.stderr)
+
+
+def ensembles_from_files(path_list, selection=None, index=False,
+                         stdin_format=None):
+    """
+    Read the models of PDB, PDBx/mmCIF and BinaryCIF files as ensembles.
+
+    The models of a chain with the same atoms are gathered in an
+    :class:`Ensemble`, whose coordinates are stacked so the angles and the
+    protein blocks of all the models are computed at once.
+
+    Parameters
+    ----------
+    path_list : list of str
+        Paths to the files to read, as for :func:`chains_from_files`.
+    selection : Selection, optional
+        The atoms to read. By default, all the atoms are read.
+    index : bool, optional
+        If True, the chains and models of the selection are read from the
+        index of each file.
+    stdin_format : str, optional
+        The extension of the format of the standard input, as for
+        :func:`chains_from_files`.
+
+    Yields
+    ------
+    comments : list of str
+        The description of each model of the ensemble, as given by
+        :func:`chains_from_files`.
+    ensemble : Ensemble
+        The ensemble. The ensembles of a file are given chain by chain.
+    """
+    for pdb_name in path_list:
+        if pdb_name == STDIN:
+            members = [(_STDIN_NAME, _stdin_pdb(selection, stdin_format))]
+        elif is_archive(pdb_name):
+            members = ((member_name, PDB(member_name, selection, fileobj=f_in))
+                       for member_name, f_in in archive_members(pdb_name))
+        else:
+            members = [(pdb_name, PDB(pdb_name, selection, index=index))]
+        nb_models = 0
+        for member_name, pdb in members:
+            for ensemble in ensembles_from_chains(pdb.get_chains()):
+                nb_models += len(ensemble)
+                comments = [_comment(member_name, chain) for chain in ensemble]
+                yield comments, ensemble
+        print("Read {0} chain(s) in {1}".format(
+            nb_models, _STDIN_NAME if pdb_name == STDIN else pdb_name),
+            file=sys.stderr)
+
+
+def _split_selection(universe, selection, split):
+    """
+    Split the atoms of a selection in chains.
+
+    Returns
+    -------
+    groups : list of tuple
+        The name of each chain, and the indices of its atoms in the selection.
+
+    Raises
+    ------
+    ValueError
+        If the topology does not define the attribute to split by, or if a
+        selection has no atom.
+    """
+    if split in ('segid', 'chainID'):
+        try:
+            values = numpy.asarray(getattr(selection, split + 's'))
+        except AttributeError:
+            raise ValueError("The topology does not define the {0} of the "
+                             "atoms".format(split))
+        names, firsts = numpy.unique(values, return_index=True)
+        return [(str(name), numpy.flatnonzero(values == name))
+                for name in names[numpy.argsort(firsts)]]
+    groups = []
+    for query in split:
+        indices = numpy.flatnonzero(numpy.isin(
+            selection.indices, universe.select_atoms(query).indices))
+        if not len(indices):
+            raise ValueError("No backbone atom in the selection '{0}'"
+                             .format(query))
+        groups.append((query, indices))
+    return groups
+
+
+def _trajectory_topology(universe, split):
+    """
+    Select the backbone atoms of a topology, and split them in chains.
+
+    Returns
+    -------
+    data : dict of numpy array
+        The number of atoms of the topology ('n_atoms'); the index in the
+        topology ('indices'), the number, name, residue name and residue
+        number of the selected atoms, chain after chain; and the name and
+        the number of atoms of each chain ('chain_names' and 'chain_sizes').
+    """
+    selection = universe.select_atoms(TRAJECTORY_SELECTION)
+    if split is None:
+        groups = [("", numpy.arange(len(selection)))]
+    else:
+        groups = _split_selection(universe, selection, split)
+    atoms = selection[numpy.concatenate([indices for _, indices in groups])]
+    return {
+        'n_atoms': len(universe.atoms),
+        'indices': atoms.indices,
+        'ids': atoms.ids,
+        'atom_names': numpy.asarray(atoms.names, dtype=str),
+        'resnames': numpy.asarray(atoms.resnames, dtype=str),
+        'resids': atoms.resids,
+        'chain_names': numpy.array([name for name, _ in groups], dtype=str),
+        'chain_sizes': numpy.array([len(indices) for _, indices in groups]),
+    }
+
+
+def _trajectory_chains(data):
+    """
+    Build the chains of the atoms selected in a topology, without coordinates.
+
+    Returns
+    -------
+    chains : list of tuple
+        The slice of the atoms of each chain in the selection, and the chain.
+    """
+    names, name_codes = numpy.unique(data['atom_names'], return_inverse=True)
+    resnames, resname_codes = numpy.unique(data['resnames'], return_inverse=True)
+    bounds = numpy.cumsum(numpy.insert(data['chain_sizes'], 0, 0))
+    chains = []
+    for name, start, stop in zip(data['chain_names'], bounds[:-1], bounds[1:]):
+        atoms = slice(start, stop)
+        chains.append((atoms, Chain.from_arrays(
+            str(name), data['ids'][atoms],
+            (name_codes.reshape(-1)[atoms], names.tolist()),
+            (resname_codes.reshape(-1)[atoms], resnames.tolist()),
+            data['resids'][atoms], numpy.zeros((stop - start, 3)))))
+    return chains
+
+
+def chains_from_trajectory(trajectory, topology, split=None, cache=None):
+    """
+    Read the chains of the frames of a trajectory.
+
+    Parameters
+    ----------
+    trajectory : str
+        Path to the trajectory, in any format read by MDAnalysis.
+    topology : str
+        Path to the topology.
+    split : str or list of str, optional
+        How to split the backbone atoms in chains: 'segid' or 'chainID' to
+        make one chain per value of this attribute, or a list of MDAnalysis
+        selections to make one chain with the backbone atoms of each
+        selection. By default, all the backbone atoms are in one chain
+        without name.
+    cache : StructureCache, optional
+        Cache of the backbone atoms of the topologies. When the topology is
+        in the cache, the trajectory is read without reading the topology;
+        otherwise the selected atoms are added to the cache.
+
+    Yields
+    ------
+    comment : str
+        A description of the chain made of the trajectory name, the frame
+        and, when the atoms are split, the chain name (the value of the
+        attribute or the selection).
+    chain : Chain
+        The chain. The same chains are given for each frame, with the
+        coordinates of the frame. The coordinates are not copied: they are
+        overwritten by the next frame, copy them to keep them.
+
+    Raises
+    ------
+    ValueError
+        If the atoms cannot be split as requested, or if the trajectory does
+        not have the atoms of the topology.
+    """
+    key = "{0}\n{1}".format(TRAJECTORY_SELECTION, split)
+    data = None
+    if cache is not None:
+        data = cache.read_topology(topology, key)
+    if data is None:
+        universe = MDAnalysis.Universe(topology, trajectory)
+        data = _trajectory_topology(universe, split)
+        if cache is not None:
+            cache.record_topology(topology, key, data)
+        reader = universe.trajectory
+    else:
+        # The selected atoms are known: the topology is not read.
+        reader = get_reader_for(trajectory)(trajectory)
+    try:
+        # The trajectory must have the atoms of the topology.
+        if reader.n_atoms != data['n_atoms']:
+            raise ValueError("The trajectory {0} has {1} atoms instead of the "
+                             "{2} atoms of the topology".format(
+                                 trajectory, reader.n_atoms, data['n_atoms']))
+
+        #Initialize structures with the selection, once for all the frames
+        structures = _trajectory_chains(data)
+        indices = data['indices']
+        # A contiguous selection is a view on the coordinates of the frame.
+        contiguous = len(indices) > 0 and bool(numpy.all(numpy.diff(indices) == 1))
+        positions = None
+
+        nb_frames = len(reader)
+
+        # Print the first frame
+        print("Frame {}/{}.".format(1, nb_frames), file=sys.stderr)
+
+        for ts in reader:
+            # The coordinates of all the chains are gathered at once: the chains
+            # use views on them, so no copy is made for each chain.
+            if contiguous:
+                positions = ts.positions[indices[0]:indices[0] + len(indices)]
+            else:
+                if positions is None or positions.dtype != ts.positions.dtype:
+                    positions = numpy.empty((len(indices), 3), ts.positions.dtype)
+                numpy.take(ts.positions, indices, axis=0, out=positions)
+            for atoms, structure in structures:
+                #Update only with new coordinates
+                structure.set_coordinates(positions[atoms], copy=False)
+
+                # define structure comment
+                comment = "%s | frame %s" % (trajectory, ts.frame)
+                if split is not None:
+                    comment += " | chain %s" % (structure.name)
+                yield comment, structure
+
+            # Progress bar
+            # Print one frame every 100.
+            if ((ts.frame + 1) % 100 == 0):
+                print("Frame {}/{}.".format(ts.frame + 1, nb_frames), file=sys.stderr)
+
+        # Print the last frame
+        print("Frame {}/{}.".format(nb_frames, nb_frames), file=sys.stderr)
+    finally:
+        reader.close()
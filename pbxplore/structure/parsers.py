@@ -0,0 +1,790 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bulk parsers for structure files.
+
+The parsers read the coordinate records of a structure file as bytes and
+decode the columns of all the atoms at once into arrays. The chains are built
+from these arrays with :meth:`Chain.from_arrays`, without creating any
+:class:`Atom` object.
+"""
+
+# Standard modules
+import re
+import operator
+
+# Third-party module
+import numpy
+
+# Local module
+from .structure import AtomError, Chain
+
+
+# =============================================================================
+# Data
+# =============================================================================
+# Number of lines processed at once when gathering columns. It limits the size
+# of the temporary index arrays.
+CHUNK_SIZE = 65536
+
+# Record names as they appear in the 6 first columns of a PDB line
+_ATOM = b'ATOM  '
+_MODEL = b'MODEL '
+_TER = b'TER   '
+_ENDMDL = b'ENDMDL'
+
+# Fields of the _atom_site category read from PDBx/mmCIF files
+_PDBX_FIELDS = ('group_PDB', 'id', 'label_atom_id', 'label_comp_id',
+                'label_asym_id', 'label_seq_id', 'Cartn_x', 'Cartn_y',
+                'Cartn_z', 'pdbx_PDB_model_num')
+# Field read when it is there: the B-factor, or the pLDDT of predicted models
+_PDBX_BFACTOR = 'B_iso_or_equiv'
+# Values of a PDBx/mmCIF field that is unknown or not applicable
+_PDBX_MISSING = ('?', '.')
+# Keywords that end a loop in a PDBx/mmCIF file
+_PDBX_KEYWORDS = ('_', 'loop_', 'data_', 'save_', 'global_', 'stop_')
+# A PDBx/mmCIF token: a quoted string, closed by a quote followed by a white
+# space or the end of the line, or a sequence of non-blank characters.
+_PDBX_TOKEN = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+
+# Event kinds used to split the atoms in chains
+_EVENT_MODEL = 0
+_EVENT_END = 1
+_EVENT_CHANGE = 2
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def split_lines(data):
+    """
+    Locate the lines in a block of bytes.
+
+    Parameters
+    ----------
+    data : bytes
+        The content to split.
+
+    Returns
+    -------
+    buf : numpy array of uint8
+        The content as an array.
+    starts : numpy array of int
+        The index of the first character of each line.
+    stops : numpy array of int
+        The index of the end of each line, new line character excluded.
+    """
+    buf = numpy.frombuffer(data, dtype=numpy.uint8)
+    stops = numpy.flatnonzero(buf == ord('\n'))
+    if len(buf) and buf[-1] != ord('\n'):
+        stops = numpy.append(stops, len(buf))
+    starts = numpy.empty_like(stops)
+    starts[:1] = 0
+    starts[1:] = stops[:-1] + 1
+    return buf, starts, stops
+
+
+def gather_columns(buf, starts, stops, first, last):
+    """
+    Extract the same columns from several lines.
+
+    Parameters
+    ----------
+    buf : numpy array of uint8
+        The content the lines are read from.
+    starts : numpy array of int
+        The index of the first character of each line.
+    stops : numpy array of int
+        The index of the end of each line, new line character excluded.
+    first : int
+        The first column to extract.
+    last : int
+        The column after the last one to extract.
+
+    Returns
+    -------
+    columns : numpy array of uint8
+        A 2D array with one row per line and one column per extracted
+        column. Columns beyond the end of a line, and tabulations or carriage
+        returns, are replaced by spaces.
+    """
+    width = last - first
+    columns = numpy.empty((len(starts), width), dtype=numpy.uint8)
+    offsets = numpy.arange(first, last)
+    padding = (stops - starts < last).any()
+    for begin in range(0, len(starts), CHUNK_SIZE):
+        end = begin + CHUNK_SIZE
+        idx = starts[begin:end, None] + offsets
+        if not padding:
+            columns[begin:end] = buf[idx]
+            continue
+        inside = idx < stops[begin:end, None]
+        chunk = buf[numpy.where(inside, idx, 0)]
+        chunk[~inside] = ord(' ')
+        columns[begin:end] = chunk
+    columns[(columns == ord('\t')) | (columns == ord('\r'))] = ord(' ')
+    return columns
+
+
+def as_strings(columns, first, last):
+    """
+    View a range of gathered columns as an array of byte strings.
+    """
+    width = last - first
+    block = numpy.ascontiguousarray(columns[:, first:last])
+    return block.view('S{}'.format(width)).reshape(len(columns))
+
+
+def as_categories(strings):
+    """
+    Encode an array of strings as integer codes and stripped labels.
+
+    Returns
+    -------
+    codes : numpy array of int
+        The index of each string in `labels`.
+    labels : list of str
+        The distinct stripped values.
+    """
+    values, codes = numpy.unique(strings, return_inverse=True)
+    if values.dtype.kind == 'S':
+        values = [value.decode() for value in values]
+    labels = [value.strip() for value in values]
+    return codes.reshape(len(strings)).astype(numpy.int32), labels
+
+
+def match_strings(strings, allowed):
+    """
+    Tell which strings are in a set once stripped.
+
+    Parameters
+    ----------
+    strings : numpy array of bytes
+        The strings to test, as read from fixed columns.
+    allowed : set of str
+        The accepted values.
+
+    Returns
+    -------
+    mask : numpy array of bool
+        True for the strings in `allowed`.
+    """
+    values, inverse = numpy.unique(strings, return_inverse=True)
+    keep = numpy.array([value.decode().strip() in allowed for value in values],
+                       dtype=bool)
+    return keep[inverse.reshape(len(strings))]
+
+
+def _concatenate_pieces(pieces):
+    """
+    Merge pieces of chain arrays read from successive blocks.
+    """
+    if len(pieces) == 1:
+        return pieces[0]
+    merged = {}
+    for key in ('ids', 'resids', 'coords', 'bfactors'):
+        merged[key] = numpy.concatenate([piece[key] for piece in pieces])
+    for key in ('names', 'resnames'):
+        codes = []
+        labels = []
+        for piece in pieces:
+            piece_codes, piece_labels = piece[key]
+            codes.append(piece_codes + len(labels))
+            labels += piece_labels
+        merged[key] = (numpy.concatenate(codes), labels)
+    merged['chain'] = pieces[0]['chain']
+    return merged
+
+
+class PDBParser:
+    """
+    Bulk parser for the ATOM records of PDB files.
+
+    The content of a file is given to :meth:`feed` as bytes, in one or several
+    blocks made of complete lines. The fixed columns of all the ATOM records
+    of a block are decoded at once. The atoms are split in chains the same
+    way as the line by line reader: a new chain starts when the chain name
+    changes, and after a TER or an ENDMDL record. A MODEL record sets the
+    model of the chain being read.
+
+    Parameters
+    ----------
+    selection : Selection, optional
+        The atoms to read. The ATOM records that do not match are skipped
+        before their coordinates are decoded.
+
+    Examples
+    --------
+    >>> parser = PDBParser()
+    >>> chains = parser.feed(open('structure.pdb', 'rb').read())
+    >>> chains += parser.close()
+    """
+    def __init__(self, selection=None):
+        self.selection = selection
+        # Arrays of the chain being read that come from the previous blocks.
+        self._pending = []
+        self._model = ""
+        # Number of the model being read, used for the selection
+        self._model_number = 1
+        # Number of bytes already parsed
+        self._offset = 0
+
+    @staticmethod
+    def _check_lengths(buf, starts, stops):
+        """
+        Make sure ATOM lines are long enough to be decoded.
+
+        Raises
+        ------
+        AtomError
+            If a line is too short.
+        """
+        # The line by line reader accounts for the new line character in the
+        # length of the line.
+        lengths = stops - starts + (stops < len(buf))
+        short = numpy.flatnonzero(lengths < 55)
+        if len(short):
+            line = bytes(buf[starts[short[0]]:stops[short[0]] + 1])
+            raise AtomError("ATOM line too short:\n{0}".format(line.decode()))
+
+    def _select(self, buf, starts, stops, atom_lines, model_lines, models):
+        """
+        Keep the ATOM lines that match the selection.
+
+        Only the columns needed by the selection are read.
+        """
+        selection = self.selection
+        if selection is None:
+            return atom_lines
+        keep = numpy.ones(len(atom_lines), dtype=bool)
+        if selection.models is not None:
+            keep &= selection.mask_models(
+                self._model_numbers(atom_lines, model_lines, models))
+        if selection.atom_names is not None:
+            names = gather_columns(buf, starts[atom_lines], stops[atom_lines],
+                                   12, 16)
+            keep &= match_strings(as_strings(names, 0, 4), selection.atom_names)
+        if selection.chains is not None:
+            chains = gather_columns(buf, starts[atom_lines], stops[atom_lines],
+                                    21, 22)
+            keep &= match_strings(as_strings(chains, 0, 1), selection.chains)
+        return atom_lines[keep]
+
+    def _model_numbers(self, atom_lines, model_lines, models):
+        """
+        Give the number of the model each ATOM line belongs to.
+        """
+        numbers = numpy.array([self._model_number]
+                              + [int(model) for model in models])
+        self._model_number = numbers[-1]
+        return numbers[numpy.searchsorted(model_lines, atom_lines)]
+
+    @staticmethod
+    def _read_atoms(buf, starts, stops):
+        """
+        Decode the fixed columns of ATOM lines.
+
+        The B-factor column is optional; it is 0 when it is blank or is not
+        a number.
+        """
+        columns = gather_columns(buf, starts, stops, 0, 66)
+        coords = as_strings(columns, 30, 54).view('S8').reshape(-1, 3)
+        bfactors = as_strings(columns, 60, 66).copy()
+        bfactors[(columns[:, 60:66] == ord(' ')).all(axis=1)] = b'0'
+        return {
+            'ids': as_strings(columns, 6, 11).astype(int),
+            'names': as_categories(as_strings(columns, 12, 16)),
+            'resnames': as_categories(as_strings(columns, 17, 20)),
+            'chains': as_strings(columns, 21, 22),
+            'resids': as_strings(columns, 22, 26).astype(int),
+            'coords': coords.astype(float),
+            'bfactors': _convert_bfactors(bfactors),
+        }
+
+    def feed(self, data):
+        """
+        Parse a block of complete lines.
+
+        Parameters
+        ----------
+        data : bytes
+            A block of the file. It must end at the end of a line.
+
+        Returns
+        -------
+        chains : list of Chain
+            The chains completed in this block.
+
+        Raises
+        ------
+        AtomError
+            If an ATOM line is too short.
+        """
+        buf, starts, stops = split_lines(data)
+        records = as_strings(gather_columns(buf, starts, stops, 0, 6), 0, 6)
+        atom_lines = numpy.flatnonzero(records == _ATOM)
+        self._check_lengths(buf, starts[atom_lines], stops[atom_lines])
+        model_lines = numpy.flatnonzero(records == _MODEL)
+        models = [bytes(buf[starts[line_idx]:stops[line_idx]]).decode().split()[1]
+                  for line_idx in model_lines]
+        atom_lines = self._select(buf, starts, stops, atom_lines,
+                                  model_lines, models)
+        atoms = self._read_atoms(buf, starts[atom_lines], stops[atom_lines])
+
+        # The events that can end a chain or set its model, in file order.
+        events = []
+        for line_idx, model in zip(model_lines, models):
+            events.append((line_idx, _EVENT_MODEL, model))
+        for line_idx in numpy.flatnonzero((records == _TER)
+                                          | (records == _ENDMDL)):
+            events.append((line_idx, _EVENT_END, None))
+        chains = atoms['chains']
+        changes = numpy.flatnonzero(chains[1:] != chains[:-1]) + 1
+        if (self._pending and len(chains)
+                and chains[0].decode().strip() != self._pending[0]['chain']):
+            changes = numpy.insert(changes, 0, 0)
+        for atom_idx in changes:
+            events.append((atom_lines[atom_idx], _EVENT_CHANGE, atom_idx))
+        events.sort(key=lambda event: event[0])
+
+        completed = []
+        start = 0
+        for line_idx, kind, value in events:
+            if kind == _EVENT_MODEL:
+                self._model = value
+                continue
+            # The next chain starts at the first atom of another chain, or
+            # after the TER or ENDMDL record.
+            if kind == _EVENT_CHANGE:
+                stop = value
+                end = starts[atom_lines[value]]
+            else:
+                stop = numpy.searchsorted(atom_lines, line_idx)
+                end = stops[line_idx] + 1
+            self._pending.append(self._slice(atoms, start, stop))
+            chain = self._flush(self._offset + int(end))
+            if chain is not None:
+                completed.append(chain)
+            start = stop
+        if start < len(atom_lines):
+            # Copy the arrays of the open chain so they do not keep the
+            # arrays of the whole block alive.
+            self._pending.append(self._slice(atoms, start, len(atom_lines),
+                                             copy=True))
+        self._offset += len(data)
+        return completed
+
+    def close(self):
+        """
+        Give the last chain of the file.
+
+        Returns
+        -------
+        chains : list of Chain
+            The chain being read if it has atoms.
+        """
+        chain = self._flush(self._offset)
+        if chain is None:
+            return []
+        return [chain]
+
+    @staticmethod
+    def _slice(atoms, start, stop, copy=False):
+        """
+        Extract the arrays of the atoms between `start` and `stop`.
+        """
+        def extract(array):
+            if copy:
+                return array[start:stop].copy()
+            return array[start:stop]
+
+        piece = {}
+        for key in ('ids', 'resids', 'coords', 'bfactors'):
+            piece[key] = extract(atoms[key])
+        for key in ('names', 'resnames'):
+            codes, labels = atoms[key]
+            piece[key] = (extract(codes), labels)
+        if stop > start:
+            piece['chain'] = atoms['chains'][start].decode().strip()
+        else:
+            piece['chain'] = None
+        return piece
+
+    def _flush(self, end):
+        """
+        Build the chain being read, if it has atoms, and start a new one.
+
+        `end` is the position in the file where the next chain starts. It is
+        only used to index the file (see :mod:`pbxplore.structure.index`).
+        """
+        pieces = [piece for piece in self._pending if len(piece['ids'])]
+        self._pending = []
+        if not pieces:
+            return None
+        arrays = _concatenate_pieces(pieces)
+        chain = Chain.from_arrays(arrays['chain'], arrays['ids'],
+                                  arrays['names'], arrays['resnames'],
+                                  arrays['resids'], arrays['coords'],
+                                  model=self._model,
+                                  bfactors=arrays['bfactors'])
+        self._model = ""
+        return chain
+
+
+def _convert(values, kind):
+    """
+    Convert a sequence of strings to an array of int or float.
+    """
+    return numpy.fromiter(map(kind, values), kind, len(values))
+
+
+def _convert_bfactors(values):
+    """
+    Convert the B-factor columns of PDB lines to an array of float; the
+    values that are not numbers are 0.
+    """
+    try:
+        return values.astype(float)
+    except ValueError:
+        bfactors = numpy.zeros(len(values))
+        for idx, value in enumerate(values):
+            try:
+                bfactors[idx] = float(value)
+            except ValueError:
+                pass
+        return bfactors
+
+
+def _convert_optional(values):
+    """
+    Convert a sequence of strings to an array of float; unknown values are 0.
+    """
+    return numpy.fromiter((0.0 if value in _PDBX_MISSING else float(value)
+                           for value in values), float, len(values))
+
+
+def _encode(values):
+    """
+    Encode a sequence of strings as integer codes and labels.
+    """
+    index = {value: code for code, value in enumerate(set(values))}
+    codes = numpy.fromiter(map(index.__getitem__, values), numpy.int32,
+                           len(values))
+    return codes, list(index)
+
+
+def pdbx_segments(chains, models, final):
+    """
+    Split the atoms of a PDBx/mmCIF file in chains.
+
+    A new chain starts when the chain name or the model number changes. The
+    model of a chain is the one of its second atom; it is only kept when the
+    next chain belongs to another model.
+
+    Parameters
+    ----------
+    chains : numpy array of str
+        Chain name of each atom.
+    models : numpy array of str
+        Model number of each atom.
+    final : bool
+        Whether the last atom of the file is known. If not, the last chain is
+        not returned as its model depends on the next one.
+
+    Returns
+    -------
+    segments : list of tuple
+        The (start, stop, model) of each chain, as atom indices and model
+        string.
+    """
+    nb_atoms = len(chains)
+    chain_changes = numpy.flatnonzero(chains[1:] != chains[:-1]) + 1
+    model_changes = numpy.flatnonzero(models[1:] != models[:-1]) + 1
+    segments = []
+    start = 0
+    while start < nb_atoms:
+        # Within a chain, the model is the one of its second atom.
+        next_chain = chain_changes[numpy.searchsorted(chain_changes, start,
+                                                      side='right'):]
+        next_model = model_changes[numpy.searchsorted(model_changes,
+                                                      start + 2):]
+        stop = min(next_chain[:1].tolist() + next_model[:1].tolist()
+                   + [nb_atoms])
+        if stop == nb_atoms:
+            if not final:
+                break
+            model = models[start + 1] if stop - start > 1 else ""
+        else:
+            model = models[start + 1] if stop - start > 1 else models[stop]
+            if chains[stop] != chains[start] and model == models[stop]:
+                model = ""
+        segments.append((start, stop, str(model)))
+        start = stop
+    return segments
+
+
+def tokenize_pdbx_line(line):
+    """
+    Split a line of a PDBx/mmCIF file in tokens.
+
+    Values may be quoted with single or double quotes. A quote only closes a
+    value when it is followed by a white space or the end of the line, so
+    quotes can be part of a value.
+
+    Parameters
+    ----------
+    line : str
+        The line to split.
+
+    Returns
+    -------
+    tokens : list of str
+        The values in the line, without their quotes.
+
+    Examples
+    --------
+    >>> tokenize_pdbx_line("ATOM 1 \"O5'\" 'A B' C'")
+    ['ATOM', '1', "O5'", 'A B', "C'"]
+    """
+    if "'" not in line and '"' not in line:
+        return line.split()
+    return [single or double or bare
+            for single, double, bare in _PDBX_TOKEN.findall(line)]
+
+
+class PDBxParser:
+    """
+    Streaming parser for the _atom_site loop of PDBx/mmCIF files.
+
+    The lines of a file are given to :meth:`feed`, in one or several blocks.
+    The position of the required fields in the loop is resolved once from the
+    loop header; for each ATOM row, only the values of these fields are kept,
+    in one list per field. Raw lines are not stored. The atoms are split in
+    chains the same way as the line by line reader: a new chain starts when
+    the chain name or the model number changes. The model is only kept for a
+    chain when the next chain belongs to another model.
+
+    Parameters
+    ----------
+    selection : Selection, optional
+        The atoms to read. The rows that do not match are skipped before their
+        values are converted.
+
+    Examples
+    --------
+    >>> parser = PDBxParser()
+    >>> chains = parser.feed(open('structure.cif'))
+    >>> chains += parser.close()
+    """
+    def __init__(self, selection=None):
+        self.selection = selection
+        self._keep = None
+        # Where we are in the file: looking for the _atom_site loop
+        # ('search'), reading its header ('header'), or its rows ('rows').
+        self._state = 'search'
+        self._fields = []
+        self._getter = None
+        self._nb_fields = 0
+        # Tokens of an incomplete row, and lines of a text field
+        self._tokens = []
+        self._text = None
+        # Values of the required fields for the atoms not yet in a chain
+        self._rows = []
+
+    def _end_header(self):
+        """
+        Resolve the position of the required fields in the loop.
+
+        Raises
+        ------
+        AtomError
+            If a required field is missing.
+        """
+        missing = [field for field in _PDBX_FIELDS if field not in self._fields]
+        if missing:
+            raise AtomError("Missing field(s) in _atom_site: {0}"
+                            .format(", ".join(missing)))
+        self._nb_fields = len(self._fields)
+        fields = list(_PDBX_FIELDS)
+        if _PDBX_BFACTOR in self._fields:
+            fields.append(_PDBX_BFACTOR)
+        self._getter = operator.itemgetter(*[self._fields.index(field)
+                                             for field in fields])
+        self._keep = self._row_filter()
+        self._state = 'rows'
+
+    def start_rows(self, fields):
+        """
+        Read the rows of an _atom_site loop whose header is already known.
+
+        This allows to parse a part of a file that starts in the middle of
+        the loop.
+
+        Parameters
+        ----------
+        fields : list of str
+            Names of the fields of the loop, without the category.
+        """
+        self._fields = list(fields)
+        self._end_header()
+
+    def _row_filter(self):
+        """
+        Build the function that tells if a row is an atom to read.
+        """
+        selection = self.selection
+        if selection is None:
+            return lambda row: row[0] == 'ATOM'
+        names = selection.atom_names
+        chains = selection.chains
+        models = {}
+
+        def match_model(model):
+            if model not in models:
+                models[model] = selection.match_model(int(model))
+            return models[model]
+
+        def keep(row):
+            return (row[0] == 'ATOM'
+                    and (names is None or row[2] in names)
+                    and (chains is None or row[4] in chains)
+                    and match_model(row[9]))
+        return keep
+
+    def _add_tokens(self, tokens):
+        """
+        Add tokens to the current row, and store the completed rows.
+        """
+        self._tokens += tokens
+        while len(self._tokens) >= self._nb_fields:
+            row = self._getter(self._tokens)
+            del self._tokens[:self._nb_fields]
+            if self._keep(row):
+                self._rows.append(row)
+
+    def _read_line(self, line):
+        """
+        Process one line of the file.
+        """
+        if self._text is not None:
+            # inside a text field, which is closed by a line starting with ';'
+            if line.startswith(';'):
+                self._add_tokens(["\n".join(self._text)])
+                self._text = None
+            else:
+                self._text.append(line.rstrip("\n"))
+            return
+        item = line.strip()
+        if self._state == 'rows':
+            if not item or item.startswith('#'):
+                return
+            if not item.startswith(_PDBX_KEYWORDS):
+                if line.startswith(';'):
+                    self._text = [line[1:].rstrip("\n")]
+                    return
+                tokens = tokenize_pdbx_line(item)
+                if not self._tokens and len(tokens) == self._nb_fields:
+                    # fast path: one row per line
+                    row = self._getter(tokens)
+                    if self._keep(row):
+                        self._rows.append(row)
+                else:
+                    self._add_tokens(tokens)
+                return
+            # the loop is over
+            self._state = 'search'
+            self._tokens = []
+        if self._state == 'header':
+            if item.startswith('_atom_site.'):
+                self._fields.append(item.split()[0].replace('_atom_site.', ''))
+            elif self._fields:
+                self._end_header()
+                self._read_line(line)
+            else:
+                # loop of another category
+                self._state = 'search'
+        elif item == 'loop_':
+            self._state = 'header'
+            self._fields = []
+
+    def feed(self, lines):
+        """
+        Parse a block of lines.
+
+        Parameters
+        ----------
+        lines : iterable of str
+            Lines of the file.
+
+        Returns
+        -------
+        chains : list of Chain
+            The chains completed in this block.
+
+        Raises
+        ------
+        AtomError
+            If a field is missing or cannot be converted.
+        """
+        for line in lines:
+            self._read_line(line)
+        return self._split(final=False)
+
+    def close(self):
+        """
+        Give the last chains of the file.
+
+        Returns
+        -------
+        chains : list of Chain
+            The chains not yet returned by :meth:`feed`.
+        """
+        if self._state == 'header' and self._fields:
+            self._end_header()
+        return self._split(final=True)
+
+    def _split(self, final):
+        """
+        Build the chains that are complete among the stored rows.
+
+        A chain is complete when the first atom of the next chain is known,
+        because the model of a chain depends on the next one.
+        """
+        if not self._rows:
+            return []
+        columns = list(zip(*self._rows))
+        (_, ids, names, resnames, chains, resids,
+         x_coords, y_coords, z_coords, models) = columns[:len(_PDBX_FIELDS)]
+        chains = numpy.array(chains)
+        segments = pdbx_segments(chains, numpy.array(models), final)
+        if not segments:
+            return []
+
+        # Convert the values of the complete chains at once
+        last = segments[-1][1]
+        try:
+            ids = _convert(ids[:last], int)
+            resids = _convert(resids[:last], int)
+            coords = numpy.stack([_convert(x_coords[:last], float),
+                                  _convert(y_coords[:last], float),
+                                  _convert(z_coords[:last], float)], axis=1)
+            bfactors = None
+            if len(columns) > len(_PDBX_FIELDS):
+                bfactors = _convert_optional(columns[-1][:last])
+        except ValueError as error:
+            raise AtomError("Something went wrong in data convertion\n{0}"
+                            .format(error))
+        names = _encode(names[:last])
+        resnames = _encode(resnames[:last])
+        del self._rows[:last]
+
+        completed = []
+        for start, stop, model in segments:
+            completed.append(Chain.from_arrays(
+                str(chains[start]), ids[start:stop],
+                (names[0][start:stop], names[1]),
+                (resnames[0][start:stop], resnames[1]),
+                resids[start:stop], coords[start:stop], model=model,
+                bfactors=None if bfactors is None else bfactors[start:stop]))
+        return completed
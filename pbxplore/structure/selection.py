@@ -0,0 +1,161 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+# Third-party module
+import numpy
+
+
+# =============================================================================
+# Data
+# =============================================================================
+# Atoms used to compute the phi and psi angles of the backbone
+BACKBONE_ATOMS = ('N', 'CA', 'C', 'O')
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+def parse_ranges(text):
+    """
+    Read a list of integer ranges.
+
+    Parameters
+    ----------
+    text : str
+        Comma separated ranges, each range is either an integer or two
+        integers separated by a dash (bounds included).
+
+    Returns
+    -------
+    ranges : list of tuple
+        The (first, last) bounds of each range.
+
+    Raises
+    ------
+    ValueError
+        If the text is not a valid list of ranges.
+
+    Examples
+    --------
+    >>> parse_ranges("1-10,15")
+    [(1, 10), (15, 15)]
+    """
+    ranges = []
+    for item in text.split(','):
+        bounds = item.strip().split('-')
+        if len(bounds) == 1:
+            ranges.append((int(bounds[0]), int(bounds[0])))
+        elif len(bounds) == 2:
+            ranges.append((int(bounds[0]), int(bounds[1])))
+        else:
+            raise ValueError("Invalid range: '{0}'".format(item))
+    return ranges
+
+
+def _as_ranges(models):
+    """
+    Convert a model specification to a list of (first, last) ranges.
+    """
+    if isinstance(models, str):
+        return parse_ranges(models)
+    if isinstance(models, int):
+        return [(models, models)]
+    if isinstance(models, range) and models.step == 1:
+        return [(models.start, models.stop - 1)] if len(models) else []
+    ranges = []
+    for number in sorted(set(models)):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], number)
+        else:
+            ranges.append((number, number))
+    return ranges
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+class Selection:
+    """
+    Atoms to read from a structure file.
+
+    The selection is applied while the file is parsed: the records that do not
+    match are skipped before their coordinates are converted.
+
+    Parameters
+    ----------
+    atom_names : list of str, optional
+        Names of the atoms to read. All the atoms are read by default.
+        :data:`BACKBONE_ATOMS` are the atoms needed to assign PBs.
+    chains : list of str, optional
+        Names of the chains to read. All the chains are read by default.
+    models : int, str, or iterable of int, optional
+        Numbers of the models to read, either as a model number, as a string
+        of comma separated ranges such as ``"1-10,15"`` (bounds included), or
+        as any iterable of model numbers such as ``range(500, 601)``. All the
+        models are read by default. The atoms that come before any MODEL
+        record belong to model 1.
+
+    Examples
+    --------
+    >>> selection = Selection(atom_names=BACKBONE_ATOMS, chains=['A'],
+    ...                       models='1-10')
+    >>> pdb = PDB('2LFU.pdb', selection=selection)
+    """
+    def __init__(self, atom_names=None, chains=None, models=None):
+        self.atom_names = None if atom_names is None else frozenset(atom_names)
+        self.chains = None if chains is None else frozenset(chains)
+        self.models = None if models is None else _as_ranges(models)
+
+    def __repr__(self):
+        return ("Selection(atom_names={0}, chains={1}, models={2})"
+                .format(None if self.atom_names is None else sorted(self.atom_names),
+                        None if self.chains is None else sorted(self.chains),
+                        self.models))
+
+    def match_atom_name(self, name):
+        """
+        Tell if an atom name is selected.
+        """
+        return self.atom_names is None or name in self.atom_names
+
+    def match_chain(self, name):
+        """
+        Tell if a chain name is selected.
+        """
+        return self.chains is None or name in self.chains
+
+    def match_model(self, number):
+        """
+        Tell if a model number is selected.
+
+        Parameters
+        ----------
+        number : int
+            Model number.
+        """
+        if self.models is None:
+            return True
+        return any(first <= number <= last for first, last in self.models)
+
+    def mask_models(self, numbers):
+        """
+        Tell which model numbers are selected.
+
+        Parameters
+        ----------
+        numbers : numpy array of int
+            Model numbers.
+
+        Returns
+        -------
+        mask : numpy array of bool
+            True for the selected model numbers.
+        """
+        numbers = numpy.asarray(numbers)
+        if self.models is None:
+            return numpy.ones(numbers.shape, dtype=bool)
+        mask = numpy.zeros(numbers.shape, dtype=bool)
+        for first, last in self.models:
+            mask |= (numbers >= first) & (numbers <= last)
+        return mask
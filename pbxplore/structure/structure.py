@@ -28,22 +28,71 @@ class ChainError(Exception):
     pass
 
 
+class _AtomField:
+    """
+    Descriptor for the attributes of an :class:`Atom`.
+
+    A standalone atom keeps its values in a small dictionary, while an atom
+    that is a view on a :class:`Chain` reads and writes the chain arrays.
+    """
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, atom, owner=None):
+        if atom is None:
+            return self
+        if atom._chain is None:
+            return atom._fields[self.field]
+        return atom._chain._get_atom_field(atom._index, self.field)
+
+    def __set__(self, atom, value):
+        if atom._chain is None:
+            atom._fields[self.field] = value
+        else:
+            atom._chain._set_atom_field(atom._index, self.field, value)
+
+
 class Atom:
     """
     Class for atoms in PDB or PDBx/mmCIF format.
+
+    An atom either holds its own data, or is a lightweight view on one row of
+    the arrays of a :class:`Chain`. In the later case, reading or writing an
+    attribute reads or writes the chain arrays.
     """
+    __slots__ = ('_chain', '_index', '_fields')
+
+    id = _AtomField('id')
+    name = _AtomField('name')
+    resname = _AtomField('resname')
+    chain = _AtomField('chain')
+    resid = _AtomField('resid')
+    x = _AtomField('x')
+    y = _AtomField('y')
+    z = _AtomField('z')
+    model = _AtomField('model')
+    bfactor = _AtomField('bfactor')
+
     def __init__(self, ident=0, name=None, resname=None, chain=None, resid=0,
-                 x=0.0, y=0.0, z=0.0, model=None):
+                 x=0.0, y=0.0, z=0.0, model=None, bfactor=0.0):
         """default constructor"""
-        self.id = ident
-        self.name = name
-        self.resname = resname
-        self.chain = chain
-        self.resid = resid
-        self.x = x
-        self.y = y
-        self.z = z
-        self.model = model
+        self._chain = None
+        self._index = None
+        self._fields = {'id': ident, 'name': name, 'resname': resname,
+                        'chain': chain, 'resid': resid,
+                        'x': x, 'y': y, 'z': z, 'model': model,
+                        'bfactor': bfactor}
+
+    @classmethod
+    def _view(cls, chain, index):
+        """
+        Build an atom that is a view on the row `index` of `chain`.
+        """
+        atom = cls.__new__(cls)
+        atom._chain = chain
+        atom._index = index
+        atom._fields = None
+        return atom
 
     @classmethod
     def read_from_PDB(cls, line):
@@ -75,8 +124,15 @@ class Atom:
         x = float(line[30:38].strip())
         y = float(line[38:46].strip())
         z = float(line[46:54].strip())
+        # The B-factor column is optional; it holds the pLDDT of predicted
+        # models. It is 0 when it is not a number.
+        try:
+            bfactor = float(line[60:66].strip() or 0.0)
+        except ValueError:
+            bfactor = 0.0
 
-        return cls(ident, name, resname, chain, resid, x, y, z)
+        return cls(ident, name, resname, chain, resid, x, y, z,
+                   bfactor=bfactor)
 
     @classmethod
     def read_from_PDBx(cls, line, fields):
@@ -109,11 +165,13 @@ class Atom:
             y = float(dic['Cartn_y'])
             z = float(dic['Cartn_z'])
             model = dic['pdbx_PDB_model_num']
+            bfactor = dic.get('B_iso_or_equiv', '?')
+            bfactor = 0.0 if bfactor in ('?', '.') else float(bfactor)
         except:
             raise AtomError("Something went wrong in data convertion\n{0}"
                             .format(dic))
 
-        return cls(ident, name, resname, chain, resid, x, y, z, model)
+        return cls(ident, name, resname, chain, resid, x, y, z, model, bfactor)
 
     @classmethod
     def read_from_xtc(cls, atm):
@@ -148,6 +206,8 @@ class Atom:
         """
         Return atom coordinates.
         """
+        if self._chain is not None:
+            return list(self._chain._coords[self._index])
         return [self.x, self.y, self.z]
 
     @coords.setter
@@ -159,12 +219,22 @@ class Atom:
         ----------
         pos: a list or numpy array of 3 elements
         """
-        self.x, self.y, self.z = pos
+        if self._chain is not None:
+            self._chain._coords[self._index] = pos
+            self._chain._phi_psi_angles = None
+        else:
+            self.x, self.y, self.z = pos
 
 
 class Chain:
     """
     Class to handle PDB chain
+
+    The atoms of a chain are stored as arrays rather than as a list of
+    :class:`Atom` instances: the coordinates are a ``(size, 3)`` array, the
+    atom and residue numbers are integer arrays, and the atom and residue
+    names are stored as integer codes in a table of labels. Indexing a chain
+    returns an :class:`Atom` that is a view on these arrays.
     """
     def __init__(self):
         """
@@ -172,7 +242,72 @@ class Chain:
         """
         self.name = ""
         self.model = ""
-        self.atoms = []
+        self._size = 0
+        self._coords = numpy.zeros((0, 3))
+        self._ids = numpy.zeros(0, dtype=int)
+        self._resids = numpy.zeros(0, dtype=int)
+        self._name_codes = numpy.zeros(0, dtype=numpy.int32)
+        self._resname_codes = numpy.zeros(0, dtype=numpy.int32)
+        self._bfactors = numpy.zeros(0)
+        self._name_labels = []
+        self._resname_labels = []
+        # Phi and psi angles already known for the current atoms
+        self._phi_psi_angles = None
+
+    @classmethod
+    def from_arrays(cls, name, ids, atom_names, resnames, resids, coords,
+                    model="", bfactors=None):
+        """
+        Build a chain from arrays, without creating any :class:`Atom`.
+
+        The arrays are used as is, they are not copied.
+
+        Parameters
+        ----------
+        name : str
+            Chain name.
+        ids : numpy array of int
+            Atom numbers.
+        atom_names : tuple of (codes, labels)
+            Atom names as an array of integer codes and the sequence of labels
+            these codes refer to.
+        resnames : tuple of (codes, labels)
+            Residue names as an array of integer codes and the sequence of
+            labels these codes refer to.
+        resids : numpy array of int
+            Residue numbers.
+        coords : numpy array
+            Atom coordinates as an array with a shape of (number of atoms, 3).
+        model : str
+            Model identifier.
+        bfactors : numpy array of float, optional
+            B-factors, or pLDDT of predicted models. They are 0 by default.
+
+        Raises
+        ------
+        ChainError
+            If the arrays do not have the same length.
+        """
+        chain = cls()
+        chain.name = name
+        chain.model = model
+        chain._ids = numpy.asarray(ids)
+        chain._name_codes = numpy.asarray(atom_names[0])
+        chain._name_labels = list(atom_names[1])
+        chain._resname_codes = numpy.asarray(resnames[0])
+        chain._resname_labels = list(resnames[1])
+        chain._resids = numpy.asarray(resids)
+        chain._coords = numpy.asarray(coords)
+        chain._size = len(chain._ids)
+        if bfactors is None:
+            chain._bfactors = numpy.zeros(chain._size)
+        else:
+            chain._bfactors = numpy.asarray(bfactors)
+        for array in (chain._name_codes, chain._resname_codes,
+                      chain._resids, chain._coords, chain._bfactors):
+            if len(array) != chain._size:
+                raise ChainError("Arrays of different lengths for the same chain")
+        return chain
 
     def __repr__(self):
         """
@@ -180,15 +315,180 @@ class Chain:
         """
         return "Chain {0} / model {1}: {2} atoms".format(self.name,
                                                          self.model,
-                                                         len(self.atoms))
+                                                         self._size)
 
     def __getitem__(self, i):
-        return self.atoms[i]
+        if isinstance(i, slice):
+            return [Atom._view(self, idx) for idx in range(*i.indices(self._size))]
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("atom index out of range")
+        return Atom._view(self, i)
+
+    def __iter__(self):
+        for idx in range(self._size):
+            yield Atom._view(self, idx)
+
+    @property
+    def atoms(self):
+        """
+        List of the atoms of the chain, as views on the chain arrays.
+        """
+        return list(self)
+
+    @property
+    def coords(self):
+        """
+        Coordinates of the atoms as an array with a shape of (size, 3).
+        """
+        return self._coords[:self._size]
+
+    @property
+    def ids(self):
+        """
+        Atom numbers as an array of integers.
+        """
+        return self._ids[:self._size]
+
+    @property
+    def resids(self):
+        """
+        Residue numbers as an array of integers.
+        """
+        return self._resids[:self._size]
+
+    @property
+    def bfactors(self):
+        """
+        B-factors, or pLDDT of predicted models, as an array of floats.
+        """
+        return self._bfactors[:self._size]
+
+    @property
+    def atom_names(self):
+        """
+        Atom names as an array of strings.
+        """
+        return numpy.array(self._name_labels, dtype=object)[self._name_codes[:self._size]]
+
+    @property
+    def resnames(self):
+        """
+        Residue names as an array of strings.
+        """
+        return numpy.array(self._resname_labels, dtype=object)[self._resname_codes[:self._size]]
+
+    def atom_name_mask(self, names):
+        """
+        Tell which atoms have one of the given names.
+
+        Parameters
+        ----------
+        names : list of str
+            The atom names to look for.
+
+        Returns
+        -------
+        mask : numpy array of bool
+            True for the atoms which name is in `names`.
+        """
+        codes = [code for code, label in enumerate(self._name_labels)
+                 if label in names]
+        return numpy.isin(self._name_codes[:self._size], codes)
+
+    def _reserve(self, size):
+        """
+        Make sure the arrays can store at least `size` atoms.
+
+        The capacity grows geometrically so adding atoms one at a time has an
+        amortized constant cost. The coordinates given to
+        :meth:`set_coordinates` have no room left, so the capacity is the one
+        of the smallest array.
+        """
+        capacity = min(len(self._coords), len(self._ids), len(self._resids),
+                       len(self._name_codes), len(self._resname_codes),
+                       len(self._bfactors))
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 16)
+        n = self._size
+
+        def grow(array):
+            new = numpy.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            new[:n] = array[:n]
+            return new
+
+        self._coords = grow(self._coords)
+        self._ids = grow(self._ids)
+        self._resids = grow(self._resids)
+        self._name_codes = grow(self._name_codes)
+        self._resname_codes = grow(self._resname_codes)
+        self._bfactors = grow(self._bfactors)
+
+    @staticmethod
+    def _encode(labels, value):
+        """
+        Give the code of `value` in `labels`; add it to the labels if needed.
+        """
+        try:
+            return labels.index(value)
+        except ValueError:
+            labels.append(value)
+            return len(labels) - 1
+
+    def _get_atom_field(self, index, field):
+        """
+        Read one attribute of the atom at the given index.
+        """
+        if field == 'id':
+            return int(self._ids[index])
+        elif field == 'name':
+            return self._name_labels[self._name_codes[index]]
+        elif field == 'resname':
+            return self._resname_labels[self._resname_codes[index]]
+        elif field == 'chain':
+            return self.name
+        elif field == 'resid':
+            return int(self._resids[index])
+        elif field == 'model':
+            return self.model
+        elif field == 'bfactor':
+            return float(self._bfactors[index])
+        return self._coords[index, 'xyz'.index(field)]
+
+    def _set_atom_field(self, index, field, value):
+        """
+        Write one attribute of the atom at the given index.
+
+        Raises
+        ------
+        AtomError
+            If the attribute is shared by all the atoms of the chain.
+        """
+        self._phi_psi_angles = None
+        if field == 'id':
+            self._ids[index] = value
+        elif field == 'name':
+            self._name_codes[index] = self._encode(self._name_labels, value)
+        elif field == 'resname':
+            self._resname_codes[index] = self._encode(self._resname_labels, value)
+        elif field == 'resid':
+            self._resids[index] = value
+        elif field == 'bfactor':
+            self._bfactors[index] = value
+        elif field in ('chain', 'model'):
+            raise AtomError("The {0} of an atom is defined by its chain"
+                            .format(field))
+        else:
+            self._coords[index, 'xyz'.index(field)] = value
 
     def add_atom(self, atom):
         """
         Add atom.
 
+        The atom data are copied in the chain arrays.
+
         Parameters
         ----------
         atom : object from Atom class
@@ -201,13 +501,23 @@ class Chain:
 
         """
         # set chain name when first atom is stored
-        if not self.atoms:
+        if not self._size:
             self.name = atom.chain
         # check that chain name is always the same
         elif self.name != atom.chain:
             raise ChainError("Several chains are in the same structure")
         # add atom to structure
-        self.atoms.append(atom)
+        index = self._size
+        self._reserve(index + 1)
+        self._ids[index] = atom.id
+        self._name_codes[index] = self._encode(self._name_labels, atom.name)
+        self._resname_codes[index] = self._encode(self._resname_labels,
+                                                  atom.resname)
+        self._resids[index] = atom.resid
+        self._coords[index] = atom.coords
+        self._bfactors[index] = atom.bfactor
+        self._size += 1
+        self._phi_psi_angles = None
 
     def set_model(self, model):
         """
@@ -224,15 +534,23 @@ class Chain:
         """
         Get number of atoms.
         """
-        return len(self.atoms)
+        return self._size
 
-    def set_coordinates(self, positions):
+    def set_coordinates(self, positions, copy=True):
         """
         Update the coordinates of all atoms in a chain.
 
+        The coordinates keep the type of the `positions` array.
+
         Parameters
         ----------
         positions : a 2D numpy array with a shape of (number of atoms * 3)
+        copy : bool, optional
+            If False, the chain uses the `positions` array itself, without
+            copying it: the changes of the array are seen by the chain and its
+            atoms, and the changes of the atoms are written in the array. Call
+            this method again when the array changes, so the angles of the
+            chain are computed again.
 
         Raises
         ------
@@ -243,13 +561,122 @@ class Chain:
         if numpy.shape(positions) != (self.size(), 3):
             raise ValueError("Coordinates array doesn't have the good shape.")
 
-        for atm, coords in zip(self.atoms, positions):
-            atm.coords = coords
+        if copy:
+            self._coords = numpy.array(positions)
+        else:
+            self._coords = numpy.asarray(positions)
+        self._phi_psi_angles = None
+
+    def low_confidence_residues(self, threshold):
+        """
+        Give the residues whose confidence is below a threshold.
 
-    def get_phi_psi_angles(self):
+        The confidence of a residue is the B-factor of its CA atom, which is
+        where predicted models store the pLDDT.
+
+        Parameters
+        ----------
+        threshold : float
+            The lowest confidence of the residues to keep.
+
+        Returns
+        -------
+        residues : set of int
+            The numbers of the residues below the threshold.
+        """
+        mask = self.atom_name_mask(["CA"]) & (self.bfactors < threshold)
+        return {int(res) for res in self.resids[mask]}
+
+    def _backbone_indices(self):
+        """
+        Give the residue numbers and the index of their N, CA and C atoms.
+
+        The residues are the ones with at least one backbone atom, sorted. An
+        atom that is missing has an index of -1; when a residue has several
+        atoms with the same name, the last one is used.
+        """
+        resids = self.resids
+        mask = self.atom_name_mask(["CA", "C", "O", "N"])
+        residues = numpy.unique(resids[mask])
+        indices = numpy.full((3, len(residues)), -1, dtype=numpy.intp)
+        for row, name in enumerate(("N", "CA", "C")):
+            atoms = numpy.flatnonzero(self.atom_name_mask([name]))
+            positions = numpy.searchsorted(residues, resids[atoms])
+            # later atoms overwrite the previous ones
+            indices[row, positions] = atoms
+        return residues, indices
+
+    def get_phi_psi_arrays(self, masked=None, dtype=float):
+        """
+        Compute the phi and psi angles of all the residues at once.
+
+        The backbone atoms are gathered once, and all the angles are computed
+        with arrays (see :func:`get_dihedrals`). The angles read from a
+        :class:`StructureCache` are used instead, in double precision.
+
+        Parameters
+        ----------
+        masked : set of int, optional
+            Residues whose protein block is not wanted, as for
+            :meth:`get_phi_psi_angles`.
+        dtype : numpy dtype, optional
+            The precision of the computation of the angles.
+
+        Returns
+        -------
+        resids : numpy array of int
+            The residue numbers, sorted.
+        phi : numpy array
+            Phi angles in degrees. The angles that cannot be computed because
+            of missing atoms or residues are NaN.
+        psi : numpy array
+            Psi angles, as for `phi`.
+
+        Raises
+        ------
+        FloatingPointError
+            If an angle cannot be computed while all its atoms are there.
+            Generally, it means there is some problem with the residue coordinates.
+        """
+        if (self._phi_psi_angles is not None
+                and numpy.dtype(dtype) == numpy.float64):
+            # angles read from a cache (see StructureCache)
+            resids = numpy.array(sorted(self._phi_psi_angles), dtype=numpy.int64)
+            angles = [self._phi_psi_angles[res] for res in resids.tolist()]
+            phi, psi = [numpy.array([numpy.nan if values[key] is None else values[key]
+                                     for values in angles], dtype=float)
+                        for key in ('phi', 'psi')]
+            if masked:
+                skipped = _skipped_residues(resids, masked)
+                phi[skipped] = numpy.nan
+                psi[skipped] = numpy.nan
+            return resids, phi, psi
+
+        resids, indices = self._backbone_indices()
+        (phi, psi), defined = backbone_dihedrals(self.coords, resids, indices,
+                                                 dtype)
+        if masked:
+            skipped = _skipped_residues(resids, masked)
+            phi[skipped] = numpy.nan
+            psi[skipped] = numpy.nan
+            defined &= ~skipped
+        if numpy.isnan(phi[defined[0]]).any() or numpy.isnan(psi[defined[1]]).any():
+            raise FloatingPointError("invalid value encountered in the "
+                                     "computation of dihedral angles")
+        return resids, phi, psi
+
+    def get_phi_psi_angles(self, masked=None):
         """
         Compute phi and psi angles.
 
+        Parameters
+        ----------
+        masked : set of int, optional
+            Residues whose protein block is not wanted, for instance because
+            of a low confidence (see :meth:`low_confidence_residues`). The
+            angles of a residue are only computed when a residue at most 2
+            positions away is not masked; otherwise they are None.
+
         Returns
         -------
         phi_psi_angles : dict
@@ -281,56 +708,140 @@ class Chain:
         {11: {'phi': None, 'psi': None}, 12: {'phi': -139.77684605036447, 'psi': 157.94348570201197}, 13: {'phi': None, 'psi': None}}
 
         """
-        # extract backbone atoms
-        backbone = {}
-        for atom in self.atoms:
-            if atom.name in ["CA", "C", "O", "N"]:
-                resid = atom.resid
-                if resid in backbone:
-                    backbone[resid][atom.name] = atom
-                else:
-                    backbone[resid] = {atom.name: atom}
-
-        # get dihedrals
-        phi_psi_angles = {}
-
-        # When get_dihedral() produces NaN, raises a FloatingPointError exception
-        # instead of a RuntimeWarning
-        with numpy.errstate(invalid='raise'):
-            for res in sorted(backbone):
-                # phi: angle between C(i-1) - N(i) - CA(i) - C(i)
-                try:
-                    phi = get_dihedral(backbone[res-1]["C" ].coords,
-                                       backbone[res  ]["N" ].coords,
-                                       backbone[res  ]["CA"].coords,
-                                       backbone[res  ]["C" ].coords)
-                except FloatingPointError:
-                    # Using raise with no argument re-raises the last exception
-                    # In order to keep the traceback
-                    raise
-                except:
-                    phi = None
-                # psi: angle between N(i) - CA(i) - C(i) - N(i+1)
-                try:
-                    psi = get_dihedral(backbone[res  ]["N" ].coords,
-                                       backbone[res  ]["CA"].coords,
-                                       backbone[res  ]["C" ].coords,
-                                       backbone[res+1]["N" ].coords)
-                except FloatingPointError:
-                    # Using raise with no argument re-raises the last exception
-                    # In order to keep the traceback
-                    raise
-                except:
-                    psi = None
-                # print(res, phi, psi)
-                phi_psi_angles[res] = {"phi": phi, "psi": psi}
-
-        return phi_psi_angles
+        if self._phi_psi_angles is not None:
+            # angles read from a cache (see StructureCache)
+            phi_psi = {res: dict(angles)
+                       for res, angles in self._phi_psi_angles.items()}
+            if masked:
+                resids = numpy.array(list(phi_psi), dtype=int)
+                for res in resids[_skipped_residues(resids, masked)]:
+                    phi_psi[int(res)] = {'phi': None, 'psi': None}
+            return phi_psi
+
+        resids, phi, psi = self.get_phi_psi_arrays(masked)
+        return {int(res): {'phi': None if numpy.isnan(phi_value) else float(phi_value),
+                           'psi': None if numpy.isnan(psi_value) else float(psi_value)}
+                for res, phi_value, psi_value in zip(resids, phi, psi)}
 
 
 # =============================================================================
 # Functions
 # =============================================================================
+def _skipped_residues(resids, masked):
+    """
+    Tell which residues are only used by masked residues: the residues at
+    most 2 positions away are all masked, so their angles are not needed.
+    """
+    return numpy.all([numpy.isin(resids + shift, list(masked))
+                      for shift in range(-2, 3)], axis=0)
+
+
+def get_dihedrals(atomA, atomB, atomC, atomD):
+    """
+    Compute the dihedral angles of many sets of 4 atoms (A, B, C, D) at once.
+
+    The angles are the same as the ones of :func:`get_dihedral`; they are
+    computed with ``arctan2`` which is accurate for all the angles.
+
+    Parameters
+    ----------
+    atomA, atomB, atomC, atomD : numpy array
+        Coordinates of the atoms as arrays with a shape of (..., 3).
+
+    Returns
+    -------
+    torsions : numpy array
+        Torsion angles in degrees in the range -180, +180, with the shape of
+        the coordinates without their last axis. The angles that cannot be
+        computed (for instance for atoms on the same line) are NaN.
+    """
+    AB = atomB - atomA
+    BC = atomC - atomB
+    CD = atomD - atomC
+
+    # normal vectors
+    n1 = numpy.cross(AB, BC)
+    n2 = numpy.cross(BC, CD)
+    norm_BC = numpy.sqrt(numpy.sum(BC * BC, axis=-1))
+
+    # the angle between the normals is the angle between n2 and the axes
+    # n1 and n1 x BC, which are orthogonal and of the same length
+    x = numpy.sum(n1 * n2, axis=-1) * norm_BC
+    y = numpy.sum(numpy.cross(n1, BC) * n2, axis=-1)
+    torsions = -numpy.degrees(numpy.arctan2(y, x))
+    # the angle is undefined when A, B and C or B, C and D are on a line
+    degenerate = ((numpy.sum(n1 * n1, axis=-1) == 0)
+                  | (numpy.sum(n2 * n2, axis=-1) == 0))
+    return numpy.where(degenerate, numpy.nan, torsions)
+
+
+def dihedral_quadruplets(resids, indices):
+    """
+    Give the index of the 4 atoms of the phi and psi angles of each residue.
+
+    Parameters
+    ----------
+    resids : numpy array of int
+        The residue numbers, sorted.
+    indices : numpy array of int
+        The index of the N, CA and C atoms of each residue, as an array with
+        a shape of (3, residues); -1 for a missing atom.
+
+    Returns
+    -------
+    quadruplets : numpy array of int
+        The index of the atoms A, B, C and D of the phi and psi angles, with
+        a shape of (2, 4, residues); -1 for a missing atom. The atoms of the
+        neighbour residues are only used when the residues are consecutive.
+    """
+    N, CA, C = indices
+    # Atoms of the neighbour residues, if they are in the chain
+    previous = numpy.full(len(resids), -1, dtype=numpy.intp)
+    following = numpy.full(len(resids), -1, dtype=numpy.intp)
+    consecutive = numpy.flatnonzero(numpy.diff(resids) == 1)
+    previous[consecutive + 1] = C[consecutive]
+    following[consecutive] = N[consecutive + 1]
+    return numpy.array([(previous, N, CA, C), (N, CA, C, following)],
+                       dtype=numpy.intp).reshape(2, 4, len(resids))
+
+
+def backbone_dihedrals(coords, resids, indices, dtype=float):
+    """
+    Compute the phi and psi angles from the index of the backbone atoms.
+
+    Parameters
+    ----------
+    coords : numpy array
+        Coordinates of the atoms, with a shape of (..., atoms, 3) to compute
+        the angles of several models at once.
+    resids : numpy array of int
+        The residue numbers, sorted.
+    indices : numpy array of int
+        The index of the N, CA and C atoms of each residue, as an array with
+        a shape of (3, residues); -1 for a missing atom.
+    dtype : numpy dtype, optional
+        The precision of the computation, and of the angles.
+
+    Returns
+    -------
+    angles : numpy array
+        The phi and psi angles in degrees, with a shape of (2, ..., residues).
+        The angles with a missing atom are NaN.
+    defined : numpy array of bool
+        For the phi and psi angles of each residue, as an array with a shape
+        of (2, residues), True when all the atoms of the angle are there.
+    """
+    coords = numpy.asarray(coords, dtype=dtype)
+    quadruplets = dihedral_quadruplets(resids, indices)
+    defined = numpy.all(quadruplets >= 0, axis=1)
+    angles = numpy.full((2, ) + coords.shape[:-2] + (len(resids), ), numpy.nan,
+                        dtype=coords.dtype)
+    for angle, atoms, angle_defined in zip(angles, quadruplets, defined):
+        angle[..., angle_defined] = get_dihedrals(
+            *[coords[..., atom[angle_defined], :] for atom in atoms])
+    return angles, defined
+
+
 def get_dihedral(atomA, atomB, atomC, atomD):
     """
     Compute dihedral angle between 4 atoms (A, B, C, D).
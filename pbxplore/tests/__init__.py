@@ -38,6 +38,7 @@ def system_info():
     module_info("MDAnalysis")
     module_info("matplotlib")
     module_info("weblogo")
+    module_info("numba")
 
     py_version = sys.version.replace('\n', '')
     print("Python version {0}".format(py_version))
@@ -13,13 +13,16 @@ Tests functions from different programs.
 # Modules
 # =============================================================================
 import collections
+import gzip
 import os
+import shutil
 import numpy
 
 import pytest
 
 import pbxplore as pbx
 from pbxplore.structure import structure
+from pbxplore.structure.ensemble import ensembles_from_chains
 
 import MDAnalysis
 
@@ -89,6 +92,18 @@ class TestStructurelib(object):
                                          result.C, result.D)
         assert torsion == pytest.approx(result.torsion)
 
+    def test_get_dihedrals(self):
+        """
+        Test that get_dihedrals() gives the angles of get_dihedral()
+        """
+        coords = numpy.random.RandomState(42).uniform(-10, 10, (50, 4, 3))
+        # atoms on the same line
+        coords[0] = [[0, 0, 0], [1, 0, 0], [2, 0, 0], [3, 1, 0]]
+        torsions = structure.get_dihedrals(*[coords[:, idx] for idx in range(4)])
+        assert numpy.isnan(torsions[0])
+        for atoms, torsion in zip(coords[1:], torsions[1:]):
+            assert torsion == pytest.approx(structure.get_dihedral(*atoms))
+
     def test_loader_PDB(self):
         """
         Test for API loader function on PDBs
@@ -120,6 +135,46 @@ class TestStructurelib(object):
         assert ref_comment == comment
         assert ref_chain == format(chain)
 
+    @pytest.mark.parametrize('split', ['segid', 'chainID',
+                                       ['segid A', 'segid B']])
+    def test_loader_trajectory_split(self, split):
+        """
+        Test the split of the atoms of a trajectory in chains.
+        """
+        filename = os.path.join(here, "test_data/1AY7.pdb")
+        chains = list(pbx.chains_from_trajectory(filename, filename, split))
+        ref_chains = list(pbx.chains_from_files(
+            [filename], pbx.structure.Selection(pbx.structure.BACKBONE_ATOMS)))
+        assert len(chains) == len(ref_chains) == 2
+        names = split if isinstance(split, list) else ['A', 'B']
+        for name, (comment, chain), (_, ref_chain) in zip(names, chains,
+                                                           ref_chains):
+            assert comment == "{0} | frame 0 | chain {1}".format(filename, name)
+            assert chain.name == name
+            assert numpy.array_equal(chain.resids, ref_chain.resids)
+            assert numpy.allclose(chain.coords, ref_chain.coords, atol=1e-3)
+            assert (pbx.assign(chain.get_phi_psi_angles())
+                    == pbx.assign(ref_chain.get_phi_psi_angles()))
+
+    @pytest.mark.parametrize('split', ['chainID', ['resid 1000']])
+    def test_loader_trajectory_split_error(self, split):
+        """
+        Test the split of the atoms of a trajectory that cannot be done.
+        """
+        topol = os.path.join(here, "test_data/barstar_md_traj.gro")
+        traj = os.path.join(here, "test_data/barstar_md_traj.xtc")
+        with pytest.raises(ValueError):
+            list(pbx.chains_from_trajectory(traj, topol, split))
+
+    def test_loader_trajectory_views(self):
+        """
+        Test that the chains of a frame share the coordinates of the frame.
+        """
+        filename = os.path.join(here, "test_data/1AY7.pdb")
+        chains = [chain for _, chain in
+                  pbx.chains_from_trajectory(filename, filename, 'segid')]
+        assert numpy.shares_memory(chains[0].coords.base, chains[1].coords.base)
+
 
 class TestAtomClass(object):
     """
@@ -257,6 +312,57 @@ class TestChainClass(object):
             or angles["phi"] == pytest.approx(phi_psi[resid]["phi"])
         )
 
+    def test_get_phi_psi_arrays(self):
+        """
+        Tests that get_phi_psi_arrays() gives the angles of get_dihedral(),
+        with NaN for the missing atoms and the gaps
+        """
+        filename = os.path.join(here, "test_data/1AY7.pdb")
+        chain = next(pbx.structure.PDB.PDB(filename).get_chains())
+        # remove the CA of residue 10 and the residue 20
+        keep = ~(((chain.resids == 10) & (chain.atom_names == "CA"))
+                 | (chain.resids == 20))
+        chain = structure.Chain.from_arrays(
+            chain.name, chain.ids[keep],
+            (chain._name_codes[:chain.size()][keep], chain._name_labels),
+            (chain._resname_codes[:chain.size()][keep], chain._resname_labels),
+            chain.resids[keep], chain.coords[keep])
+        backbone = {}
+        for atom in chain:
+            backbone.setdefault(atom.resid, {})[atom.name] = atom.coords
+
+        resids, phi, psi = chain.get_phi_psi_arrays()
+        assert list(resids) == sorted(backbone)
+        for res, phi_value, psi_value in zip(resids, phi, psi):
+            atoms = [backbone.get(res - 1, {}).get("C"), backbone[res].get("N"),
+                     backbone[res].get("CA"), backbone[res].get("C"),
+                     backbone.get(res + 1, {}).get("N")]
+            for value, quadruplet in ((phi_value, atoms[:4]),
+                                      (psi_value, atoms[1:])):
+                if any(atom is None for atom in quadruplet):
+                    assert numpy.isnan(value)
+                else:
+                    assert value == pytest.approx(
+                        structure.get_dihedral(*quadruplet))
+        assert numpy.isnan(phi[resids == 10]) and numpy.isnan(psi[resids == 10])
+        assert numpy.isnan(psi[resids == 19]) and numpy.isnan(phi[resids == 21])
+
+    def test_get_phi_psi_arrays_invalid(self, chain):
+        """
+        Tests that get_phi_psi_arrays() fails when an angle cannot be computed
+        """
+        coords = chain.coords.copy()
+        # N, CA and C of residue 12 on the same line
+        coords[1:4] = [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [2.0, 0.0, 0.0]]
+        chain.set_coordinates(coords)
+        with pytest.raises(FloatingPointError):
+            chain.get_phi_psi_arrays()
+        with pytest.raises(FloatingPointError):
+            chain.get_phi_psi_angles()
+        # The angles of residues that are not assigned are not computed.
+        resids, phi, psi = chain.get_phi_psi_arrays(masked={10, 11, 12, 13, 14})
+        assert numpy.isnan(phi).all() and numpy.isnan(psi).all()
+
     def test_set_coordinates(self, chain):
         """
         Tests for coordinates update
@@ -276,6 +382,134 @@ class TestChainClass(object):
         with pytest.raises(ValueError):
             chain.set_coordinates(wrong_coords)
 
+        # Atoms added after the coordinates
+        atom = structure.Atom.read_from_PDB(
+            "ATOM    856  CA  ILE B  13      19.000  23.000   0.500  1.00 30.00           C  ")
+        chain.add_atom(atom)
+        assert chain.size() == 6
+        numpy.testing.assert_array_almost_equal(chain.coords[:5], new_coords)
+        numpy.testing.assert_array_almost_equal(chain[5].coords,
+                                                [19.0, 23.0, 0.5])
+
+    def test_set_coordinates_no_copy(self, chain):
+        """
+        Tests that the chain can use the coordinates array without a copy
+        """
+        positions = numpy.zeros((10, 3), dtype=numpy.float32)
+        view = positions[::2]
+        chain.set_coordinates(view, copy=False)
+        assert chain.coords.dtype == numpy.float32
+        assert numpy.shares_memory(chain.coords, positions)
+        positions[2] = 7.0
+        assert chain[1].coords == [7.0, 7.0, 7.0]
+        chain[0].coords = [1.0, 2.0, 3.0]
+        numpy.testing.assert_array_equal(positions[0], [1.0, 2.0, 3.0])
+
+    def test_arrays(self, chain):
+        """
+        Tests for the array storage of the atoms
+        """
+        assert chain.coords.shape == (5, 3)
+        numpy.testing.assert_array_equal(chain.ids, [840, 849, 850, 851, 855])
+        numpy.testing.assert_array_equal(chain.resids, [11, 12, 12, 12, 13])
+        assert list(chain.atom_names) == ["C", "N", "CA", "C", "N"]
+        assert list(chain.resnames) == ["ARG", "SER", "SER", "SER", "ILE"]
+        numpy.testing.assert_array_equal(chain.atom_name_mask(["N", "CA"]),
+                                         [False, True, True, False, True])
+
+    def test_atom_view(self, chain):
+        """
+        Tests that atoms are views on the chain arrays
+        """
+        atom = chain[-1]
+        assert atom.name == "N"
+        assert atom.chain == "B"
+        atom.coords = [1.0, 2.0, 3.0]
+        atom.name = "CA"
+        numpy.testing.assert_array_equal(chain.coords[4], [1.0, 2.0, 3.0])
+        assert chain.atom_names[4] == "CA"
+        assert [atm.resid for atm in chain[1:4]] == [12, 12, 12]
+        with pytest.raises(IndexError):
+            chain[5]
+        with pytest.raises(structure.AtomError):
+            atom.chain = "A"
+
+    def test_from_arrays(self, chain):
+        """
+        Tests for building a chain from arrays
+        """
+        new = structure.Chain.from_arrays(
+            "B", chain.ids, (chain._name_codes[:5], chain._name_labels),
+            (chain._resname_codes[:5], chain._resname_labels),
+            chain.resids, chain.coords)
+        assert new.size() == 5
+        assert [atom.format() for atom in new] == [atom.format() for atom in chain]
+        assert new.get_phi_psi_angles() == chain.get_phi_psi_angles()
+
+        with pytest.raises(structure.ChainError):
+            structure.Chain.from_arrays(
+                "B", chain.ids[:-1], (chain._name_codes[:5], chain._name_labels),
+                (chain._resname_codes[:5], chain._resname_labels),
+                chain.resids, chain.coords)
+
+
+class TestConfidence(object):
+    """
+    Tests for the residues assigned Z because of a low confidence
+    """
+
+    @staticmethod
+    @pytest.fixture
+    def chain():
+        filename = os.path.join(here, "test_data/1AY7.pdb")
+        return next(pbx.structure.PDB.PDB(filename).get_chains())
+
+    def test_low_confidence_residues(self, chain):
+        """
+        Test that the confidence of a residue is the one of its CA atom
+        """
+        mask = chain.atom_name_mask(["CA"])
+        ref = {int(res) for res, bfactor
+               in zip(chain.resids[mask], chain.bfactors[mask]) if bfactor < 20}
+        assert chain.low_confidence_residues(20) == ref
+        assert 0 < len(ref) < mask.sum()
+        assert chain.low_confidence_residues(0) == set()
+
+    @pytest.mark.parametrize('threshold', (0, 15, 20, 30, 100))
+    def test_assign(self, chain, threshold):
+        """
+        Test that only the residues below the threshold are changed to Z
+        """
+        ref_angles = chain.get_phi_psi_angles()
+        ref = pbx.assign(ref_angles)
+        masked = chain.low_confidence_residues(threshold)
+        angles = chain.get_phi_psi_angles(masked)
+        sequence = pbx.assign(angles, masked=masked)
+        assert sequence == "".join("Z" if res in masked else pb
+                                   for res, pb in zip(sorted(ref_angles), ref))
+        for res in angles:
+            if any(res + shift not in masked for shift in range(-2, 3)):
+                assert angles[res] == ref_angles[res]
+            else:
+                assert angles[res] == {'phi': None, 'psi': None}
+
+    def test_ensemble(self):
+        """
+        Test that ensembles mask the same residues as chains
+        """
+        chains = list(pbx.structure.PDB.PDB(
+            os.path.join(here, "test_data/2LFU.pdb")).get_chains())
+        for idx, chain in enumerate(chains):
+            chain.bfactors[:] = numpy.linspace(0, 100 + idx, chain.size())
+        ensemble, = ensembles_from_chains(chains)
+        resids, phi, psi, _ = ensemble.get_phi_psi_arrays()
+        masked = ensemble.low_confidence_mask(50)
+        sequences = pbx.assign_angles(resids, phi, psi, masked=masked)
+        for chain, sequence in zip(chains, sequences):
+            chain_masked = chain.low_confidence_residues(50)
+            assert sequence == pbx.assign(chain.get_phi_psi_angles(chain_masked),
+                                          masked=chain_masked)
+
 
 class TestPDBClass(object):
     """
@@ -310,6 +544,52 @@ class TestPDBClass(object):
         pdb = pbx.structure.PDB.PDB(filename)
         return list(pdb.get_chains())
 
+    @pytest.mark.parametrize('extension', ('.pdb', '.cif.gz'))
+    def test_streaming(self, monkeypatch, extension):
+        """
+        Test that chains are given while the file is read
+        """
+        monkeypatch.setattr(pbx.structure.PDB, 'BLOCK_SIZE', 4096)
+        monkeypatch.setattr(pbx.structure.PDB, 'BLOCK_LINES', 100)
+        filename = os.path.join(here, "test_data/2LFU" + extension)
+        pdb = pbx.structure.PDB.PDB(filename)
+        chains = pdb.get_chains()
+        first = next(chains)
+        assert first.model == "1"
+        assert pdb._nb_chains is None
+        rest = list(chains)
+        assert [chain.model for chain in rest] == ["2", "3"]
+        assert [chain.size() for chain in rest] == [first.size()] * 2
+        assert pdb.nb_chains == 3
+
+    def test_chains_file_object(self):
+        """
+        Test that the chains of a file object are kept after the first read
+        """
+        filename = os.path.join(here, "test_data/2LFU.pdb")
+        with open(filename, "rb") as f_in:
+            pdb = pbx.structure.PDB.PDB(filename, fileobj=f_in)
+            chains = pdb.chains
+            assert len(chains) == 3
+            assert pdb.chains is chains
+            assert list(pdb.get_chains()) == chains
+            assert pdb.nb_chains == 3
+
+    def test_streaming_error(self, monkeypatch, tmpdir):
+        """
+        Test that an error late in a file does not prevent reading the first chains
+        """
+        monkeypatch.setattr(pbx.structure.PDB, 'BLOCK_SIZE', 4096)
+        filename = os.path.join(str(tmpdir), "broken.pdb")
+        with open(os.path.join(here, "test_data/1BTA.pdb")) as f_in:
+            content = f_in.read()
+        with open(filename, "w") as f_out:
+            f_out.write(content + "TER\n" + content.replace("ATOM     10", "ATOM  xxxxx"))
+        chains = pbx.structure.PDB.PDB(filename).get_chains()
+        assert next(chains).size() == 1434
+        with pytest.raises(ValueError):
+            next(chains)
+
     @pytest.mark.parametrize(
         'index,ref',
         ((0, "ATOM      1    N LYS A   1      -8.655   5.770   8.371  0.00  0.00              "),
@@ -382,6 +662,1321 @@ class TestPDBClass(object):
         assert chain[-1].format() == ref_last
 
 
+class TestSelection(object):
+    """
+    Tests for the selection of atoms while reading files
+    """
+
+    @pytest.mark.parametrize(
+        'models,ranges',
+        ((3, [(3, 3)]),
+         ("1-10,15", [(1, 10), (15, 15)]),
+         (range(500, 601), [(500, 600)]),
+         ([1, 2, 3, 7], [(1, 3), (7, 7)]))
+    )
+    def test_models(self, models, ranges):
+        """
+        Tests for the model specifications
+        """
+        selection = pbx.structure.Selection(models=models)
+        assert selection.models == ranges
+        assert selection.match_model(ranges[0][0])
+        assert not selection.match_model(ranges[-1][1] + 1)
+
+    def test_invalid_models(self):
+        """
+        Test an invalid model specification
+        """
+        with pytest.raises(ValueError):
+            pbx.structure.Selection(models="1-2-3")
+
+    @pytest.mark.parametrize('extension', ('.pdb', '.cif.gz'))
+    def test_select_models(self, extension):
+        """
+        Test reading a subset of the models
+        """
+        filename = os.path.join(here, "test_data/2LFU" + extension)
+        selection = pbx.structure.Selection(models="2-3")
+        chains = list(pbx.structure.PDB.PDB(filename, selection).get_chains())
+        assert [chain.model for chain in chains] == ["2", "3"]
+        assert chains[0].size() == 2372
+
+    @pytest.mark.parametrize('extension', ('.pdb', '.cif.gz'))
+    def test_select_chains_and_atoms(self, extension):
+        """
+        Test reading the backbone of one chain
+        """
+        filename = os.path.join(here, "test_data/1AY7" + extension)
+        selection = pbx.structure.Selection(
+            atom_names=pbx.structure.BACKBONE_ATOMS, chains=["B"])
+        chains = list(pbx.structure.PDB.PDB(filename, selection).get_chains())
+        ref = [chain for chain in pbx.structure.PDB.PDB(filename).get_chains()
+               if chain.name == "B"][0]
+        assert len(chains) == 1
+        assert chains[0].name == "B"
+        assert set(chains[0].atom_names) == {"N", "CA", "C", "O"}
+        assert chains[0].size() == ref.atom_name_mask(pbx.structure.BACKBONE_ATOMS).sum()
+        assert (pbx.assign(chains[0].get_phi_psi_angles())
+                == pbx.assign(ref.get_phi_psi_angles()))
+
+
+class TestPDBParser(object):
+    """
+    Tests for the bulk PDB parser
+    """
+
+    lines = ("MODEL        1",
+             "ATOM      1  N   ALA A   1      11.104   6.134  -6.504  1.00  0.00           N",
+             "ATOM      2  CA  ALA A   1      11.639   6.071  -5.147  1.00  0.00           C",
+             "TER",
+             "ATOM      3  N   GLY B   1       1.104   6.134  -6.504  1.00  0.00           N",
+             "ATOM      4  CA  GLY B   1       1.639   6.071  -5.147  1.00  0.00           C",
+             "ENDMDL",
+             "MODEL        2",
+             "ATOM      1  N   ALA A   1      12.104   6.134  -6.504  1.00  0.00           N",
+             "HETATM    2  O   HOH A   2      12.639   6.071  -5.147  1.00  0.00           O",
+             "ATOM      3  N   GLY B   1       2.104   6.134  -6.504  1.00  0.00           N",
+             "ENDMDL")
+
+    @staticmethod
+    def _parse(blocks):
+        parser = pbx.structure.parsers.PDBParser()
+        chains = []
+        for block in blocks:
+            chains += parser.feed(block)
+        return chains + parser.close()
+
+    def test_models_and_chains(self):
+        """
+        Test how the atoms are split in chains
+        """
+        content = "\n".join(self.lines).encode()
+        chains = self._parse([content])
+        assert [(chain.name, chain.model, chain.size()) for chain in chains] == \
+               [("A", "1", 2), ("B", "", 2), ("A", "2", 1), ("B", "", 1)]
+        assert chains[1][1].format() == \
+               "ATOM      4   CA GLY B   1       1.639   6.071  -5.147  0.00  0.00              "
+
+    @pytest.mark.parametrize('size', (1, 2, 5))
+    def test_blocks(self, size):
+        """
+        Test that reading a file in several blocks gives the same chains
+        """
+        content = ["\n".join(self.lines[begin:begin + size]).encode() + b"\n"
+                   for begin in range(0, len(self.lines), size)]
+        whole = self._parse([b"".join(content)])
+        chains = self._parse(content)
+        assert [format(chain) for chain in chains] == [format(chain) for chain in whole]
+        for chain, ref in zip(chains, whole):
+            assert [atom.format() for atom in chain] == [atom.format() for atom in ref]
+
+    def test_same_atoms_as_line_reader(self):
+        """
+        Test that the bulk parser decodes the atoms as Atom.read_from_PDB
+        """
+        filename = os.path.join(here, "test_data/1AY7.pdb")
+        with open(filename) as f_in:
+            ref = [structure.Atom.read_from_PDB(line).format()
+                   for line in f_in if line.startswith("ATOM  ")]
+        with open(filename, 'rb') as f_in:
+            chains = self._parse([f_in.read()])
+        assert [atom.format() for chain in chains for atom in chain] == ref
+
+    def test_bfactors(self):
+        """
+        Test that the B-factors are read, and are 0 when the column is blank
+        """
+        filename = os.path.join(here, "test_data/1AY7.pdb")
+        with open(filename) as f_in:
+            ref = [structure.Atom.read_from_PDB(line).bfactor
+                   for line in f_in if line.startswith("ATOM  ")]
+        with open(filename, 'rb') as f_in:
+            chains = self._parse([f_in.read()])
+        bfactors = numpy.concatenate([chain.bfactors for chain in chains])
+        assert bfactors.tolist() == ref
+        chain, = self._parse([b"ATOM      1  N   ALA A   1      11.104   6.134  -6.504\n"
+                              b"ATOM      2  CA  ALA A   1      11.639   6.071  -5.147  1.00 87.50\n"])
+        assert chain.bfactors.tolist() == [0.0, 87.5]
+        # A B-factor that is not a number does not prevent reading the file.
+        lines = (b"ATOM      1  N   ALA A   1      11.104   6.134  -6.504  1.00 xx.xx\n"
+                 b"ATOM      2  CA  ALA A   1      11.639   6.071  -5.147  1.00 87.50\n")
+        chain, = self._parse([lines])
+        assert chain.bfactors.tolist() == [0.0, 87.5]
+        assert [structure.Atom.read_from_PDB(line.decode()).bfactor
+                for line in lines.splitlines(True)] == [0.0, 87.5]
+
+    def test_line_too_short(self):
+        """
+        Test when an ATOM line is too short
+        """
+        with pytest.raises(structure.AtomError):
+            self._parse([b"ATOM    512  N   GLU A  32      -1.870  -9.835\n"])
+
+
+class TestPDBxParser(object):
+    """
+    Tests for the PDBx/mmCIF parser
+    """
+
+    lines = ("data_TEST",
+             "loop_",
+             "_entity.id",
+             "1",
+             "#",
+             "loop_",
+             "_atom_site.group_PDB",
+             "_atom_site.id",
+             "_atom_site.label_atom_id",
+             "_atom_site.label_comp_id",
+             "_atom_site.label_asym_id",
+             "_atom_site.label_seq_id",
+             "_atom_site.Cartn_x",
+             "_atom_site.Cartn_y",
+             "_atom_site.Cartn_z",
+             "_atom_site.pdbx_PDB_model_num",
+             "ATOM 1 N ALA A 1 11.104 6.134 -6.504 1",
+             "ATOM 2 CA ALA A 1 11.639 6.071 -5.147 1",
+             "HETATM 3 O HOH A . 1.0 1.0 1.0 1",
+             "ATOM 4 \"O5'\" DA B 1 1.104 6.134",
+             "-6.504 1",
+             "ATOM 5 'C 1' DA B 1 1.639 6.071 -5.147 1",
+             "ATOM 6 N ALA A 1 12.104 6.134 -6.504 2",
+             "ATOM 7 CA ALA A 1 12.639 6.071 -5.147 2",
+             "#",
+             "loop_",
+             "_other.id",
+             "ATOM")
+
+    @staticmethod
+    def _parse(blocks):
+        parser = pbx.structure.parsers.PDBxParser()
+        chains = []
+        for block in blocks:
+            chains += parser.feed(block)
+        return chains + parser.close()
+
+    @pytest.mark.parametrize(
+        'line,tokens',
+        (("ATOM 1 N ALA", ["ATOM", "1", "N", "ALA"]),
+         ("ATOM 4 \"O5'\" DA", ["ATOM", "4", "O5'", "DA"]),
+         ("ATOM 5 'C 1' C'", ["ATOM", "5", "C 1", "C'"]),
+         ("'it''s' 'a'", ["it''s", "a"]))
+    )
+    def test_tokenize(self, line, tokens):
+        """
+        Tests for the tokenizer
+        """
+        assert pbx.structure.parsers.tokenize_pdbx_line(line) == tokens
+
+    def test_models_and_chains(self):
+        """
+        Test how the atoms are split in chains
+        """
+        chains = self._parse([self.lines])
+        assert [(chain.name, chain.model, chain.size()) for chain in chains] == \
+               [("A", "", 2), ("B", "1", 2), ("A", "2", 2)]
+        assert list(chains[1].atom_names) == ["O5'", "C 1"]
+        numpy.testing.assert_array_equal(chains[1].coords[0], [1.104, 6.134, -6.504])
+
+    @pytest.mark.parametrize('size', (1, 3, 17))
+    def test_blocks(self, size):
+        """
+        Test that reading a file in several blocks gives the same chains
+        """
+        blocks = [self.lines[begin:begin + size]
+                  for begin in range(0, len(self.lines), size)]
+        chains = self._parse(blocks)
+        whole = self._parse([self.lines])
+        assert [format(chain) for chain in chains] == [format(chain) for chain in whole]
+        for chain, ref in zip(chains, whole):
+            assert [atom.format() for atom in chain] == [atom.format() for atom in ref]
+
+    def test_same_atoms_as_line_reader(self):
+        """
+        Test that the parser decodes the atoms as Atom.read_from_PDBx
+        """
+        filename = os.path.join(here, "test_data/1AY7.cif.gz")
+        with gzip.open(filename, 'rt') as f_in:
+            lines = f_in.readlines()
+        fields = [line.strip().replace("_atom_site.", "") for line in lines
+                  if line.startswith("_atom_site.")]
+        ref = [structure.Atom.read_from_PDBx(line, fields).format()
+               for line in lines if line.startswith("ATOM")]
+        chains = self._parse([lines])
+        assert [atom.format() for chain in chains for atom in chain] == ref
+        ref = [structure.Atom.read_from_PDBx(line, fields).bfactor
+               for line in lines if line.startswith("ATOM")]
+        assert [atom.bfactor for chain in chains for atom in chain] == ref
+
+    def test_bfactors(self):
+        """
+        Test that the B-factors are read when the field is there
+        """
+        chains = self._parse([self.lines])
+        assert all(not chain.bfactors.any() for chain in chains)
+        lines = []
+        for line in self.lines:
+            if line == "_atom_site.pdbx_PDB_model_num":
+                line += "\n_atom_site.B_iso_or_equiv"
+            elif line.startswith("ATOM 1 "):
+                line += " 75.5"
+            elif line.startswith("ATOM 2 "):
+                line += " ?"
+            elif not line.startswith(("ATOM 4 ", "_", "#", "loop_", "data_")):
+                # the row of atom 4 ends on the next line
+                line += " 50.0"
+            lines += line.split("\n")
+        chains = self._parse([lines])
+        assert chains[0].bfactors.tolist() == [75.5, 0.0]
+        assert chains[1].bfactors.tolist() == [50.0, 50.0]
+
+    def test_missing_field(self):
+        """
+        Test when a required field is missing
+        """
+        lines = [line for line in self.lines if "Cartn_z" not in line]
+        with pytest.raises(structure.AtomError):
+            self._parse([lines])
+
+    def test_bad_value(self):
+        """
+        Test when a value cannot be converted
+        """
+        lines = [line.replace("11.104", "XXX") for line in self.lines]
+        with pytest.raises(structure.AtomError):
+            self._parse([lines])
+
+
+@pytest.mark.skipif(not pbx.structure.binarycif.IS_MSGPACK,
+                    reason="msgpack is not present")
+class TestBinaryCIF(object):
+    """
+    Tests for the BinaryCIF reader
+    """
+
+    @pytest.mark.parametrize(
+        'data,encodings,ref',
+        ((numpy.array([1, 2, 3], dtype='<i4').tobytes(),
+          [{'kind': 'ByteArray', 'type': 3}], [1, 2, 3]),
+         (numpy.array([1105, -2500], dtype='<i2').tobytes(),
+          [{'kind': 'FixedPoint', 'factor': 100, 'srcType': 33},
+           {'kind': 'ByteArray', 'type': 2}], [11.05, -25.0]),
+         (numpy.array([3, 2, 7, 1], dtype='<u1').tobytes(),
+          [{'kind': 'RunLength', 'srcType': 3, 'srcSize': 3},
+           {'kind': 'ByteArray', 'type': 4}], [3, 3, 7]),
+         (numpy.array([10, 1, 1, -2], dtype='<i1').tobytes(),
+          [{'kind': 'Delta', 'origin': 1000, 'srcType': 3},
+           {'kind': 'ByteArray', 'type': 1}], [1010, 1011, 1012, 1010]),
+         (numpy.array([127, 127, 6, -128, -1, 5], dtype='<i1').tobytes(),
+          [{'kind': 'IntegerPacking', 'byteCount': 1, 'isUnsigned': False,
+            'srcSize': 3},
+           {'kind': 'ByteArray', 'type': 1}], [260, -129, 5]),
+         (numpy.array([0, 2, 4], dtype='<u1').tobytes(),
+          [{'kind': 'IntervalQuantization', 'min': 1.0, 'max': 2.0,
+            'numSteps': 5, 'srcType': 32},
+           {'kind': 'ByteArray', 'type': 4}], [1.0, 1.5, 2.0]))
+    )
+    def test_decode(self, data, encodings, ref):
+        """
+        Test the decoding of numeric arrays
+        """
+        values = pbx.structure.binarycif.decode(data, encodings)
+        numpy.testing.assert_allclose(values, ref)
+
+    def test_decode_strings(self):
+        """
+        Test the decoding of string arrays
+        """
+        encoding = {
+            'kind': 'StringArray',
+            'dataEncoding': [{'kind': 'ByteArray', 'type': 3}],
+            'stringData': 'CAN',
+            'offsets': numpy.array([0, 2, 3], dtype='<i4').tobytes(),
+            'offsetEncoding': [{'kind': 'ByteArray', 'type': 3}],
+        }
+        data = numpy.array([1, 0, -1, 0], dtype='<i4').tobytes()
+        codes, labels = pbx.structure.binarycif.decode(data, [encoding])
+        assert labels == ['CA', 'N']
+        assert list(codes) == [1, 0, -1, 0]
+
+    @pytest.mark.parametrize(
+        'selection',
+        (None,
+         pbx.structure.Selection(models='2-3'),
+         pbx.structure.Selection(chains=['B'], atom_names=['CA']))
+    )
+    @pytest.mark.parametrize('name', ('1AY7', '2LFU'))
+    def test_same_chains_as_PDBx(self, tmpdir, name, selection):
+        """
+        Test that a BinaryCIF file gives the chains of its PDBx/mmCIF version
+        """
+        # Read the uncompressed file too.
+        filename = os.path.join(str(tmpdir), name + ".bcif")
+        with gzip.open(os.path.join(here, "test_data", name + ".bcif.gz")) as f_in:
+            with open(filename, "wb") as f_out:
+                f_out.write(f_in.read())
+        ref = pbx.structure.PDB.PDB(
+            os.path.join(here, "test_data", name + ".cif.gz"), selection).chains
+        chains = pbx.structure.PDB.PDB(filename, selection).chains
+        assert ([(chain.name, chain.model, list(chain.atom_names),
+                  list(chain.resnames), list(chain.resids), list(chain.ids))
+                 for chain in chains]
+                == [(chain.name, chain.model, list(chain.atom_names),
+                     list(chain.resnames), list(chain.resids), list(chain.ids))
+                    for chain in ref])
+        for chain, ref_chain in zip(chains, ref):
+            numpy.testing.assert_array_equal(chain.coords, ref_chain.coords)
+
+    def test_missing_category(self):
+        """
+        Test a file without _atom_site category
+        """
+        import msgpack
+        data = msgpack.packb({'version': '0.3.0', 'encoder': 'test',
+                              'dataBlocks': [{'header': 'TEST',
+                                              'categories': []}]})
+        with pytest.raises(structure.AtomError):
+            pbx.structure.binarycif.read_binary_cif(data)
+
+
+class TestArchive(object):
+    """
+    Tests for reading structure files from archives
+    """
+    names = ("1AY7.pdb", "2LFU.cif.gz", "1BTA.pdb")
+
+    @classmethod
+    def _make_archive(cls, tmpdir, extension):
+        import tarfile
+        import zipfile
+        path = os.path.join(str(tmpdir), "structures" + extension)
+        if extension == ".zip":
+            with zipfile.ZipFile(path, "w") as archive:
+                for name in cls.names:
+                    archive.write(os.path.join(here, "test_data", name),
+                                  "set/" + name)
+                archive.writestr("set/README", "not a structure")
+        else:
+            with tarfile.open(path, "w:gz" if extension == ".tar.gz" else "w") as archive:
+                for name in cls.names:
+                    archive.add(os.path.join(here, "test_data", name),
+                                "set/" + name)
+                archive.add(os.path.join(here, "test_data", "barstar_md_traj.gro"),
+                            "set/README")
+        return path
+
+    @pytest.mark.parametrize('extension', ('.tar', '.tar.gz', '.zip'))
+    def test_chains_from_files(self, tmpdir, extension):
+        """
+        Test that the files of an archive give the chains of the files
+        """
+        path = self._make_archive(tmpdir, extension)
+        assert pbx.structure.archive.is_archive(path)
+        chains = list(pbx.chains_from_files([path]))
+        ref = list(pbx.chains_from_files(
+            [os.path.join(here, "test_data", name) for name in self.names]))
+        assert [comment for comment, _ in chains] == \
+               [comment.replace(os.path.join(here, "test_data") + os.sep, "set/")
+                for comment, _ in ref]
+        for (_, chain), (_, ref_chain) in zip(chains, ref):
+            assert [atom.format() for atom in chain] == \
+                   [atom.format() for atom in ref_chain]
+
+    def test_selection(self, tmpdir):
+        """
+        Test that the selection applies to the files of an archive
+        """
+        path = self._make_archive(tmpdir, ".tar.gz")
+        selection = pbx.structure.Selection(chains=['B'], atom_names=['CA'])
+        chains = list(pbx.chains_from_files([path], selection))
+        assert [comment for comment, _ in chains] == ["set/1AY7.pdb | chain B"]
+        assert set(chains[0][1].atom_names) == {'CA'}
+
+
+class TestStandardInput(object):
+    """
+    Tests for reading structure files from a stream
+    """
+
+    @pytest.mark.parametrize('name, extension', (
+        ("1AY7.pdb", ".pdb"),
+        ("1AY7.pdb.gz", ".pdb.gz"),
+        ("1AY7.cif.gz", ".cif.gz"),
+        ("1AY7.bcif.gz", ".bcif.gz"),
+        ("test_fail.pdb", ".pdb"),
+    ))
+    def test_sniff_extension(self, name, extension):
+        """
+        Test that the format of a file is guessed from its first bytes
+        """
+        with open(os.path.join(here, "test_data", name), 'rb') as f_in:
+            head = f_in.read(pbx.structure.PDB.SNIFF_SIZE)
+        assert pbx.structure.PDB.sniff_extension(head) == extension
+
+    def test_sniff_comments(self):
+        """
+        Test that PDBx/mmCIF files are recognized after their comments
+        """
+        head = b"# generated\n\n data_1AY7\n#\n"
+        assert pbx.structure.PDB.sniff_extension(head) == ".cif"
+        assert pbx.structure.PDB.sniff_extension(gzip.compress(head)) == ".cif.gz"
+
+    @pytest.mark.parametrize('name, extension', (
+        ("1AY7.pdb", None),
+        ("2LFU.cif.gz", None),
+        ("2LFU.cif.gz", ".cif"),
+    ))
+    def test_chains_from_stdin(self, monkeypatch, name, extension):
+        """
+        Test that the standard input gives the chains of the file
+        """
+        import io
+        filename = os.path.join(here, "test_data", name)
+        with open(filename, 'rb') as f_in:
+            stdin = io.TextIOWrapper(io.BytesIO(f_in.read()))
+        monkeypatch.setattr('sys.stdin', stdin)
+        if extension is not None:
+            # a tiny head checks the replay of the bytes read at first
+            monkeypatch.setattr(pbx.structure.PDB, 'SNIFF_SIZE', 10)
+        chains = list(pbx.chains_from_files([pbx.STDIN], stdin_format=extension))
+        ref = list(pbx.chains_from_files([filename]))
+        assert [comment for comment, _ in chains] == \
+               [comment.replace(filename, 'stdin') for comment, _ in ref]
+        for (_, chain), (_, ref_chain) in zip(chains, ref):
+            assert [atom.format() for atom in chain] == \
+                   [atom.format() for atom in ref_chain]
+
+
+class TestStructureIndex(object):
+    """
+    Tests for the index of the chains of structure files
+    """
+
+    @staticmethod
+    def _describe(chains):
+        return [(chain.name, chain.model, [atom.format() for atom in chain])
+                for chain in chains]
+
+    @pytest.mark.parametrize('name', ('2LFU.pdb', '2LFU.cif.gz',
+                                      '1AY7.pdb', '1AY7.pdb.gz'))
+    @pytest.mark.parametrize(
+        'selection',
+        (pbx.structure.Selection(models='2-3'),
+         pbx.structure.Selection(models=[1, 3], atom_names=['CA']),
+         pbx.structure.Selection(chains=['B']),
+         pbx.structure.Selection(models=range(1, 100)))
+    )
+    def test_same_chains(self, name, selection):
+        """
+        Test that reading from the index gives the chains read from the start
+        """
+        filename = os.path.join(here, "test_data", name)
+        index = pbx.structure.StructureIndex.build(filename)
+        ref = pbx.structure.PDB.PDB(filename, selection).chains
+        chains = pbx.structure.PDB.PDB(filename, selection, index=index).chains
+        assert self._describe(chains) == self._describe(ref)
+
+    def test_entries(self):
+        """
+        Test the content of the index of a PDB file
+        """
+        filename = os.path.join(here, "test_data/1AY7.pdb")
+        index = pbx.structure.StructureIndex.build(filename)
+        assert len(index) == 2
+        assert list(index.chains) == ["A", "B"]
+        assert list(index.model_numbers) == [1, 1]
+        with open(filename, 'rb') as f_in:
+            content = f_in.read()
+        assert content[index.starts[1]:].startswith(b"ATOM    753")
+        assert index.stops[0] == index.starts[1]
+        assert index.ranges([0, 1]) == [(index.starts[0], index.stops[1])]
+
+    def test_save_and_load(self, tmpdir):
+        """
+        Test that the index is saved next to the file, and rebuilt when the
+        file changes
+        """
+        filename = os.path.join(str(tmpdir), "2LFU.pdb")
+        with open(os.path.join(here, "test_data/2LFU.pdb")) as f_in:
+            content = f_in.read()
+        with open(filename, "w") as f_out:
+            f_out.write(content)
+        selection = pbx.structure.Selection(models='3')
+        pdb = pbx.structure.PDB.PDB(filename, selection, index=True)
+        assert [chain.model for chain in pdb.get_chains()] == ["3"]
+        path = filename + pbx.structure.INDEX_SUFFIX
+        assert os.path.isfile(path)
+        index = pbx.structure.StructureIndex.load(path)
+        assert index.is_valid_for(filename)
+        assert list(index.model_numbers) == [1, 2, 3]
+
+        # Only the two first models remain.
+        with open(filename, "w") as f_out:
+            f_out.write(content[:content.index("MODEL        3")])
+        os.utime(filename, ns=(0, 0))
+        assert not index.is_valid_for(filename)
+        pdb = pbx.structure.PDB.PDB(filename, selection, index=True)
+        assert pdb.chains == []
+        assert len(pbx.structure.StructureIndex.load(path)) == 2
+
+    @pytest.mark.skipif(not pbx.structure.index.IS_INDEXED_GZIP,
+                        reason="indexed_gzip is not present")
+    @pytest.mark.parametrize(
+        'name,selection',
+        (('2LFU.cif.gz', pbx.structure.Selection(models='2-3')),
+         ('1AY7.pdb.gz', pbx.structure.Selection(chains=['B'])))
+    )
+    def test_gzip_checkpoints(self, monkeypatch, tmpdir, name, selection):
+        """
+        Test that compressed files are read from decompression checkpoints
+        """
+        monkeypatch.setattr(pbx.structure.index, 'GZIP_SPACING', 1 << 16)
+        filename = os.path.join(here, "test_data", name)
+        index = pbx.structure.StructureIndex.build(filename)
+        assert index.checkpoints
+        path = os.path.join(str(tmpdir), name + pbx.structure.INDEX_SUFFIX)
+        index.save(path)
+        index = pbx.structure.StructureIndex.load(path)
+        with gzip.open(filename, 'rb') as f_in:
+            content = f_in.read()
+        with index.open(filename) as f_in:
+            for start, stop in zip(index.starts[::-1], index.stops[::-1]):
+                f_in.seek(start)
+                assert f_in.read(stop - start) == content[start:stop]
+        ref = pbx.structure.PDB.PDB(filename, selection).chains
+        chains = pbx.structure.PDB.PDB(filename, selection, index=index).chains
+        assert chains
+        assert self._describe(chains) == self._describe(ref)
+
+    def test_chains_from_files(self, tmpdir):
+        """
+        Test that chains_from_files reads the selected models from the index
+        """
+        filename = os.path.join(str(tmpdir), "2LFU.cif.gz")
+        with open(os.path.join(here, "test_data/2LFU.cif.gz"), "rb") as f_in:
+            with open(filename, "wb") as f_out:
+                f_out.write(f_in.read())
+        selection = pbx.structure.Selection(models='2')
+        ref = pbx.structure.PDB.PDB(filename, selection).chains
+        chains = [chain for _, chain in
+                  pbx.chains_from_files([filename], selection, index=True)]
+        assert self._describe(chains) == self._describe(ref)
+        assert os.path.isfile(filename + pbx.structure.INDEX_SUFFIX)
+
+
+    def test_partition(self):
+        """
+        Test that the entries are split between models
+        """
+        index = pbx.structure.StructureIndex.build(
+            os.path.join(here, "test_data/2LFU.pdb"))
+        entries = index.select(None)
+        parts = index.partition(entries, 2)
+        assert len(parts) == 2
+        assert numpy.concatenate(parts).tolist() == entries.tolist()
+        assert len(index.partition(entries, 10)) == len(entries)
+        assert index.partition(entries[:0], 2) == []
+
+    def test_partition_chains(self, tmpdir):
+        """
+        Test that the chains of a model stay in the same group
+        """
+        with open(os.path.join(here, "test_data/1AY7.pdb")) as f_in:
+            atoms = [line for line in f_in if line.startswith("ATOM")]
+        filename = os.path.join(str(tmpdir), "models.pdb")
+        with open(filename, "w") as f_out:
+            for model in range(1, 5):
+                f_out.write("MODEL     {0:4d}\n".format(model))
+                f_out.writelines(atoms)
+                f_out.write("ENDMDL\n")
+        index = pbx.structure.StructureIndex.build(filename)
+        entries = index.select(None)
+        assert len(entries) == 8
+        for nb_parts in (2, 3, 8):
+            parts = index.partition(entries, nb_parts)
+            assert numpy.concatenate(parts).tolist() == entries.tolist()
+            for part in parts:
+                assert len(part) % 2 == 0
+                assert (index.model_numbers[part[::2]]
+                        == index.model_numbers[part[1::2]]).all()
+        assert len(index.partition(entries, 8)) == 4
+
+
+class TestParallel(object):
+    """
+    Tests for the assignment of files with several processes
+    """
+
+    @pytest.mark.parametrize('name, selection', (
+        ("2LFU.pdb", None),
+        ("2LFU.cif.gz", None),
+        ("2LFU.pdb", pbx.structure.Selection(models='1,3')),
+        ("1AY7.pdb", pbx.structure.Selection(chains=['B'])),
+        ("test_fail.pdb", None),
+        ("3ICH.bcif.gz", None),
+    ))
+    def test_same_sequences(self, name, selection):
+        """
+        Test that the sequences are the ones of the chains, in file order
+        """
+        if name.endswith('.bcif.gz') and not pbx.structure.binarycif.IS_MSGPACK:
+            pytest.skip("msgpack is not present")
+        filename = os.path.join(here, "test_data", name)
+        ref = []
+        for comment, chain in pbx.chains_from_files([filename], selection):
+            try:
+                ref.append((comment, pbx.assign(chain.get_phi_psi_angles())))
+            except FloatingPointError:
+                ref.append((comment, None))
+        results = pbx.parallel.assign_files([filename], selection, processes=2)
+        assert list(results) == ref
+        assert not os.path.isfile(filename + pbx.structure.INDEX_SUFFIX)
+
+    def test_one_pool(self, monkeypatch):
+        """
+        Test that the files are assigned by the same pool of processes
+        """
+        pools = []
+        context = pbx.parallel._CONTEXT
+
+        class Context(object):
+            @staticmethod
+            def Pool(*args, **kwargs):
+                pools.append(args)
+                return context.Pool(*args, **kwargs)
+
+        monkeypatch.setattr(pbx.parallel, '_CONTEXT', Context)
+        names = ("2LFU.pdb", "1AY7.pdb", "2LFU.cif.gz")
+        filenames = [os.path.join(here, "test_data", name) for name in names]
+        ref = [comment for comment, _ in pbx.chains_from_files(filenames)]
+        results = pbx.parallel.assign_files(filenames, processes=2)
+        assert [comment for comment, _ in results] == ref
+        assert len(pools) == 1
+
+    @pytest.mark.skipif(not pbx.structure.binarycif.IS_MSGPACK,
+                        reason="msgpack is not present")
+    def test_index_not_split(self, monkeypatch):
+        """
+        Test that the index option is given for the files read in the current
+        process
+        """
+        calls = []
+        chains_from_files = pbx.parallel.chains_from_files
+
+        def record(path_list, selection=None, **kwargs):
+            calls.append(kwargs)
+            return chains_from_files(path_list, selection, **kwargs)
+
+        monkeypatch.setattr(pbx.parallel, 'chains_from_files', record)
+        filename = os.path.join(here, "test_data", "3ICH.bcif.gz")
+        results = list(pbx.parallel.assign_files([filename], index=True,
+                                                 processes=2))
+        assert len(results) == 1
+        assert [kwargs['index'] for kwargs in calls] == [True]
+
+
+class TestStructureCache(object):
+    """
+    Tests for the cache of the backbone and angles of structure files
+    """
+
+    @staticmethod
+    @pytest.fixture
+    def structure(tmpdir):
+        filename = os.path.join(str(tmpdir), "1AY7.pdb")
+        with open(os.path.join(here, "test_data/1AY7.pdb")) as f_in:
+            with open(filename, "w") as f_out:
+                f_out.write(f_in.read())
+        return filename
+
+    @staticmethod
+    def _read(filename, cache):
+        return [chain for _, chain in
+                pbx.chains_from_files([filename], cache=cache)]
+
+    def test_round_trip(self, tmpdir, structure):
+        """
+        Test that the cached chains have the backbone and the angles of the
+        chains read from the file
+        """
+        cache = pbx.structure.StructureCache(os.path.join(str(tmpdir), "cache"))
+        assert cache.read(structure) is None
+        ref = self._read(structure, cache)
+        chains = cache.read(structure)
+        assert [(chain.name, chain.model) for chain in chains] == \
+               [(chain.name, chain.model) for chain in ref]
+        for chain, ref_chain in zip(chains, ref):
+            mask = ref_chain.atom_name_mask(pbx.structure.BACKBONE_ATOMS)
+            assert [atom.format() for atom in chain] == \
+                   [atom.format() for atom, keep in zip(ref_chain, mask) if keep]
+            assert chain._phi_psi_angles is not None
+            assert chain.get_phi_psi_angles() == ref_chain.get_phi_psi_angles()
+            # The masked residues are applied to the cached angles.
+            masked = set(numpy.unique(ref_chain.resids)[:20].tolist())
+            angles = chain.get_phi_psi_angles(masked)
+            assert angles == ref_chain.get_phi_psi_angles(masked)
+            assert angles != chain.get_phi_psi_angles()
+            # The angles are computed again once the chain changes.
+            chain.set_coordinates(chain.coords + 1.0)
+            assert chain._phi_psi_angles is None
+
+    def test_cached_arrays(self, tmpdir, structure, monkeypatch):
+        """
+        Test that the arrays of angles of cached chains are not computed
+        again
+        """
+        cache = pbx.structure.StructureCache(os.path.join(str(tmpdir), "cache"))
+        ref = self._read(structure, cache)
+        masked = set(range(1, 21))
+        ref_arrays = [chain.get_phi_psi_arrays() for chain in ref]
+        ref_masked = [chain.get_phi_psi_arrays(masked) for chain in ref]
+        ref_sequences = pbx.Assigner().assign_chains(ref)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("the angles are computed again")
+
+        monkeypatch.setattr(pbx.structure.structure, 'backbone_dihedrals', fail)
+        chains = cache.read(structure)
+        for chain, arrays, masked_arrays in zip(chains, ref_arrays, ref_masked):
+            for values, ref_values in zip(chain.get_phi_psi_arrays(), arrays):
+                numpy.testing.assert_array_equal(values, ref_values)
+            for values, ref_values in zip(chain.get_phi_psi_arrays(masked),
+                                          masked_arrays):
+                numpy.testing.assert_array_equal(values, ref_values)
+        assert pbx.Assigner().assign_chains(chains) == ref_sequences
+        # Single precision angles are computed from the coordinates.
+        with pytest.raises(AssertionError):
+            chains[0].get_phi_psi_arrays(dtype=numpy.float32)
+
+    def test_concurrent_writers(self, tmpdir, monkeypatch):
+        """
+        Test that the writers of an entry use their own temporary file
+        """
+        cache = pbx.structure.StructureCache(os.path.join(str(tmpdir), "cache"))
+        path = os.path.join(cache.directory, "entry.npz")
+        temporaries = []
+        replace = os.replace
+
+        def record(source, destination):
+            temporaries.append(source)
+            replace(source, destination)
+
+        monkeypatch.setattr(pbx.structure.cache.os, 'replace', record)
+        cache._save(path, {'value': numpy.arange(3)})
+        cache._save(path, {'value': numpy.arange(4)})
+        assert len(set(temporaries)) == 2
+        assert all(os.path.dirname(temporary) == cache.directory
+                   for temporary in temporaries)
+        assert os.listdir(cache.directory) == ["entry.npz"]
+        with numpy.load(path) as data:
+            assert len(data['value']) == 4
+
+    def test_invalidation(self, tmpdir, structure):
+        """
+        Test that an entry is only used while the file has the same content
+        """
+        cache = pbx.structure.StructureCache(os.path.join(str(tmpdir), "cache"))
+        self._read(structure, cache)
+        # Same content, new modification time
+        os.utime(structure, ns=(0, 0))
+        assert cache.read(structure) is not None
+        assert cache.read(structure) is not None
+        # New content with the same size
+        with open(structure) as f_in:
+            content = f_in.read()
+        with open(structure, "w") as f_out:
+            f_out.write(content.replace("11.860", "11.861"))
+        assert cache.read(structure) is None
+        assert cache.entries() == []
+        # The selection is part of the key.
+        selection = pbx.structure.Selection(chains=['B'])
+        self._read(structure, cache)
+        assert cache.read(structure, selection) is None
+
+    def test_eviction(self, tmpdir):
+        """
+        Test that the least recently used entries are removed
+        """
+        cache = pbx.structure.StructureCache(os.path.join(str(tmpdir), "cache"))
+        names = ("1BTA.pdb", "3ICH.pdb", "2LFU.pdb")
+        for name in names:
+            self._read(os.path.join(here, "test_data", name), cache)
+        first, second, third = [cache.entry_path(os.path.join(here, "test_data", name))
+                                for name in names]
+        # The first entry is used again, so the second is the oldest one.
+        os.utime(second, ns=(1, 1))
+        os.utime(third, ns=(2, 2))
+        cache.read(os.path.join(here, "test_data", names[0]))
+        cache.max_size = cache.size() - 1
+        cache.evict()
+        assert set(cache.entries()) == {first, third}
+
+    @pytest.mark.parametrize('split', [None, 'segid'])
+    def test_trajectory_topology(self, tmpdir, structure, split):
+        """
+        Test that the trajectories read with a cached topology give the same
+        chains
+        """
+        cache = pbx.structure.StructureCache(os.path.join(str(tmpdir), "cache"))
+        ref = list(pbx.chains_from_trajectory(structure, structure, split))
+        for run in ('first', 'second'):
+            chains = list(pbx.chains_from_trajectory(structure, structure,
+                                                     split, cache=cache))
+            assert len(cache.entries()) == 1
+            assert [comment for comment, _ in chains] == \
+                   [comment for comment, _ in ref]
+            for (_, chain), (_, ref_chain) in zip(chains, ref):
+                assert [atom.format() for atom in chain] == \
+                       [atom.format() for atom in ref_chain]
+        # The entry is found from the content of the topology.
+        copy = os.path.join(str(tmpdir), "copy.pdb")
+        shutil.copy(structure, copy)
+        assert cache.read_topology(copy, "backbone\n{0}".format(split)) is not None
+        # The trajectory must have the atoms of the topology.
+        with pytest.raises(ValueError):
+            list(pbx.chains_from_trajectory(
+                os.path.join(here, "test_data/barstar_md_traj.xtc"), copy,
+                split, cache=cache))
+
+    def test_trajectory_reader_closed(self, tmpdir, monkeypatch):
+        """
+        Test that the trajectory read with a cached topology is closed
+        """
+        trajectory = os.path.join(here, "test_data/barstar_md_traj.xtc")
+        topology = os.path.join(here, "test_data/barstar_md_traj.gro")
+        cache = pbx.structure.StructureCache(os.path.join(str(tmpdir), "cache"))
+        list(pbx.chains_from_trajectory(trajectory, topology, cache=cache))
+        # The readers are kept, so they are not closed when they are deleted.
+        readers = []
+        closed = []
+        get_reader_for = pbx.structure.loader.get_reader_for
+
+        def reader_for(filename):
+            def open_reader(name):
+                reader = get_reader_for(filename)(name)
+                close = reader.close
+
+                def record():
+                    closed.append(reader)
+                    close()
+
+                reader.close = record
+                readers.append(reader)
+                return reader
+            return open_reader
+
+        monkeypatch.setattr(pbx.structure.loader, 'get_reader_for', reader_for)
+        list(pbx.chains_from_trajectory(trajectory, topology, cache=cache))
+        assert len(readers) == 1
+        assert closed == readers
+        # The reader is also closed when the frames are not all read.
+        chains = pbx.chains_from_trajectory(trajectory, topology, cache=cache)
+        next(chains)
+        chains.close()
+        assert len(readers) == 2
+        assert closed == readers
+
+
+class TestEnsemble(object):
+    """
+    Tests for the ensembles of models with stacked coordinates
+    """
+
+    @staticmethod
+    def _read(name):
+        filename = os.path.join(here, "test_data", name)
+        return list(pbx.structure.PDB.PDB(filename).get_chains())
+
+    @pytest.mark.parametrize('name', ("2LFU.pdb", "1AY7.cif.gz", "test_fail.pdb"))
+    def test_same_as_chains(self, name):
+        """
+        Test that the angles and PBs of an ensemble are the ones of its chains
+        """
+        chains = self._read(name)
+        ensembles = list(ensembles_from_chains(chains))
+        assert sum(len(ensemble) for ensemble in ensembles) == len(chains)
+        models = {(chain.name, chain.model): chain for chain in chains}
+        for ensemble in ensembles:
+            resids, phi, psi, valid = ensemble.get_phi_psi_arrays()
+            sequences = pbx.assign_angles(resids, phi, psi)
+            all_angles = ensemble.get_phi_psi_angles()
+            for model, sequence, model_valid, angles in zip(
+                    ensemble.models, sequences, valid, all_angles):
+                chain = models[(ensemble.name, model)]
+                try:
+                    ref_angles = chain.get_phi_psi_angles()
+                except FloatingPointError:
+                    assert not model_valid
+                    assert angles is None
+                    continue
+                assert model_valid
+                assert sequence == pbx.assign(ref_angles)
+                assert sorted(angles) == sorted(ref_angles)
+                for res in ref_angles:
+                    for key in ('phi', 'psi'):
+                        if ref_angles[res][key] is None:
+                            assert angles[res][key] is None
+                        else:
+                            assert angles[res][key] == \
+                                   pytest.approx(ref_angles[res][key])
+
+    def test_models(self):
+        """
+        Test that the models of an ensemble are the chains it was built from
+        """
+        chains = self._read("2LFU.pdb")
+        ensemble, = ensembles_from_chains(chains)
+        assert format(ensemble) == "Ensemble A: 3 models of 2372 atoms"
+        assert ensemble.coords.shape == (3, 2372, 3)
+        for chain, ref in zip(ensemble, chains):
+            assert [atom.format() for atom in chain] == \
+                   [atom.format() for atom in ref]
+
+    def test_new_topology(self):
+        """
+        Test that a model with other atoms starts a new ensemble
+        """
+        chains = self._read("2LFU.pdb")
+        chains[1] = chains[1].from_arrays(
+            'A', chains[1].ids[:-1],
+            (chains[1]._name_codes[:-1], chains[1]._name_labels),
+            (chains[1]._resname_codes[:-1], chains[1]._resname_labels),
+            chains[1].resids[:-1], chains[1].coords[:-1], model='2')
+        ensembles = list(ensembles_from_chains(chains))
+        assert [ensemble.models for ensemble in ensembles] == \
+               [['1'], ['2'], ['3']]
+
+    def test_ensembles_from_files(self):
+        """
+        Test that the comments of the models are the ones of the chains
+        """
+        filenames = [os.path.join(here, "test_data", name)
+                     for name in ("2LFU.pdb", "1AY7.pdb")]
+        comments = [comment for comment, _ in pbx.chains_from_files(filenames)]
+        assert [comment for model_comments, _ in pbx.ensembles_from_files(filenames)
+                for comment in model_comments] == comments
+
+
+class TestAssignCoordinates(object):
+    """
+    Tests for the assignment of coordinates arrays
+    """
+
+    def test_assign_codes(self):
+        """
+        Test the codes of the blocks of 1D and 2D arrays of angles
+        """
+        filename = os.path.join(here, "test_data", "2LFU.pdb")
+        chains = list(pbx.structure.PDB.PDB(filename).get_chains())
+        angles = [chain.get_phi_psi_arrays() for chain in chains]
+        resids = angles[0][0]
+        phi = numpy.stack([phi for _, phi, _ in angles])
+        psi = numpy.stack([psi for _, _, psi in angles])
+        codes = pbx.assignment.assign_codes(resids, phi, psi)
+        assert codes.dtype == numpy.uint8
+        assert codes.shape == phi.shape
+        for chain, row in zip(chains, codes):
+            sequence = pbx.assign(chain.get_phi_psi_angles())
+            assert ''.join((pbx.PB.NAMES + 'Z')[code] for code in row) == sequence
+            assert (row == pbx.assignment.Z_CODE).sum() == sequence.count('Z')
+        numpy.testing.assert_array_equal(
+            pbx.assignment.assign_codes(resids, phi[0], psi[0]), codes[0])
+        assert pbx.assign({}) == ''
+
+    @pytest.mark.parametrize('memory', (1, pbx.assignment.DEFAULT_MEMORY))
+    @pytest.mark.parametrize('name', ("2LFU.pdb", "1AY7.cif.gz"))
+    def test_same_as_chains(self, name, memory):
+        """
+        Test that the PBs of each frame are the ones of its chain
+        """
+        filename = os.path.join(here, "test_data", name)
+        chains = list(pbx.structure.PDB.PDB(filename).get_chains())
+        for ensemble in ensembles_from_chains(chains):
+            pb_seqs = pbx.assign_coordinates(ensemble.coords, ensemble.topology,
+                                             memory=memory)
+            resids = ensemble.topology.get_phi_psi_arrays()[0]
+            assert pb_seqs.shape == (len(ensemble), len(resids))
+            assert [row.tobytes().decode() for row in pb_seqs] == \
+                   [pbx.assign(chain.get_phi_psi_angles()) for chain in ensemble]
+
+    @pytest.mark.parametrize('memory', (1, pbx.assignment.DEFAULT_MEMORY))
+    def test_single_precision(self, memory):
+        """
+        Test that few PBs change when frames are assigned in single precision
+        """
+        filename = os.path.join(here, "test_data", "2LFU.pdb")
+        chain = next(pbx.structure.PDB.PDB(filename).get_chains())
+        random = numpy.random.RandomState(42)
+        xyz = (chain.coords + random.normal(0, 0.5, (50, ) + chain.coords.shape))
+        xyz = xyz.astype(numpy.float32)
+        resids, indices = chain._backbone_indices()
+        (phi, psi), _ = pbx.structure.structure.backbone_dihedrals(
+            xyz, resids, indices, numpy.float32)
+        assert phi.dtype == psi.dtype == numpy.float32
+        double = pbx.assign_coordinates(xyz, chain)
+        single = pbx.assign_coordinates(xyz, chain, memory=memory,
+                                        dtype=numpy.float32)
+        assert single.shape == double.shape
+        assert ((single == b'Z') == (double == b'Z')).all()
+        assert (single != double).mean() < 0.01
+
+    def test_memory_groups(self, monkeypatch):
+        """
+        Test that each group of frames that fits in the memory is compared
+        to the blocks at once
+        """
+        filename = os.path.join(here, "test_data", "2LFU.pdb")
+        chain = next(pbx.structure.PDB.PDB(filename).get_chains())
+        xyz = numpy.stack([chain.coords] * 10).astype(numpy.float32)
+        assigner = pbx.Assigner(engine='exact')
+        nb_res = len(chain.get_phi_psi_arrays()[0])
+        # the frames copied from the input are counted in its precision
+        assert (assigner._residue_bytes(numpy.float32)
+                == assigner._residue_bytes() + 12 * 4)
+        memory = 3 * nb_res * assigner._residue_bytes(numpy.float32)
+        calls = []
+        nearest = assigner._nearest_exact
+
+        def record(angles, count=1):
+            calls.append(len(angles))
+            return nearest(angles, count)
+
+        monkeypatch.setattr(assigner, '_nearest_exact', record)
+        codes = assigner.assign_coordinates(xyz, chain, memory=memory)
+        assert len(calls) == 4
+        numpy.testing.assert_array_equal(
+            codes, pbx.Assigner().assign_coordinates(xyz, chain))
+
+    def test_invalid_coordinates(self):
+        """
+        Test that the angles that cannot be computed give Z
+        """
+        filename = os.path.join(here, "test_data", "2LFU.pdb")
+        chain = next(pbx.structure.PDB.PDB(filename).get_chains())
+        xyz = numpy.stack([chain.coords, chain.coords])
+        # all the atoms of a residue at the same position
+        xyz[1, chain.resids == chain.resids[len(chain.resids) // 2]] = 0.0
+        pb_seqs = pbx.assign_coordinates(xyz, chain)
+        assert (pb_seqs[0] != b'Z').sum() > (pb_seqs[1] != b'Z').sum()
+        with pytest.raises(ValueError):
+            pbx.assign_coordinates(xyz[:, 1:], chain)
+
+
+class TestAssigner(object):
+    """
+    Tests for the Assigner class
+    """
+
+    @staticmethod
+    @pytest.fixture
+    def chains():
+        filename = os.path.join(here, "test_data", "2LFU.pdb")
+        return list(pbx.structure.PDB.PDB(filename).get_chains())
+
+    def test_default(self, chains):
+        """
+        Test that the default assigner gives the Protein Blocks
+        """
+        assigner = pbx.Assigner()
+        assert assigner.labels == tuple(pbx.PB.NAMES)
+        assert assigner.z_code == pbx.assignment.Z_CODE
+        assert not assigner.references.flags.writeable
+        ref = [pbx.assign(chain.get_phi_psi_angles()) for chain in chains]
+        assert assigner.assign_chains(chains) == ref
+        assert [assigner.assign(chain.get_phi_psi_angles())
+                for chain in chains] == ref
+
+    def test_custom_references(self, chains):
+        """
+        Test that the names of custom blocks are used
+        """
+        pb_ref = {name.upper(): angles
+                  for name, angles in pbx.PB.REFERENCES.items()}
+        # a name longer than a letter
+        pb_ref['PP'] = pb_ref.pop('P')
+        assigner = pbx.Assigner(pb_ref, unassigned='-')
+        default = pbx.Assigner()
+        for chain in chains:
+            angles = chain.get_phi_psi_angles()
+            codes = assigner.codes(*chain.get_phi_psi_arrays())
+            names = numpy.array(assigner.labels + ('-', ))[codes]
+            ref_names = numpy.array(default.labels + ('Z', ))[
+                default.codes(*chain.get_phi_psi_arrays())]
+            expected = {'Z': '-', 'p': 'PP'}
+            assert list(names) == [expected.get(name, name.upper())
+                                   for name in ref_names]
+            assert assigner.assign(angles) == ''.join(names)
+            assert pbx.assign(angles, pb_ref) == ''.join(names).replace('-', 'Z')
+        with pytest.raises(ValueError):
+            assigner.letters(codes)
+
+    def test_pickle(self, chains):
+        """
+        Test that an assigner can be sent to other processes
+        """
+        import pickle
+        assigner = pickle.loads(pickle.dumps(pbx.Assigner()))
+        assert not assigner.references.flags.writeable
+        assert assigner.assign_chains(chains) == \
+               pbx.Assigner().assign_chains(chains)
+
+    def test_precision(self, chains):
+        """
+        Test the assignment in single precision
+        """
+        assigner = pbx.Assigner(dtype=numpy.float32)
+        assert assigner.references.dtype == numpy.float32
+        for chain, sequence in zip(chains, assigner.assign_chains(chains)):
+            ref = pbx.assign(chain.get_phi_psi_angles())
+            assert len(sequence) == len(ref)
+            assert sum(a != b for a, b in zip(sequence, ref)) <= 1
+
+    @pytest.mark.parametrize('dtype', (float, numpy.float32))
+    def test_embedding(self, chains, dtype):
+        """
+        Test that the embedding engine gives the blocks of the exact engine
+        """
+        exact = pbx.Assigner(dtype=dtype)
+        embedding = pbx.Assigner(dtype=dtype, engine='embedding')
+        assert embedding.assign_chains(chains) == exact.assign_chains(chains)
+
+        random = numpy.random.RandomState(42)
+        nb_res = 500
+        resids = numpy.arange(nb_res)
+        phi = random.uniform(-180, 180, (20, nb_res))
+        psi = random.uniform(-180, 180, (20, nb_res))
+        # residues on the blocks, and halfway between two blocks
+        ref = pbx.PB.REFERENCES
+        phi[0, 2:-2:2] = ref['a'][3]
+        psi[0, 2:-2:2] = ref['a'][4]
+        phi[1, 2:-2] = (ref['d'][3] + ref['c'][3]) / 2
+        psi[1, 2:-2] = (ref['d'][4] + ref['c'][4]) / 2
+        assert (embedding.codes(resids, phi, psi, block_values=1000) ==
+                exact.codes(resids, phi, psi)).all()
+
+    @pytest.mark.parametrize('engine', pbx.assignment.ENGINES)
+    def test_confidence(self, chains, engine):
+        """
+        Test the RMSDA to the nearest blocks given with the codes
+        """
+        assigner = pbx.Assigner(engine=engine)
+        for chain in chains:
+            resids, phi, psi = chain.get_phi_psi_arrays()
+            codes, confidence = assigner.codes(resids, phi, psi,
+                                               confidence=True)
+            assert (codes == assigner.codes(resids, phi, psi)).all()
+            assigned = codes != assigner.z_code
+            assert (numpy.isnan(confidence.rmsda) == ~assigned).all()
+            assert (confidence.second[~assigned] == assigner.z_code).all()
+            # RMSDA of the assigned residues to all the blocks
+            windows = numpy.array([
+                [psi[i - 2], phi[i - 1], psi[i - 1], phi[i],
+                 psi[i], phi[i + 1], psi[i + 1], phi[i + 2]]
+                for i in numpy.flatnonzero(assigned)])
+            diff = (assigner.references - windows[:, numpy.newaxis] + 180) % 360 - 180
+            rmsda = numpy.sqrt(numpy.mean(diff**2, axis=-1))
+            order = numpy.argsort(rmsda, axis=-1, kind='stable')
+            assert (order[:, 0] == codes[assigned]).all()
+            assert (order[:, 1] == confidence.second[assigned]).all()
+            best = numpy.sort(rmsda, axis=-1)
+            assert numpy.allclose(confidence.rmsda[assigned], best[:, 0])
+            assert numpy.allclose(confidence.margin[assigned],
+                                  best[:, 1] - best[:, 0])
+
+    def test_confidence_single_block(self, chains):
+        """
+        Test the confidence with a single block
+        """
+        assigner = pbx.Assigner({'a': pbx.PB.REFERENCES['a']})
+        codes, confidence = assigner.codes(*chains[0].get_phi_psi_arrays(),
+                                           confidence=True)
+        assigned = codes == 0
+        assert assigned.any()
+        assert (confidence.second == assigner.z_code).all()
+        assert numpy.isinf(confidence.margin[assigned]).all()
+
+    @pytest.mark.parametrize('pb_ref', ({}, {'a': [0.0] * 7}))
+    def test_invalid_references(self, pb_ref):
+        """
+        Test that invalid references are refused
+        """
+        with pytest.raises(ValueError):
+            pbx.Assigner(pb_ref)
+        with pytest.raises(ValueError):
+            pbx.Assigner(engine='lookup')
+
+
+@pytest.mark.skipif(not pbx.kernels.IS_NUMBA, reason="numba is not present")
+class TestKernels(object):
+    """
+    Tests for the numba engine
+    """
+
+    @staticmethod
+    @pytest.fixture
+    def chain():
+        filename = os.path.join(here, "test_data", "2LFU.pdb")
+        return next(pbx.structure.PDB.PDB(filename).get_chains())
+
+    def test_default_engine(self):
+        assert pbx.Assigner().engine == 'numba'
+
+    @pytest.mark.parametrize('dtype', (float, numpy.float32))
+    def test_same_codes(self, chain, dtype):
+        """
+        Test that the numba engine gives the blocks and the RMSDA of the
+        exact engine
+        """
+        exact = pbx.Assigner(dtype=dtype, engine='exact')
+        compiled = pbx.Assigner(dtype=dtype, engine='numba')
+        random = numpy.random.RandomState(42)
+        resids = numpy.arange(500)
+        phi = random.uniform(-180, 180, (20, len(resids)))
+        psi = random.uniform(-180, 180, (20, len(resids)))
+        # residues on a block
+        phi[0, 2:-2:2] = pbx.PB.REFERENCES['a'][3]
+        psi[0, 2:-2:2] = pbx.PB.REFERENCES['a'][4]
+        codes, confidence = compiled.codes(resids, phi, psi, confidence=True)
+        ref_codes, ref_confidence = exact.codes(resids, phi, psi,
+                                                confidence=True)
+        numpy.testing.assert_array_equal(codes, ref_codes)
+        for values, ref_values in zip(confidence, ref_confidence):
+            numpy.testing.assert_array_equal(values, ref_values)
+
+    @pytest.mark.parametrize('dtype', (float, numpy.float32))
+    def test_assign_frames(self, chain, dtype):
+        """
+        Test that the frames assigned in one pass give the blocks of the
+        exact engine
+        """
+        random = numpy.random.RandomState(42)
+        xyz = chain.coords + random.normal(0, 0.5, (20, ) + chain.coords.shape)
+        # all the atoms of a residue at the same position
+        xyz[1, chain.resids == chain.resids[len(chain.resids) // 2]] = 0.0
+        codes = pbx.Assigner(dtype=dtype, engine='numba').assign_coordinates(
+            xyz, chain)
+        ref = pbx.Assigner(dtype=dtype, engine='exact').assign_coordinates(
+            xyz, chain)
+        numpy.testing.assert_array_equal(codes, ref)
+
+    def test_count_matrix(self):
+        """
+        Test that both engines count the blocks
+        """
+        sequences = ['ZZabcdpZZ', 'ZZabbdoZz', 'ZZpbcdpZZ']
+        ref = numpy.zeros((9, len(pbx.PB.NAMES)))
+        for sequence in sequences:
+            for position, block in enumerate(sequence):
+                if block in pbx.PB.NAMES:
+                    ref[position, pbx.PB.NAMES.index(block)] += 1
+        for engine in pbx.analysis.count.COUNT_ENGINES:
+            numpy.testing.assert_array_equal(
+                pbx.analysis.count_matrix(sequences, engine), ref)
+            with pytest.raises(pbx.PB.InvalidBlockError) as error:
+                pbx.analysis.count_matrix(sequences + ['ZZabcdqZZ'], engine)
+            assert error.value.block == 'q'
+
+
 class TestIolib(object):
     """
     Tests for Iolib
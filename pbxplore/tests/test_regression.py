@@ -36,6 +36,21 @@ try:
 except ImportError:
     IS_WEBLOGO = False
 
+try:
+    import msgpack
+    IS_MSGPACK = True
+except ImportError:
+    IS_MSGPACK = False
+
+try:
+    import numba
+    IS_NUMBA = True
+except ImportError:
+    IS_NUMBA = False
+
+NUMBA_ENGINE = pytest.param('numba', marks=pytest.mark.skipif(not IS_NUMBA,
+                                                              reason="numba is not present"))
+
 
 here = os.path.abspath(os.path.dirname(__file__))
 # Resources for the tests are stored in the following directory
@@ -96,10 +111,13 @@ class TestPBAssign(TemplateTestCase):
     Regression tests for PBAssign.py
     """
     references = ["1BTA", "1AY7", "2LFU", "3ICH"]
-    extensions = [".pdb", ".cif.gz"]
+    extensions = [".pdb", ".cif.gz",
+                  pytest.param(".bcif.gz",
+                               marks=pytest.mark.skipif(not IS_MSGPACK,
+                                                        reason="msgpack is not present"))]
 
     def _run_PBassign(self, out_run_dir, pdbid, extension,
-                      multiple=None, indir=REFDIR):
+                      multiple=None, indir=REFDIR, options=()):
         """
         Run a PBxplore program on a PDBID with the given options.
 
@@ -116,7 +134,8 @@ class TestPBAssign(TemplateTestCase):
                 input_args += ['-p', path.join(REFDIR, basename + extension)]
             out_basename = path.join(out_run_dir, multiple)
 
-        run_list = (['PBassign'] + input_args + ['-o', out_basename + extension])
+        run_list = (['PBassign'] + input_args + ['-o', out_basename + extension]
+                    + list(options))
         exe = subprocess.Popen(run_list,
                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         out, err = exe.communicate()
@@ -126,11 +145,12 @@ class TestPBAssign(TemplateTestCase):
         return exe.returncode, out_run_dir
 
     def _test_PBassign_options(self, out_run_dir, basename, extension, outfiles,
-                               multiple=None, expected_exit=0):
+                               multiple=None, expected_exit=0, options=()):
         out_run_dir = str(out_run_dir)
         if multiple is not None:
             out_name = multiple
-        status, out_run_dir = self._run_PBassign(out_run_dir, basename, extension, multiple)
+        status, out_run_dir = self._run_PBassign(out_run_dir, basename, extension,
+                                                 multiple, options=options)
         assert status == expected_exit, \
                'PBassign stoped with a {0} exit code'.format(status)
         assert len(os.listdir(out_run_dir)) == len(outfiles),\
@@ -161,6 +181,162 @@ class TestPBAssign(TemplateTestCase):
         self._test_PBassign_options(tmpdir, self.references, extension,
                                     ['{0}.PB.fasta'], multiple='all')
 
+    @pytest.mark.parametrize('extension', extensions)
+    def test_backbone_selection(self, tmpdir, extension):
+        """
+        Run PBassign reading only the backbone atoms.
+        """
+        self._test_PBassign_options(tmpdir, self.references, extension,
+                                    ['{0}.PB.fasta'], multiple='all',
+                                    options=['--backbone'])
+
+    @pytest.mark.parametrize('extension', extensions)
+    def test_cache(self, tmpdir_factory, extension):
+        """
+        Run PBassign twice with a cache; the second run reads the cache.
+        """
+        cache_dir = str(tmpdir_factory.mktemp('cache'))
+        for run in ('first', 'second'):
+            self._test_PBassign_options(tmpdir_factory.mktemp(run),
+                                        self.references, extension,
+                                        ['{0}.PB.fasta'], multiple='all',
+                                        options=['--cache', cache_dir])
+        assert len(os.listdir(cache_dir)) == len(self.references)
+
+    @pytest.mark.parametrize('extension', extensions)
+    def test_ensemble(self, tmpdir, extension):
+        """
+        Run PBassign with the models of each chain assigned at once.
+        """
+        self._test_PBassign_options(tmpdir, self.references, extension,
+                                    ['{0}.PB.fasta'], multiple='all',
+                                    options=['--ensemble'])
+
+    @pytest.mark.parametrize('extension', extensions)
+    def test_processes(self, tmpdir, extension):
+        """
+        Run PBassign with the models of each file read by several processes.
+        """
+        self._test_PBassign_options(tmpdir, self.references, extension,
+                                    ['{0}.PB.fasta'], multiple='all',
+                                    options=['--processes', '2'])
+
+    @pytest.mark.parametrize('engine', ['exact', 'embedding', NUMBA_ENGINE])
+    @pytest.mark.parametrize('options', ([], ['--ensemble'], ['--processes', '2']))
+    def test_engine(self, tmpdir, engine, options):
+        """
+        Run PBassign with each engine; they all give the same PBs.
+        """
+        self._test_PBassign_options(tmpdir, self.references, '.pdb',
+                                    ['{0}.PB.fasta'], multiple='all',
+                                    options=['--engine', engine] + options)
+
+    @pytest.mark.parametrize('options', ([], ['--confidence']))
+    def test_no_partial_output(self, tmpdir, options):
+        """
+        Run PBassign on a file that cannot be read after a valid one; no
+        output is written and the previous output is kept.
+        """
+        with open(path.join(REFDIR, '1BTA.pdb')) as f_in:
+            content = f_in.read()
+        broken = path.join(str(tmpdir), 'broken.pdb')
+        with open(broken, 'w') as f_out:
+            f_out.write(content.replace("ATOM     10", "ATOM  xxxxx"))
+        out_dir = tmpdir.mkdir('out')
+        out_basename = path.join(str(out_dir), 'out')
+        with open(out_basename + '.PB.fasta', 'w') as f_out:
+            f_out.write('previous\n')
+        run_list = ['PBassign', '-p', path.join(REFDIR, '2LFU.pdb'),
+                    '-p', broken, '-o', out_basename] + options
+        exe = subprocess.Popen(run_list,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        exe.communicate()
+        assert exe.returncode != 0
+        assert os.listdir(str(out_dir)) == ['out.PB.fasta']
+        with open(out_basename + '.PB.fasta') as f_in:
+            assert f_in.read() == 'previous\n'
+
+    @pytest.mark.skipif(not IS_MSGPACK, reason="msgpack is not present")
+    @pytest.mark.parametrize('engine', ['exact', NUMBA_ENGINE])
+    def test_processes_exit(self, tmpdir, engine):
+        """
+        Run PBassign with several processes after a file assigned in the main
+        process; PBassign must exit once the sequences are written.
+        """
+        run_list = ['PBassign',
+                    '-p', path.join(REFDIR, '1BTA.bcif.gz'),
+                    '-p', path.join(REFDIR, '2LFU.pdb'),
+                    '-o', path.join(str(tmpdir), 'out'),
+                    '--processes', '2', '--engine', engine]
+        exe = subprocess.Popen(run_list,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            out, err = exe.communicate(timeout=120)
+        except subprocess.TimeoutExpired:
+            exe.kill()
+            exe.communicate()
+            pytest.fail('PBassign did not exit')
+        assert exe.returncode == 0, err.decode('utf-8')
+        with open(path.join(str(tmpdir), 'out.PB.fasta')) as f_out:
+            assert f_out.read().count('>') == 4
+
+    @pytest.mark.parametrize('options', ([], ['--ensemble']))
+    def test_confidence(self, tmpdir, options):
+        """
+        Run PBassign writing the confidence of the PBs.
+        """
+        reference = '2LFU'
+        extension = '.pdb'
+        status, out_run_dir = self._run_PBassign(str(tmpdir), reference, extension,
+                                                 options=['--confidence'] + options)
+        assert status == 0, 'PBassign stoped with a {0} exit code'.format(status)
+        basename = path.join(out_run_dir, reference + extension)
+        _assert_identical_files(basename + '.PB.fasta',
+                                path.join(REFDIR, reference + extension + '.PB.fasta'))
+        sequences = {}
+        with open(basename + '.PB.fasta') as f_in:
+            for line in f_in:
+                if line.startswith('>'):
+                    comment = line[1:].strip()
+                    sequences[comment] = ''
+                else:
+                    sequences[comment] += line.strip()
+        with open(basename + '.PB.confidence') as f_in:
+            header = next(f_in).split()
+            rows = [line.rstrip('\n').split('\t') for line in f_in]
+        assert header == ['comment', 'resid', 'PB', 'rmsda', 'second', 'margin']
+        for comment, sequence in sequences.items():
+            assert ''.join(row[2] for row in rows if row[0] == comment) == sequence
+        assert len(rows) == sum(len(sequence) for sequence in sequences.values())
+        for row in rows:
+            if row[2] == 'Z':
+                assert row[3:] == ['nan', 'Z', 'nan']
+            else:
+                assert float(row[3]) >= 0 and float(row[5]) >= 0
+
+    @pytest.mark.parametrize('extension', extensions)
+    @pytest.mark.parametrize('file_format', (None, 'given'))
+    def test_standard_streams(self, tmpdir, extension, file_format):
+        """
+        Run PBassign reading the standard input and writing the standard
+        output.
+        """
+        reference = '2LFU'
+        options = []
+        if file_format is not None:
+            options = ['--format', extension.split('.')[1]]
+        with open(path.join(REFDIR, reference + extension), 'rb') as f_in:
+            exe = subprocess.Popen(['PBassign', '-p', '-', '-o', '-'] + options,
+                                   stdin=f_in, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, cwd=str(tmpdir))
+            out, err = exe.communicate()
+        assert exe.returncode == 0, err.decode('utf-8')
+        assert os.listdir(str(tmpdir)) == []
+        with open(path.join(REFDIR, reference + extension + '.PB.fasta')) as f_ref:
+            ref = f_ref.read().replace('test_data/' + reference + extension, 'stdin')
+        assert out.decode('utf-8') == ref
+        assert 'Read 3 chain(s) in stdin' in err.decode('utf-8')
+
     def test_xtc_input(self, tmpdir):
         """
         Run PBassign on a trajectory in the XTC format.
@@ -189,6 +365,43 @@ class TestPBAssign(TemplateTestCase):
         _assert_identical_files(os.path.join(REFDIR, output_fname),
                                 os.path.join(out_run_dir, output_fname))
 
+    def test_trajectory_split(self):
+        """
+        Run PBassign on a trajectory with one PB sequence per chain.
+        """
+        filename = os.path.join(REFDIR, '1AY7.pdb')
+        call_list = ['PBassign', '-x', filename, '-g', filename,
+                     '--split', 'chainID', '-o', '-']
+        exe = subprocess.Popen(call_list, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+        out, err = exe.communicate()
+        assert exe.returncode == 0, err.decode('utf-8')
+        # 1AY7 has only protein atoms: the sequences are the ones of the
+        # chains of the PDB file.
+        with open(os.path.join(REFDIR, '1AY7.pdb.PB.fasta')) as f_ref:
+            reference = [line for line in f_ref if not line.startswith('>')]
+        lines = out.decode('utf-8').splitlines(True)
+        assert [line for line in lines if not line.startswith('>')] == reference
+        assert lines[0].startswith('>{0} | frame 0 | chain A'.format(filename))
+
+    @pytest.mark.parametrize('options', (['--chains', 'A'], ['--models', '1'],
+                                         ['--backbone'], ['--index'],
+                                         ['--min-confidence', '70']))
+    def test_trajectory_selection(self, tmpdir, options):
+        """
+        Run PBassign on a trajectory with the options to select atoms or
+        residues of pdb files; they are rejected.
+        """
+        filename = os.path.join(REFDIR, '1AY7.pdb')
+        call_list = ['PBassign', '-x', filename, '-g', filename,
+                     '-o', os.path.join(str(tmpdir), 'out')] + options
+        exe = subprocess.Popen(call_list, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+        out, err = exe.communicate()
+        assert exe.returncode == 2
+        assert 'cannot be used with option -x' in err.decode('utf-8')
+        assert os.listdir(str(tmpdir)) == []
+
 
     @pytest.mark.xfail(strict=True, raises=AssertionError)
     def test_different_outputs(self, tmpdir):
@@ -205,13 +418,16 @@ class TestPBcount(TemplateTestCase):
     """
     Test running PBcount.
     """
-    def _build_command_line(self, out_run_dir, input_files, output, first_residue=None):
+    def _build_command_line(self, out_run_dir, input_files, output,
+                            first_residue=None, engine=None):
         output_full_path = os.path.join(out_run_dir, output)
         command = ['PBcount', '-o', output_full_path]
         for input_file in input_files:
             command += ['-f', os.path.join(REFDIR, input_file)]
         if first_residue is not None:
             command += ['--first-residue', str(first_residue)]
+        if engine is not None:
+            command += ['--engine', engine]
         return command
 
     def _validate_output(self, out_run_dir, reference, output, **kwargs):
@@ -264,6 +480,20 @@ class TestPBcount(TemplateTestCase):
         self._run_program_and_validate(tmpdir, reference,
                                        input_files=input_files, output=output)
 
+    @pytest.mark.parametrize('engine', ['numpy', NUMBA_ENGINE])
+    def test_engine(self, tmpdir, engine):
+        """
+        Run PBcount with each engine.
+        """
+        input_files = ['count_multi1.PB.fasta',
+                       'count_multi2.PB.fasta',
+                       'count_multi3.PB.fasta']
+        output = 'output'
+        reference = 'count_multi123.PB.count'
+        self._run_program_and_validate(tmpdir, reference,
+                                       input_files=input_files, output=output,
+                                       engine=engine)
+
     def test_first_residue_positive(self, tmpdir):
         """
         Test PBcount on with the --first-residue option and a positive value.
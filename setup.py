@@ -14,7 +14,10 @@ with open(os.path.join(here, 'README.rst')) as f:
 # Extras requirements for optional dependencies
 extras = {
     'analysis': ['weblogo>=3.7'],
-    'all': ['weblogo>=3.7']
+    'compression': ['indexed_gzip'],
+    'binarycif': ['msgpack'],
+    'numba': ['numba'],
+    'all': ['weblogo>=3.7', 'indexed_gzip', 'msgpack', 'numba']
 }
 
 # Version number must be in sync with the one in pbxplore/__init__.py